@@ -4,21 +4,31 @@ from nutsflow.source import (Enumerate, Repeat, Product, Empty, Range, ReadCSV,
                              ReadNamedCSV)
 from nutsflow.processor import (Take, Slice, Concat, Interleave, Zip, ZipWith,
                                 Dedupe, Chunk, Cache, ChunkWhen, ChunkBy, Cycle,
+                                TumblingWindow, SlidingWindow, Batch,
+                                BucketBatch,
                                 Flatten, FlattenCol, FlatMap, Map, Window,
+                                RollingSum, RollingMean, RollingStd,
+                                RollingMin, RollingMax,
                                 Filter, FilterFalse, FilterCol, Partition,
                                 TakeWhile, DropWhile, Permutate, Append, Insert,
-                                Combine, Tee, If, Drop, Pick, GroupBy,
-                                GroupBySorted, Clone, Shuffle,
+                                Combine, Tee, If, Drop, Pick, RunningTopK,
+                                ParallelInterleave,
+                                GroupBy, GroupByAgg, JoinOn, MergeJoin,
+                                GroupBySorted, MergeSorted, Clone, Shuffle,
+                                Balance, ShuffleExternal,
                                 MapCol, MapMulti, MapPar, Prefetch,
                                 PrintProgress, Try)
 from nutsflow.function import (Identity, Square, NOP, Get, GetCols, Counter,
                                Sleep, Format, Print, PrintColType, PrintType)
-from nutsflow.sink import (Sort, Sum, Mean, MeanStd, Max, Min, ArgMax, ArgMin,
-                           Reduce, Nth, Next, Consume, Count, Unzip, Head, Tail,
-                           CountValues, Collect, Join, WriteCSV)
+from nutsflow.sink import (Sort, SortExternal, Sum, Mean, MeanStd, Quantiles,
+                           Max, Min, ArgMax, ArgMin, TopK, BottomK, Sample,
+                           Reduce, Nth, Next, Consume, Count, Unzip, Head,
+                           Tail, CountValues, CountDistinct, TopValues,
+                           Collect, Join, WriteCSV)
 from nutsflow.factory import (nut_processor, nut_sink, nut_function, nut_source,
                               nut_filter, nut_filterfalse)
 from nutsflow.base import Nut, NutFunction, NutSink, NutSource
-from nutsflow.common import Timer, print_type
+from nutsflow.common import Timer, print_type, AUTOTUNE
+from nutsflow.profiler import Profile, Trace
 from nutsflow.config import Config, load_config
 from nutsflow.underscore import _
@@ -42,6 +42,7 @@ def _wrap(wrappercls, func):
     def wrapper(*args, **kwds):
         return wrappercls(*args, **kwds)
 
+    wrappercls.__name__ = func.__name__  # name of nut, e.g. in profiler
     return wrapper
 
 
@@ -4,7 +4,13 @@
               See https://docs.python.org/2/library/itertools.html
 """
 import six
+import time
+import heapq
+import shutil
+import sqlite3
+import tempfile
 
+import os.path as osp
 import itertools as itt
 import threading as t
 import collections as cl
@@ -12,6 +18,9 @@ import collections as cl
 from six.moves import queue as q
 from six import advance_iterator
 from six.moves import map, filter, filterfalse
+from nutsflow.common import AUTOTUNE, sizeof
+from nutsflow.profiler import active_tracer, BufferStats
+from nutsflow.sketch import BloomFilter
 
 
 def length(iterable):
@@ -54,6 +63,184 @@ def interleave(*iterables):
             nexts = itt.cycle(itt.islice(nexts, pending))
 
 
+def _read_source(func, source, queue, stop):
+    """
+    Put tuples (kind, value) for elements of func(source) into queue,
+    where kind is 0 for elements, 1 for the end and 2 for exceptions.
+    Reading ends when stop is set. See parallel_interleave.
+    """
+    try:
+        for e in (source if func is None else func(source)):
+            if not _put(queue, (0, e), stop):
+                return
+    except Exception as ex:
+        _put(queue, (2, ex), stop)
+    _put(queue, (1, None), stop)
+
+
+def _start_reader(func, source, queue, stop):
+    """Start daemon thread that reads source. See parallel_interleave"""
+    reader = t.Thread(target=_read_source,
+                      args=(func, source, queue, stop))
+    reader.daemon = True
+    reader.start()
+    return queue
+
+
+def parallel_interleave(sources, func=None, cycle_length=4, block_length=1,
+                        num_parallel=None, prefetch=8, deterministic=True):
+    """
+    Return generator that interleaves the elements of sources, which are
+    read concurrently by threads.
+
+    Sources are read by one thread each and their elements are prefetched
+    into a bounded queue, which is useful for reading many files where
+    single reads are slow, e.g. on network file systems. In deterministic
+    mode cycle_length sources are interleaved in a round robin fashion,
+    taking block_length elements from each, and exhausted sources are
+    replaced by the next source. Otherwise elements are returned in the
+    order they become available from num_parallel concurrently read
+    sources. Reader threads end when the returned iterator is closed,
+    garbage collected or a source raises an exception.
+
+    >>> list(parallel_interleave([range(3), 'ab', range(5, 7)], None, 2))
+    [0, 'a', 1, 'b', 2, 5, 6]
+
+    :param iterable sources: Iterable over sources, e.g. file paths or
+      iterables.
+    :param function|None func: Function that returns an iterable for a
+      source, e.g. a file reader. If None, sources must be iterables.
+      func is called within the reader thread.
+    :param int cycle_length: Number of sources interleaved at a time.
+    :param int block_length: Number of consecutive elements taken from a
+      source before switching to the next source.
+    :param int|None num_parallel: Number of sources read concurrently.
+      If larger than cycle_length, the next sources are opened and
+      prefetched in advance. None: cycle_length.
+    :param int prefetch: Maximum number of elements prefetched per source.
+      If deterministic is False, sources share a queue of
+      prefetch * num_parallel elements, i.e. a single source may prefetch
+      more elements.
+    :param bool deterministic: True: round robin order. False: elements
+      are returned as soon as they are available (first ready).
+    :return: Iterator over interleaved elements.
+    :rtype: iterator
+    """
+    num_parallel = max(num_parallel or cycle_length, cycle_length)
+    sources, stop = iter(sources), t.Event()
+
+    def start(queue=None):
+        """Start reading next source or return None if there is none"""
+        for source in sources:
+            queue = q.Queue(prefetch) if queue is None else queue
+            return _start_reader(func, source, queue, stop)
+        return None
+
+    try:
+        if not deterministic:
+            queue, running = q.Queue(prefetch * num_parallel), 0
+            while running < num_parallel and start(queue):
+                running += 1
+            while running:
+                kind, value = queue.get()
+                if kind == 0:
+                    yield value
+                elif kind == 2:
+                    raise value
+                elif not start(queue):
+                    running -= 1
+            return
+
+        active, warm = [], cl.deque()
+
+        def fill(queues, n):
+            """Start reading sources until queues contains n readers"""
+            while len(queues) < n:
+                queue = start()
+                if queue is None:
+                    break
+                queues.append(queue)
+
+        fill(active, cycle_length)
+        fill(warm, num_parallel - cycle_length)
+        i = 0
+        while active:
+            queue, ended = active[i], False
+            for _ in range(block_length):
+                kind, value = queue.get()
+                if kind == 2:
+                    raise value
+                if kind == 1:
+                    ended = True
+                    break
+                yield value
+            if ended:
+                queue = warm.popleft() if warm else start()
+                fill(warm, num_parallel - cycle_length)
+                if queue is None:
+                    del active[i]
+                else:
+                    active[i] = queue
+                    i += 1
+            else:
+                i += 1
+            if active:
+                i %= len(active)
+    finally:
+        stop.set()
+
+
+class _Reversed(object):
+    """Wraps a key and reverses its ordering"""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def _decorate(iterable, idx, key, reverse):
+    """Return generator over elements decorated for merging"""
+    wrap = _Reversed if reverse else lambda k: k
+    for e in iterable:
+        yield wrap(key(e)), idx, e
+
+
+def merge_sorted(iterables, key=None, reverse=False):
+    """
+    Merge sorted iterables into a single sorted iterator.
+
+    Similar to heapq.merge() but supports key and reverse parameters also
+    for Python 2. Merge is stable, i.e. elements with equal keys are returned
+    in the order of the iterables.
+
+    >>> list(merge_sorted([[1, 3, 5], [2, 4]]))
+    [1, 2, 3, 4, 5]
+
+    >>> list(merge_sorted([[5, 3], [4, 1]], reverse=True))
+    [5, 4, 3, 1]
+
+    >>> list(merge_sorted([['a3', 'b1'], ['a2']], key=lambda s: s[0]))
+    ['a3', 'a2', 'b1']
+
+    :param list iterables: Iterables sorted according to key and reverse.
+    :param function|None key: Key function. None = identity function.
+    :param bool reverse: True: iterables are sorted in descending order.
+    :return: Iterator over sorted elements
+    :rtype: iterator
+    """
+    key = key if key else lambda x: x
+    decorated = [_decorate(it, i, key, reverse)
+                 for i, it in enumerate(iterables)]
+    return (e for _, _, e in heapq.merge(*decorated))
+
+
 def take(iterable, n):
     """
     Return iterator over last n elements of given iterable.
@@ -92,9 +279,85 @@ def nth(iterable, n, default=None):
     return next(itt.islice(iterable, n, None), default)
 
 
-def unique(iterable, key=None):
+class _DiskSet(object):
+    """
+    Set of keys stored in a temporary sqlite database.
+
+    Keys are compared by their repr().
     """
-    Return only unique elements in iterable. Potentially high mem. consumption!
+
+    def __init__(self, tmpdir=None):
+        """
+        Constructor.
+
+        :param str|None tmpdir: Folder for temporary database.
+        """
+        self.tmpdir = tempfile.mkdtemp(dir=tmpdir)
+        self.db = sqlite3.connect(osp.join(self.tmpdir, 'keys.db'))
+        self.db.execute('PRAGMA journal_mode=OFF')
+        self.db.execute('PRAGMA synchronous=OFF')
+        self.db.execute('CREATE TABLE keys (key TEXT PRIMARY KEY)')
+
+    def add(self, key):
+        """
+        Add key to set.
+
+        :param object key: Key to add
+        :return: True if key was not contained in set before.
+        :rtype: bool
+        """
+        sql = 'INSERT OR IGNORE INTO keys VALUES (?)'
+        return self.db.execute(sql, (repr(key),)).rowcount == 1
+
+    def close(self):
+        """Close and delete database"""
+        self.db.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def _window_set(window):
+    """
+    Return function that adds keys to a set of the last window keys.
+
+    :param int window: Number of most recent keys to keep.
+    :return: Function that returns True if key was not among the
+      last window keys.
+    :rtype: function
+    """
+    recent, counts = cl.deque(), cl.Counter()
+
+    def add(key):
+        isnew = not counts[key]
+        recent.append(key)
+        counts[key] += 1
+        if len(recent) > window:
+            old = recent.popleft()
+            counts[old] -= 1
+            if not counts[old]:
+                del counts[old]
+        return isnew
+
+    return add
+
+
+def unique(iterable, key=None, mode='set', capacity=1000000,
+           error_rate=0.001, window=1000, tmpdir=None):
+    """
+    Return only unique elements in iterable.
+
+    Memory consumption depends on mode:
+      'set': Keys are stored in a set. Exact but potentially high memory
+        consumption!
+      'bloom': Keys are stored in a Bloom filter (see
+        nutsflow.sketch.BloomFilter) that requires about 1.8 bytes per key
+        for error_rate=0.001. Unique elements are dropped (false positives)
+        with probability error_rate, as long as there are no more than
+        capacity unique keys. Keys are compared by their repr().
+      'disk': Keys are stored in a temporary sqlite database on disk.
+        Exact, slower than 'set', but suitable for more unique keys than
+        fit into memory. Keys are compared by their repr().
+      'window': Keys are only compared with the keys of the last window
+        elements. Memory is bounded by window.
 
     >>> list(unique([2,3,1,1,2,4]))
     [2, 3, 1, 4]
@@ -106,17 +369,52 @@ def unique(iterable, key=None):
     >>> list(unique(data, key=lambda t: t[1]))
     [(1, 'a'), (3, 'b')]
 
+    >>> list(unique([1, 2, 1, 2, 3, 1], mode='window', window=1))
+    [1, 2, 1, 2, 3, 1]
+
+    >>> list(unique([1, 1, 2, 1, 3, 3], mode='window', window=1))
+    [1, 2, 1, 3]
+
     :param iterable iterable: Any iterable, e.g. list, range, ...
     :param key: Function used to compare for equality.
+    :param str mode: 'set', 'bloom', 'disk' or 'window'
+    :param int capacity: Expected maximum number of unique keys
+      for mode 'bloom'.
+    :param float error_rate: Probability that a unique element is dropped
+      for mode 'bloom'.
+    :param int window: Number of most recent elements to compare with
+      for mode 'window'.
+    :param str|None tmpdir: Folder for temporary database for mode 'disk'.
+      If None the system default is used.
     :return: Iterator over unique elements.
     :rtype: Iterator
+    :raise: ValueError if mode is invalid.
     """
-    seen = set()
-    for e in iterable:
-        k = key(e) if key else e
-        if k not in seen:
-            seen.add(k)
-            yield e
+    if mode == 'set':
+        seen = set()
+        for e in iterable:
+            k = key(e) if key else e
+            if k not in seen:
+                seen.add(k)
+                yield e
+        return
+    diskset = None
+    if mode == 'bloom':
+        add = BloomFilter(capacity, error_rate).add
+    elif mode == 'disk':
+        diskset = _DiskSet(tmpdir)
+        add = diskset.add
+    elif mode == 'window':
+        add = _window_set(window)
+    else:
+        raise ValueError('Invalid mode: ' + str(mode))
+    try:
+        for e in iterable:
+            if add(key(e) if key else e):
+                yield e
+    finally:
+        if diskset:
+            diskset.close()
 
 
 def chunked(iterable, n):
@@ -146,6 +444,99 @@ def chunked(iterable, n):
         yield itt.chain((first_el,), chunk_it)
 
 
+def _put(queue, item, stop, interval=0.1):
+    """
+    Put item into queue unless stop is set while waiting for a free slot.
+
+    :param Queue queue: Bounded queue.
+    :param object item: Item to put into queue.
+    :param threading.Event stop: Event that stops waiting.
+    :param float interval: Time in seconds between checks of stop.
+    :return: True if item was put into queue, False if stopped.
+    :rtype: bool
+    """
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=interval)
+            return True
+        except q.Full:
+            pass
+    return False
+
+
+def _read_timed(iterable, queue, done, stop):
+    """
+    Put tuples (arrival time, element) into queue and done at the end.
+    Exceptions are passed on as (None, exception). Reading ends when
+    stop is set. See chunked_timeout.
+    """
+    try:
+        for e in iterable:
+            if not _put(queue, (time.time(), e), stop):
+                return
+    except Exception as ex:
+        _put(queue, (None, ex), stop)
+    _put(queue, done, stop)
+
+
+def chunked_timeout(iterable, n, timeout, maxqueue=None):
+    """
+    Split iterable in chunks of size n, but return a partial chunk as soon
+    as its oldest element has been waiting for more than timeout seconds.
+
+    Elements are read by a background thread, which ensures that the
+    timeout triggers even when the iterable is blocked. The thread ends
+    when the returned iterator is closed or garbage collected, but only
+    after the element it is currently reading has arrived.
+
+    >>> list(chunked_timeout(range(7), 3, 1.0))
+    [[0, 1, 2], [3, 4, 5], [6]]
+
+    :param iterable iterable: Any iterable, e.g. list, range, ...
+    :param int n: Chunk size
+    :param float timeout: Maximum time in seconds between the arrival of
+      the first element of a chunk and the return of the chunk.
+    :param int|None maxqueue: Maximum number of elements read ahead by the
+      background thread. None: n
+    :return: Chunked iterable
+    :rtype: Iterator over lists
+    """
+    queue, done, stop = q.Queue(maxqueue or n), (None, None), t.Event()
+    reader = t.Thread(target=_read_timed,
+                      args=(iterable, queue, done, stop))
+    reader.daemon = True
+    reader.start()
+
+    def get(timeout=None):
+        item = queue.get(timeout=timeout)
+        if item is not done and item[0] is None:
+            raise item[1]
+        return item
+
+    try:
+        while True:
+            item = get()
+            if item is done:
+                return
+            arrival, e = item
+            chunk, deadline = [e], arrival + timeout
+            while len(chunk) < n:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = get(remaining)
+                except q.Empty:
+                    break
+                if item is done:
+                    yield chunk
+                    return
+                chunk.append(item[1])
+            yield chunk
+    finally:
+        stop.set()
+
+
 def consume(iterable, n=None):
     """
     Consume n elements of the iterable.
@@ -220,6 +611,67 @@ def partition(iterable, pred):
     return filter(pred, t1), filterfalse(pred, t2)
 
 
+def tee(iterable, n=2, max_bytes=None, sizer=None):
+    """
+    Return n independent iterators from a single iterable.
+
+    Same as itertools.tee but memory of elements buffered for iterators
+    that lag behind can be limited. Since all iterators are consumed
+    in the same thread backpressure is not possible and a BufferError
+    is raised if the buffered elements exceed max_bytes.
+
+    >>> it1, it2 = tee([1, 2, 3], 2, max_bytes=1000)
+    >>> list(it1), list(it2)
+    ([1, 2, 3], [1, 2, 3])
+
+    >>> it1, it2 = tee(range(100), 2, max_bytes=10, sizer=lambda e: 1)
+    >>> list(it1)
+    Traceback (most recent call last):
+    ...
+    BufferError: Buffered elements exceed max_bytes: 11 > 10
+
+    :param iterable iterable: Any iterable, e.g. list, range, ...
+    :param int n: Number of iterators to return.
+    :param int|None max_bytes: Maximum memory of buffered elements in bytes.
+      If None memory is not limited and itertools.tee is used.
+    :param function|None sizer: Function that returns the size of an
+       element in bytes. If None nutsflow.common.sizeof is used.
+    :return: n iterators
+    :rtype: tuple of iterators
+    """
+    if max_bytes is None:
+        return itt.tee(iterable, n)
+    it = iter(iterable)
+    buffers = [cl.deque() for _ in range(n)]
+    nbytes = [0]
+
+    def gen(buffer):
+        while True:
+            if not buffer:
+                try:
+                    e = next(it)
+                except StopIteration:
+                    return
+                entry = [e, sizeof(e, sizer), n - 1]  # element, size, refs
+                if entry[2]:
+                    nbytes[0] += entry[1]
+                    if nbytes[0] > max_bytes:
+                        msg = 'Buffered elements exceed max_bytes: {} > {}'
+                        raise BufferError(msg.format(nbytes[0], max_bytes))
+                for b in buffers:
+                    if b is not buffer:
+                        b.append(entry)
+                yield e
+            else:
+                entry = buffer.popleft()
+                entry[2] -= 1
+                if not entry[2]:
+                    nbytes[0] -= entry[1]
+                yield entry[0]
+
+    return tuple(gen(b) for b in buffers)
+
+
 class PrefetchIterator(t.Thread, six.Iterator):
     """
     Wrap an iterable in an iterator that prefetches elements.
@@ -228,6 +680,24 @@ class PrefetchIterator(t.Thread, six.Iterator):
     the batch. Keeps the CPU busy pre-processing data and not waiting for the
     GPU to finish the batch.
 
+    Queue depth and wait times are recorded in iterator.stats, see
+    nutsflow.profiler.BufferStats. If a tracer is active
+    (see nutsflow.profiler.Trace) when the iterator is created, spans for
+    fetching elements from the iterable and for waiting on the queue are
+    recorded as well.
+
+    For num_prefetch=AUTOTUNE the number of prefetched elements starts at
+    one and is doubled (up to max_prefetch) whenever the consumer had to
+    wait for elements although the producer was blocked by a full queue
+    during the last interval, which indicates bursty production that a
+    larger buffer can smooth out. The current value is available in
+    iterator.num_prefetch.
+
+    If max_bytes is provided, the producer is blocked while the prefetched
+    elements occupy more than max_bytes of memory (at least one element
+    is always prefetched). Element sizes are estimated by
+    nutsflow.common.sizeof or the provided sizer function.
+
     >>> from __future__ import print_function
     >>> for i in PrefetchIterator(range(4)):
     ...    print(i)
@@ -237,27 +707,80 @@ class PrefetchIterator(t.Thread, six.Iterator):
     3
     """
 
-    def __init__(self, iterable, num_prefetch=1):
+    def __init__(self, iterable, num_prefetch=1, max_prefetch=64,
+                 max_bytes=None, sizer=None):
         """
         Constructor.
 
         :param iterable iterable: Iterable elements are fetched from.
-        :param int num_prefetch: Number of elements to pre-fetch.
+        :param int num_prefetch: Number of elements to pre-fetch or AUTOTUNE.
+        :param int max_prefetch: Maximum number of elements to pre-fetch
+           if num_prefetch is AUTOTUNE.
+        :param int|None max_bytes: Maximum memory of prefetched elements in
+           bytes. None means no limit.
+        :param function|None sizer: Function that returns the size of an
+           element in bytes. If None nutsflow.common.sizeof is used.
         """
         t.Thread.__init__(self)
-        self.queue = q.Queue(num_prefetch)
+        self.autotune = num_prefetch is AUTOTUNE
+        self.num_prefetch = 1 if self.autotune else num_prefetch
+        self.max_prefetch = max_prefetch
+        self.queue = q.Queue(self.num_prefetch)
         self.iterable = iterable
         self.daemon = True
         self.lock = t.Lock()
+        self.tracer = active_tracer()
+        self.stats = BufferStats('Prefetch', self.num_prefetch)
+        self._tuned = (0, 0.0, 0.0)  # n_get, waits at last tuning step
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self.nbytes = 0  # memory occupied by prefetched elements
+        self._sizes = cl.deque()  # sizes of prefetched elements
+        self._bytes_freed = t.Condition()
         self.start()
 
+    def _reserve(self, item):
+        """
+        Wait until memory budget allows to prefetch item and reserve memory.
+
+        :param object item: Element to prefetch.
+        """
+        size = sizeof(item, self.sizer)
+        with self._bytes_freed:
+            while self.nbytes and self.nbytes + size > self.max_bytes:
+                self._bytes_freed.wait()
+            self.nbytes += size
+            self._sizes.append(size)
+
+    def _release(self):
+        """
+        Release memory of element taken out of the queue.
+        """
+        with self._bytes_freed:
+            self.nbytes -= self._sizes.popleft()
+            self._bytes_freed.notify()
+
     def run(self):
         """
         Put elements in input iterable into queue.
         """
-        for item in self.iterable:
+        tracer, stats, it = self.tracer, self.stats, iter(self.iterable)
+        while True:
+            start = time.time()
+            item = next(it, None)
+            fetched = time.time()
+            if self.max_bytes is not None and item is not None:
+                self._reserve(item)
             self.queue.put(item)
-        self.queue.put(None)
+            end = time.time()
+            qsize = self.queue.qsize()
+            if tracer:
+                tracer.span('Prefetch.fetch', start, fetched, cat='queue')
+                tracer.span('Prefetch.put', fetched, end, cat='queue',
+                            qsize=qsize)
+            if item is None:
+                break
+            stats.put(qsize, end - fetched)
 
     def __next__(self):
         """
@@ -267,11 +790,43 @@ class PrefetchIterator(t.Thread, six.Iterator):
         :rtype: same as element type of input iterable.
         """
         with self.lock:
+            start = time.time()
             next_item = self.queue.get()
+            end = time.time()
+            qsize = self.queue.qsize()
+            if self.tracer:
+                self.tracer.span('Prefetch.get', start, end, cat='queue',
+                                 qsize=qsize)
             if next_item is None:
                 raise StopIteration
+            self.stats.get(qsize + 1, end - start)
+            if self.max_bytes is not None:
+                self._release()
+            if self.autotune:
+                self._tune()
             return next_item
 
+    def _tune(self, mintime=1e-3):
+        """
+        Double queue size if consumer waited and producer was blocked
+        during the last interval.
+
+        :param float mintime: Minimum wait time in seconds to be considered.
+        """
+        stats = self.stats
+        n_get, consumer_wait, producer_blocked = self._tuned
+        if stats.n_get - n_get < 4 * self.num_prefetch + 4:
+            return
+        self._tuned = stats.n_get, stats.consumer_wait, stats.producer_blocked
+        waited = stats.consumer_wait - consumer_wait > mintime
+        blocked = stats.producer_blocked - producer_blocked > mintime
+        if waited and blocked and self.num_prefetch < self.max_prefetch:
+            self.num_prefetch = min(2 * self.num_prefetch, self.max_prefetch)
+            stats.capacity = self.num_prefetch
+            with self.queue.mutex:
+                self.queue.maxsize = self.num_prefetch
+                self.queue.not_full.notify_all()
+
     def __iter__(self):
         """
         Return pre-fetch iterator
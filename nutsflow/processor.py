@@ -10,6 +10,10 @@ import os
 import time
 import six
 import sys
+import functools
+import heapq
+import math
+import bisect
 
 import os.path as osp
 import itertools as itt
@@ -22,9 +26,13 @@ from six.moves import cPickle as pickle
 from six.moves import map, filter, filterfalse, zip, range
 from nutsflow import iterfunction as itf
 from nutsflow.base import Nut, NutFunction
-from nutsflow.common import as_tuple, as_list, as_set, console, timestr, is_iterable
+from nutsflow.common import (as_tuple, as_list, as_set, console, timestr,
+                             is_iterable, sizeof, colfunc, default_rand,
+                             uniforms, randindices, AUTOTUNE)
 from nutsflow.factory import nut_processor
 from nutsflow.function import Identity
+from nutsflow.profiler import active_tracer, BufferStats
+from nutsflow.sketch import stable_hash
 from nutsflow.sink import Consume, Collect, Sort
 
 
@@ -77,10 +85,47 @@ def Slice(iterable, start=None, *args, **kwargs):
     return itt.islice(iterable, start, *args, **kwargs)
 
 
+def _window_arrays(iterable, n, stride, blocksize):
+    """
+    Return generator over numpy sliding window views. See Window()
+
+    :param iterable iterable: Any iterable over numbers or arrays.
+    :param int n: Size of window
+    :param int stride: Step size between windows.
+    :param int blocksize: Number of elements converted to array at once.
+    :return: Generator over arrays of shape (n, ...)
+    :rtype: generator
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    it = iter(iterable)
+    buf, skip = None, 0
+    while True:
+        block = list(itt.islice(it, blocksize))
+        if not block:
+            return
+        if skip >= len(block):
+            skip -= len(block)
+            continue
+        block, skip = np.asarray(block[skip:]), 0
+        buf = block if buf is None else np.concatenate((buf, block))
+        m = (len(buf) - n) // stride + 1 if len(buf) >= n else 0
+        if not m:
+            continue
+        views = sliding_window_view(buf, n, axis=0)[:m * stride:stride]
+        for view in np.moveaxis(views, -1, 1):
+            yield view
+        start = m * stride
+        if start >= len(buf):
+            buf, skip = None, start - len(buf)
+        else:
+            buf = buf[start:]
+
+
 @nut_processor
-def Window(iterable, n=2):
+def Window(iterable, n=2, stride=1, array=False):
     """
-    iterable >> Window(n)
+    iterable >> Window(n, stride=1, array=False)
 
     Sliding window of size n over elements in iterable.
 
@@ -93,19 +138,226 @@ def Window(iterable, n=2):
     >>> 'test' >> Window(2) >> Map(''.join) >> Collect()
     ['te', 'es', 'st']
 
+    >>> [1, 2, 3, 4, 5, 6] >> Window(3, stride=2) >> Collect()
+    [(1, 2, 3), (3, 4, 5)]
+
+    With array=True windows are numpy arrays, which are read-only views
+    on blocks of the input and therefore cheap to create even for large
+    windows. Incomplete windows are not returned in this mode.
+    For aggregations over large windows see RollingSum, RollingMean, ...
+
+    >>> [1, 2, 3, 4] >> Window(3, array=True) >> Map(list) >> Collect()
+    [[1, 2, 3], [2, 3, 4]]
+
     :param iterable iterable: Any iterable
     :param int n: Size of window
-    :return: iterator with tuples of length n
+    :param int stride: Step size, i.e. number of elements between the
+      starts of consecutive windows.
+    :param bool array: If True numpy sliding window views of shape
+      (n, ...) are returned instead of tuples. Requires numpy.
+    :return: iterator with tuples (or arrays) of length n
     :rtype: iterator over tuples
     """
+    if stride < 1:
+        raise ValueError('stride must be positive: ' + str(stride))
+    if array:
+        for view in _window_arrays(iterable, n, stride, max(1024, 4 * n)):
+            yield view
+        return
     it = iter(iterable)
     win = cl.deque(it >> Take(n), n)
     yield tuple(win)
-    for e in it:
-        win.append(e)
+    if stride == 1:
+        for e in it:
+            win.append(e)
+            yield tuple(win)
+        return
+    k = min(stride, n)
+    while True:
+        next(itt.islice(it, stride - k, stride - k), None)  # skip elements
+        es = list(itt.islice(it, k))
+        if len(es) < k:
+            return
+        win.extend(es)
         yield tuple(win)
 
 
+def _rolling_moments(iterable, n, key):
+    """
+    Return generator over sum, mean and sum of squared deviations of
+    values within sliding windows of size n. Updates are O(1) and values
+    are recomputed every n steps to prevent accumulation of rounding
+    errors. See RollingSum, RollingMean, RollingStd
+
+    :param iterable iterable: Any iterable over numbers.
+    :param int n: Size of window
+    :param int|tuple|function|None key: Key function to extract values.
+    :return: Generator over tuples (sum, mean, m2) for complete windows.
+    :rtype: generator
+    """
+    if n < 1:
+        raise ValueError('Window size must be positive: ' + str(n))
+    f = colfunc(key)
+    win = cl.deque()
+    total, mean, m2 = 0, 0.0, 0.0
+    for i, x in enumerate(map(f, iterable)):
+        win.append(x)
+        if len(win) <= n:
+            total += x
+            delta = x - mean
+            mean += delta / len(win)
+            m2 += delta * (x - mean)
+        else:
+            old = win.popleft()
+            total += x - old
+            if i % n:
+                newmean = mean + (x - old) / n
+                m2 += (x - old) * (x - newmean + old - mean)
+                mean = newmean
+            else:
+                total = sum(win)
+                mean = total / n
+                m2 = sum((v - mean) ** 2 for v in win)
+        if len(win) == n:
+            yield total, mean, max(m2, 0.0)
+
+
+def _rolling_extremum(iterable, n, key, better):
+    """
+    Return generator over minimum or maximum of values within sliding
+    windows of size n, using a monotonic queue. See RollingMin, RollingMax
+
+    :param iterable iterable: Any iterable over numbers.
+    :param int n: Size of window
+    :param int|tuple|function|None key: Key function to extract values.
+    :param function better: better(a, b) is True if a replaces b as
+      extremum, e.g. operator.le for minimum.
+    :return: Generator over extrema of complete windows.
+    :rtype: generator
+    """
+    if n < 1:
+        raise ValueError('Window size must be positive: ' + str(n))
+    f = colfunc(key)
+    queue = cl.deque()
+    for i, x in enumerate(map(f, iterable)):
+        while queue and better(x, queue[-1][1]):
+            queue.pop()
+        queue.append((i, x))
+        if queue[0][0] <= i - n:
+            queue.popleft()
+        if i >= n - 1:
+            yield queue[0][1]
+
+
+@nut_processor
+def RollingSum(iterable, n, key=None):
+    """
+    iterable >> RollingSum(n, key=None)
+
+    Sum over sliding windows of size n. Returns the same result as
+    Window(n) >> Map(sum) for complete windows but requires only O(1)
+    time per element.
+
+    >>> [1, 2, 3, 4, 5] >> RollingSum(3) >> Collect()
+    [6, 9, 12]
+
+    >>> data = [(1, 'a'), (2, 'b'), (3, 'c')]
+    >>> data >> RollingSum(2, key=0) >> Collect()
+    [3, 5]
+
+    :param iterable iterable: Any iterable over numbers.
+    :param int n: Size of window
+    :param int|tuple|function|None key: Key function to extract values.
+    :return: Iterator over sums
+    :rtype: iterator
+    """
+    return (t for t, _, _ in _rolling_moments(iterable, n, key))
+
+
+@nut_processor
+def RollingMean(iterable, n, key=None):
+    """
+    iterable >> RollingMean(n, key=None)
+
+    Mean over sliding windows of size n in O(1) time per element.
+
+    >>> [1, 2, 3, 4, 5] >> RollingMean(3) >> Collect()
+    [2.0, 3.0, 4.0]
+
+    :param iterable iterable: Any iterable over numbers.
+    :param int n: Size of window
+    :param int|tuple|function|None key: Key function to extract values.
+    :return: Iterator over means
+    :rtype: iterator
+    """
+    return (m for _, m, _ in _rolling_moments(iterable, n, key))
+
+
+@nut_processor
+def RollingStd(iterable, n, key=None, ddof=1):
+    """
+    iterable >> RollingStd(n, key=None, ddof=1)
+
+    Standard deviation over sliding windows of size n in O(1) time per
+    element (Welford's algorithm).
+
+    >>> stds = [1, 2, 3, 5, 7] >> RollingStd(3) >> Collect()
+    >>> [round(s, 3) for s in stds]
+    [1.0, 1.528, 2.0]
+
+    :param iterable iterable: Any iterable over numbers.
+    :param int n: Size of window
+    :param int|tuple|function|None key: Key function to extract values.
+    :param int ddof: Delta degrees of freedom (should 0 or 1)
+    :return: Iterator over standard deviations
+    :rtype: iterator
+    """
+    if n <= ddof:
+        raise ValueError('Window size must be larger than ddof: ' + str(n))
+    return (math.sqrt(m2 / (n - ddof))
+            for _, _, m2 in _rolling_moments(iterable, n, key))
+
+
+@nut_processor
+def RollingMin(iterable, n, key=None):
+    """
+    iterable >> RollingMin(n, key=None)
+
+    Minimum over sliding windows of size n in amortized O(1) time per
+    element.
+
+    >>> [3, 1, 4, 1, 5, 9, 2] >> RollingMin(3) >> Collect()
+    [1, 1, 1, 1, 2]
+
+    :param iterable iterable: Any iterable over numbers.
+    :param int n: Size of window
+    :param int|tuple|function|None key: Key function to extract values.
+    :return: Iterator over minima
+    :rtype: iterator
+    """
+    return _rolling_extremum(iterable, n, key, lambda a, b: a <= b)
+
+
+@nut_processor
+def RollingMax(iterable, n, key=None):
+    """
+    iterable >> RollingMax(n, key=None)
+
+    Maximum over sliding windows of size n in amortized O(1) time per
+    element.
+
+    >>> [3, 1, 4, 1, 5, 9, 2] >> RollingMax(3) >> Collect()
+    [4, 4, 5, 9, 9]
+
+    :param iterable iterable: Any iterable over numbers.
+    :param int n: Size of window
+    :param int|tuple|function|None key: Key function to extract values.
+    :return: Iterator over maxima
+    :rtype: iterator
+    """
+    return _rolling_extremum(iterable, n, key, lambda a, b: a >= b)
+
+
 @nut_processor
 def Concat(iterable, *iterables):
     """
@@ -153,6 +405,118 @@ def Interleave(iterable, *iterables):
     return itf.interleave(iterable, *iterables)
 
 
+@nut_processor
+def ParallelInterleave(iterable, func=None, cycle_length=4, block_length=1,
+                       num_parallel=None, prefetch=8, deterministic=True):
+    """
+    iterable >> ParallelInterleave(func=None, cycle_length=4, block_length=1,
+                                   num_parallel=None, prefetch=8,
+                                   deterministic=True)
+
+    Interleave the elements of many sources, e.g. shard files, that are
+    read concurrently. Each source is read in its own thread and up to
+    prefetch elements are buffered per source, so that a slow source
+    does not stall the others. Since reading is performed by threads
+    this is intended for I/O bound sources.
+
+    In deterministic mode cycle_length sources are interleaved round
+    robin, block_length elements at a time, and an exhausted source is
+    replaced by the next source. If num_parallel > cycle_length, upcoming
+    sources are opened and prefetched in advance. Otherwise elements
+    of num_parallel concurrently read sources are returned in the order
+    they become available (first ready), which maximizes throughput.
+    see also Interleave(), Prefetch()
+
+    >>> from nutsflow import Collect
+    >>> sources = [[1, 2, 3], [4, 5], [6, 7]]
+    >>> sources >> ParallelInterleave(cycle_length=2) >> Collect()
+    [1, 4, 2, 5, 3, 6, 7]
+
+    >>> interleave = ParallelInterleave(cycle_length=2, block_length=2)
+    >>> sources >> interleave >> Collect()
+    [1, 2, 4, 5, 3, 6, 7]
+
+    >>> interleave = ParallelInterleave(deterministic=False)
+    >>> sorted(sources >> interleave >> Collect())
+    [1, 2, 3, 4, 5, 6, 7]
+
+    Typically sources are file paths and func is a reader, e.g.
+
+    filepaths >> ParallelInterleave(ReadCSV, 16) >> Consume()
+
+    :param iterable iterable: Iterable over sources, e.g. file paths or
+      iterables.
+    :param function|None func: Function that returns an iterable for a
+      source, e.g. a file reader. If None, sources must be iterables.
+      func is called within the reader thread.
+    :param int cycle_length: Number of sources interleaved at a time.
+    :param int block_length: Number of consecutive elements taken from a
+      source before switching to the next source. Ignored if
+      deterministic=False.
+    :param int|None num_parallel: Number of sources read concurrently.
+      None means cycle_length. Values smaller than cycle_length are
+      increased to cycle_length.
+    :param int prefetch: Maximum number of elements prefetched per source.
+    :param bool deterministic: True: elements are returned in round robin
+      order. False: elements are returned as soon as they are available.
+    :return: Iterator over interleaved elements.
+    :rtype: iterator
+    """
+    return itf.parallel_interleave(iterable, func, cycle_length,
+                                   block_length, num_parallel, prefetch,
+                                   deterministic)
+
+
+@nut_processor
+def MergeSorted(iterable, *iterables, **kwargs):
+    """
+    iterable >> MergeSorted(*iterables, key=None, reverse=False,
+                            dedupe=False)
+
+    Merge sorted iterables into a single sorted iterator, e.g. the sorted
+    outputs of workers or log files sorted by time stamp. Time complexity
+    is O(n log k) for k iterables and only one element per iterable is
+    in memory. Merge is stable, i.e. elements with equal keys are returned
+    in the order of the iterables. Equivalent to but much faster than
+    iterable >> Concat(*iterables) >> Sort()
+
+    >>> [1, 3, 5] >> MergeSorted([2, 4], [0]) >> Collect()
+    [0, 1, 2, 3, 4, 5]
+
+    >>> [5, 3] >> MergeSorted([4, 1], reverse=True) >> Collect()
+    [5, 4, 3, 1]
+
+    >>> [(1, 'a'), (3, 'b')] >> MergeSorted([(2, 'c')], key=0) >> Collect()
+    [(1, 'a'), (2, 'c'), (3, 'b')]
+
+    >>> [1, 2, 3] >> MergeSorted([2, 3, 4], dedupe=True) >> Collect()
+    [1, 2, 3, 4]
+
+    :param iterable iterable: Any iterable sorted according to key and
+        reverse.
+    :param iterable iterables: Iterables sorted according to key and reverse.
+    :param kwargs kwargs: Keyword arguments
+        key: int|tuple|function|None: Column index(es) or key function
+        (see common.colfunc). None = identity function.
+        reverse: bool: True: iterables are sorted in descending order.
+        dedupe: bool: True: only the first of elements with equal keys
+        is returned.
+    :return: Iterator over sorted elements
+    :rtype: iterator
+    :raise: TypeError if kwargs contains unknown keyword arguments.
+    """
+    key = colfunc(kwargs.pop('key', None))
+    reverse = kwargs.pop('reverse', False)
+    dedupe = kwargs.pop('dedupe', False)
+    if kwargs:
+        raise TypeError('Unexpected keyword arguments: ' +
+                        ', '.join(sorted(kwargs)))
+    merged = itf.merge_sorted((iterable,) + iterables, key, reverse)
+    if not dedupe:
+        return merged
+    return (next(group) for _, group in itt.groupby(merged, key))
+
+
 @nut_processor
 def Zip(iterable, iterable2=None, *iterables):
     """
@@ -269,10 +633,14 @@ def Insert(iterable, index, items):
 
 Dedupe = nut_processor(itf.unique)
 """
-iterable >> Dedupe([key])
+iterable >> Dedupe([key], mode='set', capacity=1000000, error_rate=0.001,
+                   window=1000, tmpdir=None)
 
 Return only unique elements in iterable. Can have very high memory consumption
-if iterable is long and many elements are unique!
+if iterable is long and many elements are unique! Use mode 'bloom'
+(approximate), 'disk' (exact) or 'window' (dedupe within last elements only)
+to bound memory.
+See iterfunction.unique() for details.
 
 >>> [2,3,1,1,2,4] >> Dedupe() >> Collect()
 [2, 3, 1, 4]
@@ -284,21 +652,39 @@ if iterable is long and many elements are unique!
 >>> data >> Dedupe(_[1]) >> Collect()
 [(1, 'a'), (3, 'b')]
 
+>>> [2,3,1,1,2,4] >> Dedupe(mode='bloom', capacity=100) >> Collect()
+[2, 3, 1, 4]
+
+>>> [1,1,2,1,3,3] >> Dedupe(mode='window', window=1) >> Collect()
+[1, 2, 1, 3]
+
 :param iterable iterable: Any iterable, e.g. list, range, ...
 :param key: Function used to compare for equality.
+:param str mode: 'set': exact, all keys in memory.
+  'bloom': approximate, Bloom filter in memory. Unique elements are dropped
+  with probability error_rate as long as there are no more than capacity
+  unique keys.
+  'disk': exact, keys are stored in temporary database on disk.
+  'window': exact within the last window elements.
+:param int capacity: Expected maximum number of unique keys for mode 'bloom'.
+:param float error_rate: Probability of dropping unique elements
+  for mode 'bloom'.
+:param int window: Number of most recent elements to compare with
+  for mode 'window'.
+:param str|None tmpdir: Folder for temporary database for mode 'disk'.
 :return: Iterator over unique elements.
 :rtype: Iterator
 """
 
 
 @nut_processor
-def Chunk(iterable, n, container=None):
+def Chunk(iterable, n, container=None, timeout=None):
     """
-    iterable >> Chunk(n, container=None)
+    iterable >> Chunk(n, container=None, timeout=None)
 
     Split iterable in chunks of size n, where each chunk is also an iterator
     if no container is provided.
-    see also GroupBySorted(), ChunkWhen(), ChunkBy()
+    see also GroupBySorted(), ChunkWhen(), ChunkBy(), Batch()
 
     >>> from nutsflow import Range, Map, Print, Join, Consume, Collect
     >>> Range(5) >> Chunk(2) >> Map(list) >> Print() >> Consume()
@@ -320,14 +706,31 @@ def Chunk(iterable, n, container=None):
     >>> Range(6) >> Chunk(3, sum) >> Collect()
     [3, 12]
 
+    If a timeout (in seconds) is given, a partial chunk is returned as
+    soon as its first element has been waiting for longer than timeout,
+    e.g. to bound the latency of micro-batches for online processing
+    where elements arrive irregularly. Elements are then read by a
+    background thread, so that the timeout triggers even when the
+    iterable is blocked. Larger n increases throughput and smaller
+    timeout reduces latency.
+
+    >>> Range(5) >> Chunk(2, list, timeout=0.1) >> Collect()
+    [[0, 1], [2, 3], [4]]
+
     :param iterable iterable: Any iterable, e.g. list, range, ...
     :param int n: Chunk size
     :param container container: Some container, e.g. list, set, dict
            that can be filled from an iterable
+    :param float|None timeout: None or maximum time in seconds between
+           arrival of the first element of a chunk and its return.
     :return: Chunked iterable
     :rtype: Iterator over iterators or containers
     """
-    chunks = itf.chunked(iterable, n)
+    if timeout is None:
+        chunks = itf.chunked(iterable, n)
+    else:
+        chunks = itf.chunked_timeout(iterable, n, timeout)
+        chunks = chunks if container else map(iter, chunks)
     return map(container, chunks) if container else chunks
 
 
@@ -357,16 +760,9 @@ class ChunkWhen(Nut):
         :param container container: Some container, e.g. list, set, dict
            that can be filled from an iterable
         """
-        self.cnt = 0
         self.func = func
         self.container = container
 
-    def _key(self, x):
-        """ Return keys (= counter) for groups (=chunks)"""
-        if self.func(x):
-            self.cnt += 1
-        return self.cnt
-
     def __rrshift__(self, iterable):
         """
         :param any iterable iterable: iterable to create chunks for.
@@ -374,7 +770,15 @@ class ChunkWhen(Nut):
                  if no container is provided
         :rtype: iterator over iterators or containers
         """
-        return iterable >> ChunkBy(self._key, self.container)
+        cnt = [0]  # counter is local to allow reuse of nut
+
+        def key(x):
+            """ Return keys (= counter) for groups (=chunks)"""
+            if self.func(x):
+                cnt[0] += 1
+            return cnt[0]
+
+        return iterable >> ChunkBy(key, self.container)
 
 
 @nut_processor
@@ -403,6 +807,400 @@ def ChunkBy(iterable, func, container=None):
     return map(container, chunks) if container else chunks
 
 
+def _time_windows(iterable, size, slide, timecol, aggregations, lateness,
+                  ddof):
+    """
+    Return generator over event-time windows. See TumblingWindow and
+    SlidingWindow.
+
+    Windows start at multiples of slide and cover the half-open time
+    interval [start, start + size[. The watermark is the largest timestamp
+    seen minus the allowed lateness. Windows that end before the
+    watermark are emitted and events for closed windows are dropped.
+
+    :return: Generator over tuples (start, result)
+    :rtype: generator
+    """
+    if size <= 0 or slide <= 0:
+        raise ValueError('Window size and slide must be positive')
+    if lateness < 0:
+        raise ValueError('Lateness must not be negative: ' + str(lateness))
+    timef = colfunc(timecol)
+    multiple = isinstance(aggregations, list)
+    aggs = None
+    if aggregations is not None:
+        aggs = aggregations if multiple else [aggregations]
+        aggs = [_aggregation(a, ddof) for a in aggs]
+
+    def result(state):
+        if aggs is None:
+            return state
+        results = [agg[4](s) for agg, s in zip(aggs, state)]
+        return tuple(results) if multiple else results[0]
+
+    states, starts, watermark = dict(), [], None
+    for e in iterable:
+        t = timef(e)
+        if watermark is None or t - lateness > watermark:
+            watermark = t - lateness
+        first = int(math.floor((t - size) / slide)) + 1
+        closed = int(math.floor((watermark - size) / slide)) + 1
+        for k in range(max(first, closed), int(math.floor(t / slide)) + 1):
+            state = states.get(k)
+            if state is None:
+                heapq.heappush(starts, k)
+                states[k] = ([e] if aggs is None else
+                             [init(get(e)) for _, get, init, _, _ in aggs])
+            elif aggs is None:
+                state.append(e)
+            else:
+                for i, (_, get, _, update, _) in enumerate(aggs):
+                    state[i] = update(state[i], get(e))
+        while starts and starts[0] * slide + size <= watermark:
+            k = heapq.heappop(starts)
+            yield k * slide, result(states.pop(k))
+    while starts:
+        k = heapq.heappop(starts)
+        yield k * slide, result(states.pop(k))
+
+
+@nut_processor
+def TumblingWindow(iterable, size, timecol=0, aggregations=None,
+                   lateness=0, ddof=1):
+    """
+    iterable >> TumblingWindow(size, timecol=0, aggregations=None,
+                               lateness=0, ddof=1)
+
+    Group timestamped elements into non-overlapping time windows of the
+    given size, e.g. in seconds. Windows cover the time intervals
+    [k*size, (k+1)*size[ and are returned as tuples (start, result) in
+    order of start time as soon as they are complete, i.e. once an element
+    with a timestamp larger than the window end plus the allowed lateness
+    arrives. Elements arriving after their window was returned are
+    dropped. Windows without elements are not returned.
+    see also SlidingWindow(), ChunkWhen(), GroupByAgg()
+
+    >>> data = [(0, 'a'), (1, 'b'), (5, 'c'), (11, 'd')]
+    >>> data >> TumblingWindow(5) >> Collect()
+    [(0, [(0, 'a'), (1, 'b')]), (5, [(5, 'c')]), (10, [(11, 'd')])]
+
+    Instead of collecting the elements of a window they can be
+    aggregated incrementally (see GroupByAgg() for aggregations), which
+    keeps memory consumption independent of the number of elements.
+
+    >>> data = [(0, 2.0), (3, 1.0), (2, 3.0), (5, 4.0), (9, 6.0)]
+    >>> aggregations = ['count', ('max', 1)]
+    >>> data >> TumblingWindow(5, aggregations=aggregations) >> Collect()
+    [(0, (3, 3.0)), (5, (2, 6.0))]
+
+    Out-of-order elements are assigned to their window if they arrive
+    within the allowed lateness.
+
+    >>> data = [(1, 'a'), (6, 'b'), (4, 'c')]
+    >>> data >> TumblingWindow(5, aggregations='count') >> Collect()
+    [(0, 1), (5, 1)]
+    >>> data >> TumblingWindow(5, 0, 'count', lateness=2) >> Collect()
+    [(0, 2), (5, 1)]
+
+    :param iterable iterable: Any iterable over timestamped elements.
+    :param float size: Size of windows in units of the timestamps.
+    :param int|function timecol: Column index or function that returns
+      the timestamp (a number, e.g. seconds) of an element.
+    :param str|function|tuple|list|None aggregations: None or aggregation
+      or list of aggregations as in GroupByAgg(). If None, results are
+      lists of the elements within the windows.
+    :param float lateness: Allowed lateness of out-of-order elements.
+    :param int ddof: Delta degrees of freedom for 'var' and 'std'.
+    :return: Iterator over tuples (start, result)
+    :rtype: iterator
+    :raise: ValueError if aggregation is unknown or parameters invalid.
+    """
+    return _time_windows(iterable, size, size, timecol, aggregations,
+                         lateness, ddof)
+
+
+@nut_processor
+def SlidingWindow(iterable, size, slide, timecol=0, aggregations=None,
+                  lateness=0, ddof=1):
+    """
+    iterable >> SlidingWindow(size, slide, timecol=0, aggregations=None,
+                              lateness=0, ddof=1)
+
+    Group timestamped elements into overlapping time windows of the
+    given size that start every slide time units, i.e. windows cover
+    the time intervals [k*slide, k*slide+size[. Elements are therefore
+    assigned to size/slide windows. Memory is bounded by the number of
+    open windows, which is about (size + lateness) / slide.
+    See TumblingWindow() for details.
+
+    >>> data = [(0, 'a'), (1, 'b'), (2, 'c'), (3, 'd')]
+    >>> concat = (lambda a, x: a + x, 1)
+    >>> data >> SlidingWindow(2, 1, aggregations=concat) >> Collect()
+    [(-1, 'a'), (0, 'ab'), (1, 'bc'), (2, 'cd'), (3, 'd')]
+
+    >>> data = [(0, 1), (1, 2), (2, 3), (3, 4)]
+    >>> data >> SlidingWindow(4, 2, aggregations=('sum', 1)) >> Collect()
+    [(-2, 3), (0, 10), (2, 7)]
+
+    :param iterable iterable: Any iterable over timestamped elements.
+    :param float size: Size of windows in units of the timestamps.
+    :param float slide: Time between the starts of consecutive windows.
+    :param int|function timecol: Column index or function that returns
+      the timestamp (a number, e.g. seconds) of an element.
+    :param str|function|tuple|list|None aggregations: None or aggregation
+      or list of aggregations as in GroupByAgg(). If None, results are
+      lists of the elements within the windows.
+    :param float lateness: Allowed lateness of out-of-order elements.
+    :param int ddof: Delta degrees of freedom for 'var' and 'std'.
+    :return: Iterator over tuples (start, result)
+    :rtype: iterator
+    :raise: ValueError if aggregation is unknown or parameters invalid.
+    """
+    return _time_windows(iterable, size, slide, timecol, aggregations,
+                         lateness, ddof)
+
+
+@nut_processor
+def Batch(iterable, n, columns=None, dtype=None, buffers=None,
+          partial=True):
+    """
+    iterable >> Batch(n, columns=None, dtype=None, buffers=None,
+                      partial=True)
+
+    Stack samples (numbers or numpy arrays) into batches of size n.
+    Equivalent to Chunk(n) >> Map(np.stack) but samples are written
+    directly into preallocated batch arrays, which can be recycled.
+    Requires numpy.
+
+    >>> import numpy as np
+    >>> samples = [np.array([i, i]) for i in range(5)]
+    >>> batches = samples >> Batch(2) >> Collect()
+    >>> [b.tolist() for b in batches]
+    [[[0, 0], [1, 1]], [[2, 2], [3, 3]], [[4, 4]]]
+
+    Columns of samples can be extracted and batched separately (see
+    GetCols()). The result is a tuple of batches for multiple columns.
+
+    >>> samples = [(np.ones(2) * i, i, 'label') for i in range(4)]
+    >>> for xs, ys in samples >> Batch(2, (0, 1)):
+    ...     print(xs.tolist(), ys.tolist())
+    [[0.0, 0.0], [1.0, 1.0]] [0, 1]
+    [[2.0, 2.0], [3.0, 3.0]] [2, 3]
+
+    If buffers is given, batches are cycled through a ring of
+    preallocated buffers, which avoids allocating a new array per batch.
+    A batch is then only valid until further 'buffers' batches have been
+    created, i.e. at most buffers-1 batches can be used (e.g. stored in
+    a Prefetch() queue) while the next batch is filled. Do not use
+    buffers if batches need to be kept, e.g. via Collect().
+
+    >>> for batch in range(5) >> Batch(2, buffers=2):
+    ...     print(batch.tolist())
+    [0, 1]
+    [2, 3]
+    [4]
+
+    :param iterable iterable: Iterable over samples, e.g. numpy arrays
+      or tuples of arrays/numbers if columns are given.
+    :param int n: Batch size
+    :param int|tuple|None columns: None: the sample itself is batched.
+      int: the given column of the sample is batched. tuple: the given
+      columns are batched and a tuple of batches is returned.
+    :param dtype|tuple|None dtype: Data type of batches or tuple of data
+      types for columns. If None the data type of the first sample
+      (column) is used.
+    :param int|None buffers: Number of preallocated batch buffers that are
+      recycled. None means no recycling, i.e. a new array per batch.
+    :param bool partial: True: last batch with less than n samples is
+      returned (as view on the buffer). False: it is dropped.
+    :return: Iterator over batches (numpy arrays) or tuples of batches.
+    :rtype: iterator
+    :raise: ValueError if the shape of a sample (column) differs from
+      the shape of the first sample or, if dtype is None, its data type
+      cannot be cast to the data type of the first sample without
+      changing its kind, e.g. float to int.
+    """
+    import numpy as np
+
+    multiple = isinstance(columns, (tuple, list))
+    if columns is None:
+        getcols = lambda e: (e,)
+    elif multiple:
+        getcols = lambda e: tuple(e[c] for c in columns)
+    else:
+        getcols = lambda e: (e[columns],)
+    it = iter(iterable)
+    for first in it:
+        break
+    else:
+        return
+    samples = [np.asarray(c) for c in getcols(first)]
+    if not isinstance(dtype, (tuple, list)):
+        dtype = [dtype] * len(samples)
+    shapes = [((n,) + a.shape, a.dtype if dt is None else dt)
+              for a, dt in zip(samples, dtype)]
+    inferred = [dt is None for dt in dtype]
+    ring = []
+
+    def allocate(b):
+        if buffers and len(ring) == buffers:
+            return ring[b % buffers]
+        batch = [np.empty(shape, dt) for shape, dt in shapes]
+        if buffers:
+            ring.append(batch)
+        return batch
+
+    def result(batch, m):
+        batch = [a[:m] for a in batch] if m < n else batch
+        return tuple(batch) if multiple else batch[0]
+
+    b, i = 0, 0
+    batch = allocate(b)
+    for e in itt.chain((first,), it):
+        for a, c, check in zip(batch, getcols(e), inferred):
+            c = np.asarray(c)
+            if c.shape != a.shape[1:]:
+                raise ValueError('Expected sample of shape {} but got {}'
+                                 .format(a.shape[1:], c.shape))
+            if check and not np.can_cast(c.dtype, a.dtype, 'same_kind'):
+                raise ValueError('Cannot cast sample of type {} to batch '
+                                 'of type {}. Specify dtype.'
+                                 .format(c.dtype, a.dtype))
+            a[i] = c
+        i += 1
+        if i == n:
+            yield result(batch, n)
+            b, i = b + 1, 0
+            batch = allocate(b)
+    if i and partial:
+        yield result(batch, i)
+
+
+def _padded(batch, pad, dtype, slot=None):
+    """
+    Return batch of sequences as numpy array padded to longest sequence.
+    See BucketBatch
+
+    :param list batch: List of sequences (lists or numpy arrays)
+    :param number pad: Value used for padding.
+    :param dtype|None dtype: Data type of array. If None the data type of
+      the first sequence is used.
+    :param list|None slot: None: a new array is allocated. Otherwise a
+      list with a flat buffer array (or None), which is reused or replaced
+      by a larger buffer, and the batch is a view on the buffer.
+    :return: Array of shape (len(batch), maxlen, ...)
+    :rtype: numpy.ndarray
+    """
+    import numpy as np
+
+    seqs = [np.asarray(seq) for seq in batch]
+    maxlen = max(len(seq) for seq in seqs)
+    first = seqs[0]
+    shape = (len(seqs), maxlen) + first.shape[1:]
+    dtype = first.dtype if dtype is None else np.dtype(dtype)
+    if slot is None:
+        array = np.full(shape, pad, dtype)
+    else:
+        size = int(np.prod(shape))
+        buffer = slot[0]
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = slot[0] = np.empty(size, dtype)
+        array = buffer[:size].reshape(shape)
+        array.fill(pad)
+    for row, seq in zip(array, seqs):
+        row[:len(seq)] = seq
+    return array
+
+
+@nut_processor
+def BucketBatch(iterable, lengthfunc, boundaries, batchsize=None,
+                max_tokens=None, pad=0, dtype=None, buffers=None):
+    """
+    iterable >> BucketBatch(lengthfunc, boundaries, batchsize=None,
+                            max_tokens=None, pad=0, dtype=None,
+                            buffers=None)
+
+    Batch variable-length sequences, e.g. sentences, grouped by length
+    to reduce padding. Elements are routed into buckets for the length
+    intervals defined by boundaries and a batch is returned whenever a
+    bucket is full, i.e. it contains batchsize elements or adding the next
+    element would exceed max_tokens (= number of elements * maximum
+    length in bucket). Remaining buckets are returned at the end of the
+    iterable. Batches are numpy arrays padded to the longest sequence in
+    the batch or lists of elements if pad is None.
+    see also Batch(), Chunk()
+
+    >>> data = [[1], [1, 2, 3], [2], [4, 5, 6], [7, 8]]
+    >>> data >> BucketBatch(len, [2], batchsize=2, pad=None) >> Collect()
+    [[[1], [2]], [[1, 2, 3], [4, 5, 6]], [[7, 8]]]
+
+    >>> data = [[1, 2], [3], [4, 5, 6]]
+    >>> batches = data >> BucketBatch(len, [], max_tokens=6) >> Collect()
+    >>> [b.tolist() for b in batches]
+    [[[1, 2], [3, 0]], [[4, 5, 6]]]
+
+    If buffers is given, padded batches of each bucket are written into a
+    ring of preallocated buffers (see Batch()), which grow to the largest
+    batch of the bucket. A batch is then only valid until further
+    'buffers' batches of the same bucket have been created.
+
+    :param iterable iterable: Iterable over sequences, e.g. lists or
+      numpy arrays with sequence length as first dimension.
+    :param function lengthfunc: Function that returns length of element,
+      e.g. len. Used for bucketing and the token budget.
+    :param list|tuple boundaries: Sorted upper boundaries (exclusive) of
+      bucket lengths, e.g. [10, 20] creates buckets for lengths < 10,
+      10..19 and >= 20.
+    :param int|None batchsize: Maximum number of elements per batch.
+    :param int|None max_tokens: Maximum number of tokens per batch,
+      including padding. A single element longer than max_tokens is
+      returned as batch of its own.
+    :param number|None pad: Value used for padding or None, in which case
+      batches are lists of elements. Requires numpy if not None.
+    :param dtype|None dtype: Data type of padded batches. If None the data
+      type of the first element in the batch is used.
+    :param int|None buffers: Number of batch buffers per bucket that are
+      recycled. None means no recycling, i.e. a new array per batch.
+    :return: Iterator over batches
+    :rtype: iterator
+    :raise: ValueError if neither batchsize nor max_tokens is given.
+    """
+    if not batchsize and not max_tokens:
+        raise ValueError('batchsize or max_tokens must be given')
+    boundaries = sorted(boundaries)
+    nbuckets = len(boundaries) + 1
+    buckets = [[] for _ in range(nbuckets)]
+    maxlens = [0] * nbuckets
+    rings = [[[None] for _ in range(buffers or 0)] for _ in range(nbuckets)]
+    nbatches = [0] * nbuckets
+
+    def batch(i):
+        elements, buckets[i], maxlens[i] = buckets[i], [], 0
+        if pad is None:
+            return elements
+        slot = None
+        if buffers:
+            slot = rings[i][nbatches[i] % buffers]
+            nbatches[i] += 1
+        return _padded(elements, pad, dtype, slot)
+
+    for e in iterable:
+        length = lengthfunc(e)
+        i = bisect.bisect_right(boundaries, length)
+        bucket = buckets[i]
+        maxlen = max(maxlens[i], length)
+        if max_tokens and bucket and (len(bucket) + 1) * maxlen > max_tokens:
+            yield batch(i)
+            maxlen = length
+        buckets[i].append(e)
+        maxlens[i] = maxlen
+        if batchsize and len(buckets[i]) >= batchsize:
+            yield batch(i)
+    for i in range(nbuckets):
+        if buckets[i]:
+            yield batch(i)
+
+
 Cycle = nut_processor(itt.cycle)
 """
 iterable >> Cycle()
@@ -692,14 +1490,15 @@ See https://docs.python.org/2/library/itertools.html#itertools.combinations
 :rtype: Iterator
 """
 
-Tee = nut_processor(itt.tee)
+Tee = nut_processor(itf.tee)
 """
-iterable >> Tee([n=2])
+iterable >> Tee([n=2], max_bytes=None, sizer=None)
 
 Return n independent iterators from a single iterable. Can consume large
 amounts of memory if iterable is large and tee's are not processed in
-parallel.
-See https://docs.python.org/2/library/itertools.html#itertools.tee
+parallel. Memory can be limited by max_bytes, in which case a BufferError
+is raised if the buffered elements exceed the limit. See iterfunction.tee
+and https://docs.python.org/2/library/itertools.html#itertools.tee
 
 >>> it1, it2  = [1, 2, 3] >> Tee(2)
 >>> it1 >> Collect()
@@ -709,6 +1508,9 @@ See https://docs.python.org/2/library/itertools.html#itertools.tee
 
 :param iterable iterable: Any iterable
 :param int n: Number of iterators to return.
+:param int|None max_bytes: Maximum memory of buffered elements in bytes.
+:param function|None sizer: Function that returns the size of an
+   element in bytes. If None nutsflow.common.sizeof is used.
 :return: n iterators
 :rtype: (Iterator, ...)
 """
@@ -761,6 +1563,36 @@ def Drop(iterable, n):
     return it
 
 
+def _pick_geometric(iterable, p, rand):
+    """
+    Return generator over elements picked with probability p.
+
+    Instead of drawing a random number per element the number of elements
+    to skip is drawn from a geometric distribution. Random number
+    generation is therefore proportional to the number of picked elements.
+
+    :param iterable iterable: Any iterable
+    :param float p: Probability in [0, 1].
+    :param Random|numpy.random.Generator rand: Random number generator.
+    :return: Generator over picked elements.
+    :rtype: generator
+    """
+    iterator = iter(iterable)
+    if p >= 1.0:
+        for e in iterator:
+            yield e
+        return
+    if p <= 0.0:
+        return
+    logq = math.log1p(-p)
+    for u in uniforms(rand, 64):
+        skip = min(sys.maxsize, int(math.log(max(1.0 - u, 1e-300)) / logq))
+        picked = list(itt.islice(iterator, skip, skip + 1))
+        if not picked:
+            return
+        yield picked[0]
+
+
 @nut_processor
 def Pick(iterable, p_n, rand=None):
     """
@@ -780,7 +1612,7 @@ def Pick(iterable, p_n, rand=None):
 
     >>> import random as rnd
     >>> Range(10) >> Pick(0.5, StableRandom(1)) >> Collect()
-    [0, 4, 5, 6, 8, 9]
+    [0, 9]
 
     >>> [1, 2, 3, 4] >> Pick(2) >> Collect()
     [1, 3]
@@ -788,31 +1620,187 @@ def Pick(iterable, p_n, rand=None):
     :param iterable iterable: Any iterable
     :param float|int p_n: Probability p in [0, 1] or
         integer n for every n-th element
-    :param Random|None rand: Random number generator. If None, random.Random()
-        is used.
+    :param Random|numpy.random.Generator|None rand: Random number generator.
+        If None, a numpy Generator or random.Random() is used
+        (see common.default_rand). Random numbers are drawn in blocks
+        from numpy generators (see common.uniforms) and only one random
+        number per picked element is needed, since the gaps between
+        picked elements are sampled from a geometric distribution.
     :return: Iterator over picked elements.
     :rtype: iterator
     """
-    rand = rnd.Random() if rand is None else rand
     if isinstance(p_n, int):
         if p_n < 0:
             raise ValueError('p_n must not be negative ' + str(p_n))
         return itt.islice(iterable, 0, None, p_n)
     if not 0 <= p_n <= 1:
         raise ValueError('Probability must be in [0, 1]: ' + str(p_n))
-    return iter(e for e in iterable if rand.uniform(0, 1) <= p_n)
+    rand = default_rand() if rand is None else rand
+    return _pick_geometric(iterable, p_n, rand)
 
 
 @nut_processor
-def GroupBy(iterable, keycol=lambda x: x, nokey=False):
+def RunningTopK(iterable, k, key=None, bottom=False):
     """
-    iterable >> GroupBy(keycol=lambda x: x, nokey=False)
+    iterable >> RunningTopK(k, key=None, bottom=False)
+
+    Return the k largest (or smallest) elements seen so far
+    (transformed or extracted by key function) for each element of the
+    iterable. Elements are kept in a bounded heap, i.e. updates take
+    O(log k) time and memory consumption is O(k). The sorted tuple is only
+    rebuilt if an element enters the heap, otherwise the previous tuple
+    is returned again. See also TopK and BottomK.
+
+    >>> [1, 3, 2, 4] >> RunningTopK(2) >> Collect()
+    [(1,), (3, 1), (3, 2), (4, 3)]
+
+    >>> [1, 3, 2, 4] >> RunningTopK(2, bottom=True) >> Collect()
+    [(1,), (1, 3), (1, 2), (1, 2)]
+
+    >>> data = [(1, 'a'), (3, 'b'), (2, 'c')]
+    >>> data >> RunningTopK(1, key=0) >> Collect()
+    [((1, 'a'),), ((3, 'b'),), ((3, 'b'),)]
+
+    :param iterable iterable: Any iterable.
+    :param int k: Number of elements to keep.
+    :param int|tuple|function|None key: Key function to extract or
+           transform elements. None = identity function.
+    :param bool bottom: True: keep smallest elements, False: largest.
+    :return: Iterator over tuples with k largest (smallest) elements in
+             descending (ascending) order.
+    :rtype: iterator
+    """
+    # Heap root is the element to evict next: smallest (largest) key and
+    # among equal keys the most recent element, as for heapq.nlargest.
+    if bottom:
+        rank = lambda k, i: itf._Reversed((k, i))
+    else:
+        rank = lambda k, i: (k, -i)
+    key, heap, topk = colfunc(key), [], ()
+    for i, e in enumerate(iterable):
+        entry = (rank(key(e), i), e)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif not k or heapq.heappushpop(heap, entry) is entry:
+            yield topk
+            continue
+        topk = tuple(e for _, e in sorted(heap, reverse=True))
+        yield topk
+
+
+def _normkey(key):
+    """
+    Return key normalized for hashing. Used by GroupBy and JoinOn.
+
+    Keys that are equal should be assigned to the same bucket but
+    stable_hash() hashes the repr() of a key. Numbers with integral values
+    are therefore converted to int and numpy scalars to Python scalars.
+
+    >>> _normkey((1.0, 'a', True))
+    (1, 'a', 1)
+
+    :param object key: Key of element.
+    :return: Normalized key
+    :rtype: object
+    """
+    if isinstance(key, tuple):
+        return tuple(_normkey(k) for k in key)
+    if hasattr(key, 'item') and hasattr(key, 'dtype'):
+        key = key.item()
+    if isinstance(key, float) and key.is_integer():
+        return int(key)
+    if isinstance(key, six.integer_types):
+        return int(key)
+    return key
+
+
+def _partition(args):
+    """
+    Hash-partition elements into bucket files. Used by GroupBy.
+
+    Elements are appended as pickled blocks (idx, elements) to the bucket
+    files of the current process. Top-level function to be pickable.
+
+    :param tuple args: Tuple (idx, elements, keycol, nbuckets, path), with
+      idx being the index of the block of elements.
+    """
+    idx, elements, keycol, nbuckets, path = args
+    isfunc = hasattr(keycol, '__call__')
+    buckets = cl.defaultdict(list)
+    for e in elements:
+        key = keycol(e) if isfunc else e[keycol]
+        buckets[stable_hash(_normkey(key)) % nbuckets].append(e)
+    for b, block in six.iteritems(buckets):
+        fname = 'bucket_{0:06d}_{1}.pkl'.format(b, os.getpid())
+        with open(osp.join(path, fname), 'ab') as f:
+            pickle.dump((idx, block), f, pickle.HIGHEST_PROTOCOL)
+
+
+def _load_bucket(path, b):
+    """
+    Return elements of bucket in original order. Used by GroupBy.
+
+    :param str path: Folder with bucket files.
+    :param int b: Index of bucket
+    :return: List of elements in bucket
+    :rtype: list
+    """
+    prefix = 'bucket_{0:06d}_'.format(b)
+    blocks = []
+    for fname in os.listdir(path):
+        if fname.startswith(prefix):
+            with open(osp.join(path, fname), 'rb') as f:
+                while True:
+                    try:
+                        blocks.append(pickle.load(f))
+                    except EOFError:
+                        break
+    blocks.sort(key=lambda block: block[0])
+    return [e for _, block in blocks for e in block]
+
+
+def _groupby_spill(iterable, keycol, nokey, nbuckets, workers, tmpdir,
+                   chunksize):
+    """
+    Return generator over groups that are partitioned on disk.
+
+    See GroupBy.
+    """
+    path = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        chunks = enumerate(itf.chunked(iterable, chunksize))
+        tasks = ((i, list(c), keycol, nbuckets, path) for i, c in chunks)
+        if workers:
+            pool = mp.Pool(workers)
+            try:
+                for batch in itf.chunked(tasks, workers):
+                    pool.map(_partition, batch)
+            finally:
+                pool.close()
+        else:
+            for task in tasks:
+                _partition(task)
+        for b in range(nbuckets):
+            bucket = _load_bucket(path, b)
+            for group in bucket >> GroupBy(keycol, nokey):
+                yield group
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@nut_processor
+def GroupBy(iterable, keycol=lambda x: x, nokey=False, buckets=None,
+            workers=0, tmpdir=None, chunksize=10000):
+    """
+    iterable >> GroupBy(keycol=lambda x: x, nokey=False, buckets=None,
+                        workers=0, tmpdir=None, chunksize=10000)
 
     Group elements of iterable based on a column value of the element or
     the function value of keycol for the element.
     Note that elements of iterable do not need to be sorted.
-    GroupBy will store all elements in memory!
-    If the iterable is sorted use GroupBySorted() instead.
+    GroupBy will store all elements in memory, unless buckets are
+    specified! If the iterable is sorted use GroupBySorted() instead.
+    If groups can be aggregated use GroupByAgg() instead.
     see also Chunk(), ChunkWhen(), ChunkBy()
 
     >>> from nutsflow import Sort
@@ -832,13 +1820,39 @@ def GroupBy(iterable, keycol=lambda x: x, nokey=False):
     >>> [(1,3), (2,2), (3,1)] >> GroupBy(1, nokey=True) >> Sort()
     [[(1, 3)], [(2, 2)], [(3, 1)]]
 
+    If the elements do not fit into memory, they can be hash-partitioned
+    by key into buckets on disk, which are then grouped one at a time.
+    Memory consumption is bounded by the largest bucket
+    (plus chunksize elements per worker). The order of elements within
+    groups is preserved, groups are ordered by bucket.
+
+    >>> [1, 2, 1, 1, 3] >> GroupBy(buckets=4) >> Sort()
+    [(1, [1, 1, 1]), (2, [2]), (3, [3])]
+
+    Buckets are computed from the repr() of the keys (see
+    sketch.stable_hash), which therefore must be deterministic, e.g.
+    numbers, strings or tuples of those. Sets or objects with the default
+    repr() are not grouped correctly if buckets are specified.
+
     :param iterable iterable: Any iterable
     :param int|function keycol: Column index or key function.
     :param bool nokey: True: results will not contain keys for groups, only
         the groups themselves.
+    :param int|None buckets: None: group in memory. Otherwise number of
+        buckets on disk elements are partitioned into.
+    :param int workers: Number of worker processes to partition elements
+        in parallel (if buckets is not None). Note that elements and
+        keycol must be pickable for workers > 0, e.g. a column index or
+        a top-level function but not a lambda function.
+    :param str|None tmpdir: Folder for temporary bucket files.
+        If None the system default is used.
+    :param int chunksize: Number of elements partitioned per chunk.
     :return: Iterator over groups.
     :rtype: iterator
     """
+    if buckets:
+        return _groupby_spill(iterable, keycol, nokey, buckets, workers,
+                              tmpdir, chunksize)
     isfunc = hasattr(keycol, '__call__')
     groups = cl.defaultdict(list)
     for e in iterable:
@@ -847,6 +1861,383 @@ def GroupBy(iterable, keycol=lambda x: x, nokey=False):
     return six.itervalues(groups) if nokey else six.iteritems(groups)
 
 
+def _joinkey(key):
+    """
+    Return key function for joins. Tuples of column indices result
+    in hashable tuple keys.
+
+    :param int|tuple|function|None key: Column index(es) or key function.
+    :return: Key function
+    :rtype: function
+    """
+    if isinstance(key, tuple):
+        return lambda x: tuple(x[i] for i in key)
+    return colfunc(key)
+
+
+def _hashjoin(left, right, lkey, rkey, how, default):
+    """
+    Return generator over joined elements using a hash index on right.
+
+    See JoinOn.
+    """
+    index = cl.defaultdict(list)
+    for r in right:
+        index[rkey(r)].append(r)
+    for e in left:
+        matches = index.get(lkey(e))
+        if matches:
+            for r in matches:
+                yield e, r
+        elif how == 'left':
+            yield e, default
+
+
+def _hashjoin_spill(left, right, lkey, rkey, how, default, nbuckets, tmpdir,
+                    chunksize):
+    """
+    Return generator over joined elements using a hash index on disk.
+
+    Both sides are partitioned into buckets on disk and joined bucket
+    by bucket. See JoinOn.
+    """
+    path = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        for side, iterable, key in [('left', left, lkey),
+                                    ('right', right, rkey)]:
+            sidepath = osp.join(path, side)
+            os.makedirs(sidepath)
+            for i, c in enumerate(itf.chunked(iterable, chunksize)):
+                _partition((i, list(c), key, nbuckets, sidepath))
+        for b in range(nbuckets):
+            rbucket = _load_bucket(osp.join(path, 'right'), b)
+            lbucket = _load_bucket(osp.join(path, 'left'), b)
+            for pair in _hashjoin(lbucket, rbucket, lkey, rkey, how, default):
+                yield pair
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@nut_processor
+def JoinOn(iterable, other, leftkey=0, rightkey=0, how='inner', default=None,
+           buckets=None, tmpdir=None, chunksize=10000):
+    """
+    iterable >> JoinOn(other, leftkey=0, rightkey=0, how='inner',
+                       default=None, buckets=None, tmpdir=None,
+                       chunksize=10000)
+
+    Join elements of iterable (left) with elements of other (right) that
+    have the same key. Returns tuples (left, right) for all matching pairs.
+    A hash index is built on the right side, or on the left side if it is
+    smaller and the lengths of both sides are known. The order of the results
+    follows the side that is not indexed. Iterables do not need to be
+    sorted but if they are, see MergeJoin().
+
+    >>> labels = [(1, 'cat'), (2, 'dog')]
+    >>> samples = [('s1', 2), ('s2', 1), ('s3', 3)]
+    >>> samples >> JoinOn(labels, 1, 0) >> Collect()
+    [(('s1', 2), (2, 'dog')), (('s2', 1), (1, 'cat'))]
+
+    >>> samples >> JoinOn(labels, 1, 0, how='left') >> Collect()
+    [(('s1', 2), (2, 'dog')), (('s2', 1), (1, 'cat')), (('s3', 3), None)]
+
+    If the index does not fit into memory, both sides can be hash-partitioned
+    into buckets on disk that are joined one at a time (Grace hash join).
+    Memory consumption is then bounded by the largest bucket. Results are
+    ordered by bucket and the left side. Keys must have a deterministic
+    repr() in this case (see GroupBy).
+
+    >>> samples >> JoinOn(labels, 1, 0, buckets=4) >> Sort()
+    [(('s1', 2), (2, 'dog')), (('s2', 1), (1, 'cat'))]
+
+    :param iterable iterable: Any iterable (left side)
+    :param iterable other: Any iterable (right side)
+    :param int|tuple|function leftkey: Column index(es) or key function
+        for elements of iterable (see common.colfunc).
+    :param int|tuple|function rightkey: Column index(es) or key function
+        for elements of other.
+    :param str how: 'inner': only matching pairs. 'left': elements of
+        iterable without match are joined with default.
+    :param object default: Right side for elements of iterable without
+        match if how='left'
+    :param int|None buckets: None: index in memory. Otherwise number of
+        buckets on disk both sides are partitioned into.
+    :param str|None tmpdir: Folder for temporary bucket files.
+        If None the system default is used.
+    :param int chunksize: Number of elements partitioned per chunk.
+    :return: Iterator over tuples (left, right)
+    :rtype: iterator
+    :raise: ValueError if how is invalid.
+    """
+    if how not in {'inner', 'left'}:
+        raise ValueError('Invalid join: ' + str(how))
+    lkey, rkey = _joinkey(leftkey), _joinkey(rightkey)
+    if buckets:
+        return _hashjoin_spill(iterable, other, lkey, rkey, how, default,
+                               buckets, tmpdir, chunksize)
+    sized = hasattr(iterable, '__len__') and hasattr(other, '__len__')
+    if how == 'inner' and sized and len(iterable) < len(other):
+        pairs = _hashjoin(other, iterable, rkey, lkey, how, default)
+        return ((l, r) for r, l in pairs)
+    return _hashjoin(iterable, other, lkey, rkey, how, default)
+
+
+@nut_processor
+def MergeJoin(iterable, other, leftkey=0, rightkey=0, how='inner',
+              default=None):
+    """
+    iterable >> MergeJoin(other, leftkey=0, rightkey=0, how='inner',
+                          default=None)
+
+    Join elements of iterable (left) with elements of other (right) that
+    have the same key. Both iterables must be sorted in ascending order
+    of their keys. Returns tuples (left, right) for all matching pairs in
+    order. Only the elements of other with the current key are stored,
+    i.e. memory consumption is O(1) for unique keys.
+    If the iterables are not sorted use JoinOn().
+
+    >>> labels = [(1, 'cat'), (2, 'dog')]
+    >>> samples = [('s2', 1), ('s1', 2), ('s3', 3)]
+    >>> samples >> MergeJoin(labels, 1, 0) >> Collect()
+    [(('s2', 1), (1, 'cat')), (('s1', 2), (2, 'dog'))]
+
+    >>> samples >> MergeJoin(labels, 1, 0, how='left') >> Collect()
+    [(('s2', 1), (1, 'cat')), (('s1', 2), (2, 'dog')), (('s3', 3), None)]
+
+    :param iterable iterable: Any iterable sorted by leftkey (left side)
+    :param iterable other: Any iterable sorted by rightkey (right side)
+    :param int|tuple|function leftkey: Column index(es) or key function
+        for elements of iterable (see common.colfunc).
+    :param int|tuple|function rightkey: Column index(es) or key function
+        for elements of other.
+    :param str how: 'inner': only matching pairs. 'left': elements of
+        iterable without match are joined with default.
+    :param object default: Right side for elements of iterable without
+        match if how='left'
+    :return: Iterator over tuples (left, right)
+    :rtype: iterator
+    :raise: ValueError if how is invalid.
+    """
+    if how not in {'inner', 'left'}:
+        raise ValueError('Invalid join: ' + str(how))
+    lkey, rkey = _joinkey(leftkey), _joinkey(rightkey)
+    end = object()
+    right = iter(other)
+    r = next(right, end)
+    groupkey, group = end, []
+    for e in iterable:
+        key = lkey(e)
+        if groupkey is end or key != groupkey:
+            while r is not end and rkey(r) < key:
+                r = next(right, end)
+            groupkey, group = key, []
+            while r is not end and rkey(r) == key:
+                group.append(r)
+                r = next(right, end)
+        if group:
+            for g in group:
+                yield e, g
+        elif how == 'left':
+            yield e, default
+
+
+def _welford(state, x):
+    """Update state [n, mean, M2] with x using Welford's algorithm"""
+    n = state[0] + 1
+    delta = x - state[1]
+    state[1] += delta / n
+    state[2] += delta * (x - state[1])
+    state[0] = n
+    return state
+
+
+def _variance(state, ddof):
+    """Return variance for Welford state or None if undefined"""
+    n, _, m2 = state
+    return m2 / (n - ddof) if n - ddof > 0 else None
+
+
+def _aggregation(agg, ddof):
+    """
+    Return aggregation for GroupByAgg.
+
+    :param str|function|tuple agg: Aggregation, e.g. 'sum', ('sum', 1)
+    :param int ddof: Delta degrees of freedom for 'var' and 'std'
+    :return: Tuple (name, getter, init, update, final), where name is
+      None for custom reducers.
+    :rtype: tuple
+    :raise: ValueError if aggregation is unknown.
+    """
+    agg, col = agg if isinstance(agg, tuple) else (agg, None)
+    getter, ident = colfunc(col), lambda s: s
+    if hasattr(agg, '__call__'):
+        return None, getter, ident, agg, ident
+    welford_init = lambda x: [1, float(x), 0.0]
+    aggs = {
+        'count': (lambda x: 1, lambda s, x: s + 1, ident),
+        'sum': (ident, lambda s, x: s + x, ident),
+        'min': (ident, lambda s, x: x if x < s else s, ident),
+        'max': (ident, lambda s, x: x if x > s else s, ident),
+        'mean': (welford_init, _welford, lambda s: s[1]),
+        'var': (welford_init, _welford, lambda s: _variance(s, ddof)),
+        'std': (welford_init, _welford,
+                lambda s: None if s[0] - ddof <= 0 else
+                math.sqrt(_variance(s, ddof))),
+    }
+    if agg not in aggs:
+        raise ValueError('Unknown aggregation: ' + str(agg))
+    return (agg, getter) + aggs[agg]
+
+
+def _groupby_agg_vectorized(iterable, keyf, aggs, numkeys, ddof, chunksize):
+    """
+    Return generator over (key, results) computed with numpy bincount.
+
+    See GroupByAgg.
+    """
+    import numpy as np
+
+    if any(name is None for name, _, _, _, _ in aggs):
+        raise ValueError('Custom reducers not supported if numkeys is given')
+    counts = np.zeros(numkeys, dtype=np.int64)
+    states = []
+    for name, _, _, _, _ in aggs:
+        fill = {'min': np.inf, 'max': -np.inf}.get(name, 0.0)
+        states.append(np.full((3, numkeys), fill))  # sum|min|max, mean, M2
+    for chunk in itf.chunked(iterable, chunksize):
+        chunk = list(chunk)
+        keys = np.fromiter((keyf(e) for e in chunk), np.intp, len(chunk))
+        cnts = np.bincount(keys, minlength=numkeys)
+        n, nonzero = counts + cnts, cnts > 0
+        for (name, getter, _, _, _), state in zip(aggs, states):
+            if name == 'count':
+                continue
+            vals = np.fromiter((getter(e) for e in chunk), float, len(chunk))
+            if name == 'sum':
+                state[0] += np.bincount(keys, vals, numkeys)
+            elif name == 'min':
+                np.minimum.at(state[0], keys, vals)
+            elif name == 'max':
+                np.maximum.at(state[0], keys, vals)
+            else:  # Chan et al. parallel variant of Welford's algorithm
+                means = np.bincount(keys, vals, numkeys)
+                means[nonzero] /= cnts[nonzero]
+                m2 = np.bincount(keys, (vals - means[keys]) ** 2, numkeys)
+                delta = means - state[1]
+                ratio = np.zeros(numkeys)
+                ratio[nonzero] = cnts[nonzero] / n[nonzero]
+                state[1] += delta * ratio
+                state[2] += m2 + delta ** 2 * counts * ratio
+        counts = n
+    for key in np.nonzero(counts)[0]:
+        results = []
+        for (name, _, _, _, _), state in zip(aggs, states):
+            if name == 'count':
+                results.append(int(counts[key]))
+            elif name in {'sum', 'min', 'max'}:
+                results.append(float(state[0, key]))
+            elif name == 'mean':
+                results.append(float(state[1, key]))
+            else:
+                welford = [int(counts[key]), state[1, key], state[2, key]]
+                var = _variance(welford, ddof)
+                std = None if var is None else math.sqrt(var)
+                results.append(var if name == 'var' else std)
+        yield int(key), results
+
+
+@nut_processor
+def GroupByAgg(iterable, keycol=lambda x: x, aggregations='count',
+               nokey=False, ddof=1, numkeys=None, chunksize=10000):
+    """
+    iterable >> GroupByAgg(keycol=lambda x: x, aggregations='count',
+                           nokey=False, ddof=1, numkeys=None, chunksize=10000)
+
+    Group elements of iterable based on a column value of the element or
+    the function value of keycol for the element and aggregate the
+    elements of each group. In contrast to GroupBy, elements are not
+    stored but only one accumulator per group and aggregation,
+    i.e. memory consumption is O(#groups).
+    Note that elements of iterable do not need to be sorted.
+    see also GroupBy(), GroupBySorted()
+
+    Aggregations are 'count', 'sum', 'min', 'max', 'mean', 'var' and 'std',
+    where 'var' and 'std' are computed with Welford's algorithm,
+    or a reducer function f(acc, x) that is initialized with the first
+    value of the group, e.g. lambda a, x: a * x. An aggregation can
+    be applied to a column of the elements by passing a tuple, e.g.
+    ('sum', 1) or (max, 1), where the column is an index, tuple
+    of indices or a function (see common.colfunc).
+
+    >>> from nutsflow import Sort
+
+    >>> [1, 2, 1, 1, 3] >> GroupByAgg() >> Sort()
+    [(1, 3), (2, 1), (3, 1)]
+
+    >>> data = [('a', 1), ('b', 2), ('a', 3)]
+    >>> data >> GroupByAgg(0, ('sum', 1)) >> Sort()
+    [('a', 4), ('b', 2)]
+
+    >>> data >> GroupByAgg(0, ['count', ('mean', 1), ('max', 1)]) >> Sort()
+    [('a', (2, 2.0, 3)), ('b', (1, 2.0, 2))]
+
+    >>> data >> GroupByAgg(0, (lambda a, x: a * x, 1), nokey=True) >> Sort()
+    [2, 3]
+
+    If keys are small, non-negative integers and values are numbers,
+    aggregations can be vectorized by providing the number of keys.
+    Elements are then processed in chunks using numpy.bincount, results
+    are floats and groups are sorted by key. Custom reducers are not
+    supported in this mode.
+
+    >>> data = [(0, 1), (2, 2), (0, 3)]
+    >>> data >> GroupByAgg(0, ['count', ('sum', 1)], numkeys=3) >> Collect()
+    [(0, (2, 4.0)), (2, (1, 2.0))]
+
+    :param iterable iterable: Any iterable
+    :param int|function keycol: Column index or key function.
+    :param str|function|tuple|list aggregations: Aggregation or list of
+        aggregations. If a list is given the results for each group
+        are tuples.
+    :param bool nokey: True: results will not contain keys for groups, only
+        the aggregated results themselves.
+    :param int ddof: Delta degrees of freedom for 'var' and 'std'.
+        Result is None for groups with no more than ddof elements.
+    :param int|None numkeys: None or number of keys. If given, keys
+        must be integers in [0, numkeys[ and aggregations are vectorized.
+    :param int chunksize: Number of elements processed per chunk if
+        aggregations are vectorized.
+    :return: Iterator over aggregated groups.
+    :rtype: iterator
+    :raise: ValueError if aggregation is unknown.
+    """
+    multiple = isinstance(aggregations, list)
+    aggs = aggregations if multiple else [aggregations]
+    aggs = [_aggregation(a, ddof) for a in aggs]
+    isfunc = hasattr(keycol, '__call__')
+    keyf = keycol if isfunc else lambda e: e[keycol]
+
+    if numkeys:
+        groups = _groupby_agg_vectorized(iterable, keyf, aggs, numkeys, ddof,
+                                         chunksize)
+    else:
+        states = dict()
+        for e in iterable:
+            key = keyf(e)
+            state = states.get(key)
+            if state is None:
+                states[key] = [init(get(e)) for _, get, init, _, _ in aggs]
+            else:
+                for i, (_, get, _, update, _) in enumerate(aggs):
+                    state[i] = update(state[i], get(e))
+        groups = ((k, [agg[4](s) for agg, s in zip(aggs, state)])
+                  for k, state in six.iteritems(states))
+
+    for key, results in groups:
+        result = tuple(results) if multiple else results[0]
+        yield result if nokey else (key, result)
+
+
 @nut_processor
 def GroupBySorted(iterable, keycol=lambda x: x, nokey=False):
     """
@@ -912,10 +2303,39 @@ def Clone(iterable, n):
             yield e
 
 
+def _shuffle_bounded(iterable, buffersize, rand, max_bytes, sizer):
+    """
+    Return generator over shuffled elements with a buffer that is limited
+    by number of elements and memory. See Shuffle().
+    """
+    buffer, sizes, nbytes = [], [], 0
+    if isinstance(rand, rnd.Random):
+        index = lambda n: rand.randint(0, n - 1)
+    else:
+        us = uniforms(rand)
+        index = lambda n: min(int(next(us) * n), n - 1)
+    for e in iterable:
+        size = sizeof(e, sizer)
+        while buffer and (len(buffer) >= buffersize or
+                          nbytes + size > max_bytes):
+            i = index(len(buffer))
+            out, nbytes = buffer[i], nbytes - sizes[i]
+            buffer[i], sizes[i] = buffer[-1], sizes[-1]
+            buffer.pop()
+            sizes.pop()
+            yield out
+        buffer.append(e)
+        sizes.append(size)
+        nbytes += size
+    rand.shuffle(buffer)
+    for e in buffer:
+        yield e
+
+
 @nut_processor
-def Shuffle(iterable, buffersize, rand=None):
+def Shuffle(iterable, buffersize, rand=None, max_bytes=None, sizer=None):
     """
-    iterable >> Shuffle(buffersize)
+    iterable >> Shuffle(buffersize, rand=None, max_bytes=None, sizer=None)
 
     Perform (partial) random shuffle of the elements in the iterable.
     Elements of the iterable are stored in a buffer of the given size
@@ -926,8 +2346,8 @@ def Shuffle(iterable, buffersize, rand=None):
 
     In the following example rand = StableRandom(0) is used to create a fixed
     sequence that stable across Python version 2.x and 3.x. Usually, this is
-    not what you want. Use the default rand=None which uses random.Random()
-    instead.
+    not what you want. Use the default rand=None which uses a numpy Generator
+    or random.Random() instead.
 
     >>> from nutsflow import Range, Collect
     >>> from nutsflow.common import StableRandom
@@ -938,26 +2358,205 @@ def Shuffle(iterable, buffersize, rand=None):
     >>> Range(10) >> Shuffle(1, StableRandom(0)) >> Collect()
     [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
 
+    If max_bytes is provided the buffer is in addition limited by the
+    memory of the buffered elements, which is useful for elements of very
+    different sizes. Element sizes are estimated by nutsflow.common.sizeof
+    or the provided sizer function.
+
+    >>> data = ['a', 'b', 'cccccccccc', 'd']
+    >>> data >> Shuffle(4, StableRandom(0), 10, len) >> Collect()
+    ['b', 'a', 'cccccccccc', 'd']
+
     :param iterable iterable: Any iterable
     :param int buffersize: Number of elements stored in shuffle buffer.
-    :param Random|None rand: Random number generator. If None,
-           random.Random() is used.
+    :param Random|numpy.random.Generator|None rand: Random number generator.
+           If None, a numpy Generator or random.Random() is used
+           (see common.default_rand). Random indices are drawn in blocks
+           from numpy generators (see common.randindices).
+    :param int|None max_bytes: Maximum memory of buffered elements in bytes.
+           None means no limit.
+    :param function|None sizer: Function that returns the size of an
+           element in bytes. If None nutsflow.common.sizeof is used.
     :return: Generator over shuffled elements
     :rtype: generator
     """
-    rand = rnd.Random() if rand is None else rand
+    rand = default_rand() if rand is None else rand
+    if max_bytes is not None:
+        for e in _shuffle_bounded(iterable, buffersize, rand, max_bytes,
+                                  sizer):
+            yield e
+        return
     iterable = iter(iterable)
     buffer = list(itf.take(iterable, buffersize))
     rand.shuffle(buffer)
     n = len(buffer) - 1
+    idxs = randindices(rand, n + 1)
     for e in iterable:
-        i = rand.randint(0, n)
+        i = next(idxs)
         yield buffer[i]
         buffer[i] = e
     for e in buffer:
         yield e
 
 
+@nut_processor
+def Balance(iterable, labelcol, ratios=None, buffersize=100, rand=None):
+    """
+    iterable >> Balance(labelcol, ratios=None, buffersize=100, rand=None)
+
+    Stream of elements with balanced (or given) class ratios. Each class
+    has its own buffer of at most buffersize elements. As in Shuffle()
+    an incoming element is appended to the buffer of its class or replaces
+    a random element if the buffer is full. For each incoming element a
+    class is then sampled according to the ratios, and a random element of
+    its buffer is returned. Minority classes are therefore oversampled
+    (elements are returned repeatedly) and majority classes are
+    undersampled (elements are replaced before being returned).
+    The output contains as many elements as the input (without dropped
+    classes) and memory is bounded by number of classes * buffersize.
+
+    Note that only classes seen so far are sampled, i.e. ratios are
+    approximated only after elements of all classes have arrived.
+
+    >>> from nutsflow import CountValues
+    >>> from nutsflow.common import StableRandom
+    >>> data = [(i, 'a' if i % 10 else 'b') for i in range(1000)]
+    >>> counts = data >> Balance(1, rand=StableRandom(0)) >> CountValues(1)
+    >>> sorted(counts.items())
+    [('a', 520), ('b', 480)]
+
+    >>> balance = Balance(1, {'a': 1, 'b': 3}, rand=StableRandom(0))
+    >>> counts = data >> balance >> CountValues(1)
+    >>> sorted(counts.items())
+    [('a', 266), ('b', 734)]
+
+    :param iterable iterable: Any iterable
+    :param int|function labelcol: Column index or function that returns
+      the class label of an element.
+    :param dict|None ratios: Dictionary that maps class labels to relative
+      frequencies, e.g. {'a': 1, 'b': 2}. Elements of classes that are
+      not in the dictionary or have a ratio of zero are dropped.
+      If None, all classes are returned with equal frequencies.
+    :param int buffersize: Maximum number of elements stored per class.
+    :param Random|numpy.random.Generator|None rand: Random number generator.
+           If None, a numpy Generator or random.Random() is used
+           (see common.default_rand). Random numbers are drawn in blocks
+           from numpy generators (see common.uniforms).
+    :return: Generator over elements with balanced classes
+    :rtype: generator
+    """
+    if buffersize < 1:
+        raise ValueError('buffersize must be positive: ' + str(buffersize))
+    rand = default_rand() if rand is None else rand
+    us = uniforms(rand)
+    labelfunc = colfunc(labelcol)
+    labels, weights, buffers, total = [], [], {}, 0.0
+    for e in iterable:
+        label = labelfunc(e)
+        if label not in buffers:
+            weight = 1 if ratios is None else ratios.get(label, 0)
+            if weight <= 0:
+                continue
+            labels.append(label)
+            weights.append(weight)
+            buffers[label] = []
+            total += weight
+        buffer = buffers[label]
+        if len(buffer) < buffersize:
+            buffer.append(e)
+        else:
+            buffer[min(int(next(us) * buffersize), buffersize - 1)] = e
+
+        r, i = next(us) * total, 0
+        while r >= weights[i] and i < len(weights) - 1:
+            r -= weights[i]
+            i += 1
+        buffer = buffers[labels[i]]
+        yield buffer[min(int(next(us) * len(buffer)), len(buffer) - 1)]
+
+
+def _flush_bucket(path, b, block):
+    """Append pickled block of elements to bucket file. See ShuffleExternal"""
+    fpath = osp.join(path, 'bucket_{0:06d}.pkl'.format(b))
+    with open(fpath, 'ab') as f:
+        pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+
+
+@nut_processor
+def ShuffleExternal(iterable, buckets=16, rand=None, tmpdir=None, cache=None,
+                    blocksize=1024):
+    """
+    iterable >> ShuffleExternal(buckets=16, rand=None, tmpdir=None,
+                                cache=None, blocksize=1024)
+
+    Global shuffle of elements for iterables that do not fit into memory.
+    In contrast to Shuffle(), which shuffles only within a window of
+    buffersize elements, the result is a uniformly random permutation of
+    all elements. In a first pass elements are scattered into randomly
+    chosen buckets on disk, in the second pass buckets are loaded,
+    shuffled in memory and returned one after another. Memory consumption
+    is bounded by the size of the largest bucket (about n/buckets elements)
+    plus blocksize elements per bucket. Elements must be pickable.
+
+    >>> from nutsflow.common import StableRandom
+    >>> range(10) >> ShuffleExternal(2, StableRandom(0)) >> Collect()
+    [8, 9, 6, 2, 0, 4, 1, 7, 3, 5]
+
+    Bucket files can be stored in a temporary folder owned by a Cache and
+    are then deleted when the cache is cleared, even if the shuffle is
+    interrupted:
+
+    .. code:: python
+
+        with Cache() as cache:
+            for epoch in range(10):
+                data >> cache >> ShuffleExternal(cache=cache) >> Consume()
+
+    :param iterable iterable: Any iterable
+    :param int buckets: Number of buckets on disk.
+    :param Random|numpy.random.Generator|None rand: Random number generator.
+           If None, a numpy Generator or random.Random() is used
+           (see common.default_rand).
+    :param str|None tmpdir: Folder for temporary bucket files.
+           If None the system default is used.
+    :param Cache|None cache: Delete bucket files when this cache is
+           cleared (see Cache.tempdir).
+    :param int blocksize: Number of elements per bucket that are buffered
+           in memory before they are written to disk.
+    :return: Iterator over shuffled elements
+    :rtype: iterator
+    """
+    rand = default_rand() if rand is None else rand
+    if cache is not None:
+        path = cache.tempdir('shuffle_', tmpdir)
+    else:
+        path = tempfile.mkdtemp(prefix='shuffle_', dir=tmpdir)
+    try:
+        blocks = [[] for _ in range(buckets)]
+        for e, b in zip(iterable, randindices(rand, buckets)):
+            blocks[b].append(e)
+            if len(blocks[b]) >= blocksize:
+                _flush_bucket(path, b, blocks[b])
+                blocks[b] = []
+        for b, block in enumerate(blocks):
+            if block:
+                _flush_bucket(path, b, block)
+        del blocks
+        for fname in sorted(os.listdir(path)):
+            bucket = []
+            with open(osp.join(path, fname), 'rb') as f:
+                while True:
+                    try:
+                        bucket.extend(pickle.load(f))
+                    except EOFError:
+                        break
+            rand.shuffle(bucket)
+            for e in bucket:
+                yield e
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
 @nut_processor
 def MapCol(iterable, columns, func):
     """
@@ -987,13 +2586,15 @@ def MapCol(iterable, columns, func):
 
 
 @nut_processor
-def MapMulti(iterable, *funcs):
+def MapMulti(iterable, *funcs, **kwargs):
     """
-    iterable >> MapMulti(*funcs)
+    iterable >> MapMulti(*funcs, max_bytes=None, sizer=None)
 
     Map multiple functions on iterable. For each function a separate iterable
     is returned. Can consume large amounts of memory when iterables are
-    processed sequentially!
+    processed sequentially! Memory can be limited by max_bytes, in which
+    case a BufferError is raised if the buffered elements exceed the limit,
+    see Tee().
 
     >>> from nutsflow import Collect, _
     
@@ -1009,47 +2610,137 @@ def MapMulti(iterable, *funcs):
 
     :param iterable iterable: Any iterable
     :param functions funcs: Functions to map
+    :param kwargs kwargs: max_bytes (maximum memory of buffered elements in
+      bytes) and sizer (function that returns the size of an element).
     :return: Iterators for each function
     :rtype: (iterator, ...)
     """
-    tees = itt.tee(iterable, len(funcs))
+    tees = itf.tee(iterable, len(funcs), **kwargs)
     return [map(f, t) for f, t in zip(funcs, tees)]
 
 
+def _timed_call(func, x):
+    """
+    Return result of func(x) with start and end time and process id.
+
+    Top-level function to be pickable. Used by MapPar when tracing.
+
+    :param function func: Function to call
+    :param object x: Argument of function
+    :return: Tuple (result, start time, end time, process id)
+    :rtype: tuple
+    """
+    start = time.time()
+    result = func(x)
+    return result, start, time.time(), os.getpid()
+
+
 # Don't use @nut_processor here. Creating Pool is expensive!
 # ParMap is of limited use since 'func' must be pickable many objects are not :(
 # pathos.multiprocesssing might be an alternative
 class MapPar(Nut):
-    def __init__(self, func, chunksize=mp.cpu_count()):
+    def __init__(self, func, chunksize=mp.cpu_count(), max_chunksize=1024):
         """
-        iterable >> MapPar(func, chunksize=mp.cpu_count())
+        iterable >> MapPar(func, chunksize=mp.cpu_count(), max_chunksize=1024)
 
         Map function in parallel. Order of iterable is preserved.
         Note that ParMap is of limited use since 'func' must be pickable
         and only top level functions (not class methods) are pickable. See
         https://docs.python.org/2/library/pickle.html
 
+        Number of buffered results and the times downstream nuts waited
+        for results (consumer wait) and the pool was idle while results
+        were consumed (producer blocked) are recorded in mappar.stats, see
+        nutsflow.profiler.BufferStats. If a tracer is active
+        (see nutsflow.profiler.Trace) when MapPar is created, spans for
+        dispatches to the pool and for the function calls within the worker
+        processes are recorded as well.
+
+        For chunksize=AUTOTUNE the chunk size starts at the number of CPUs
+        and is doubled (up to max_chunksize) as long as the throughput
+        increases by more than 10%. The chosen value is available in
+        mappar.chunksize.
+
         >>> from nutsflow import Collect
         >>> [-1, -2, -3] >> MapPar(abs) >> Collect()
         [1, 2, 3]
 
+        >>> from nutsflow.common import AUTOTUNE
+        >>> mappar = MapPar(abs, AUTOTUNE)
+        >>> [-1, -2, -3] >> mappar >> Collect()
+        [1, 2, 3]
+        >>> mappar.chunksize  # doctest: +SKIP
+        16
+
         :param iterable iterable: Any iterable
         :param function func: Function to map
-        :param int chunksize: Number of parallel processes to use for mapping.
+        :param int chunksize: Number of elements processed in parallel
+          per call of the process pool or AUTOTUNE.
+        :param int max_chunksize: Maximum chunk size if chunksize is AUTOTUNE.
         :return: Iterator over mapped elements
         :rtype: iterator
         """
         self.pool = mp.Pool(processes=mp.cpu_count())
         self.func = func
-        self.chunksize = chunksize
+        self.autotune = chunksize is AUTOTUNE
+        self.chunksize = mp.cpu_count() if self.autotune else chunksize
+        self.max_chunksize = max_chunksize
+        self.tracer = active_tracer()
+        self.stats = BufferStats('MapPar', self.chunksize)
+        self._best_rate = 0.0
+
+    def _tune(self, n, duration, gain=1.1):
+        """
+        Double chunk size while throughput increases.
+
+        Tuning stops at the first chunk size that does not increase the
+        throughput by the given gain and the previous chunk size is
+        restored if it had the higher throughput.
+
+        :param int n: Number of elements in processed chunk.
+        :param float duration: Time in seconds to process chunk.
+        :param float gain: Minimum factor throughput has to increase.
+        """
+        if n < self.chunksize or duration <= 0:
+            return  # last (partial) chunk
+        rate = n / duration
+        if rate > gain * self._best_rate:
+            self._best_rate = rate
+            if self.chunksize < self.max_chunksize:
+                self.chunksize = min(2 * self.chunksize, self.max_chunksize)
+                self.stats.capacity = self.chunksize
+                return
+        elif rate < self._best_rate:
+            self.chunksize //= 2
+            self.stats.capacity = self.chunksize
+        self.autotune = False
 
     def __rrshift__(self, iterable):
-        it = iter(iterable)
-        results = 1
+        tracer, stats, it = self.tracer, self.stats, iter(iterable)
+        func = self.func
+        if tracer:
+            func = functools.partial(_timed_call, func)
+        results, yielded = 1, None
         while results:
-            sliced = itt.islice(it, self.chunksize)
-            results = self.pool.map(self.func, sliced)
-            for r in results:
+            start = time.time()
+            if yielded is not None:  # pool was idle while results consumed
+                stats.producer_blocked += start - yielded
+            results = self.pool.map(func, itt.islice(it, self.chunksize))
+            end = time.time()
+            n = len(results)
+            if self.autotune:
+                self._tune(n, end - start)
+            if tracer:
+                tracer.span('MapPar.map', start, end, cat='pool', n=n)
+                for _, rstart, rend, pid in results:
+                    tracer.span('MapPar.func', rstart, rend, cat='pool',
+                                pid=pid, tid=pid)
+                results = [r[0] for r in results]
+            for _ in range(n):
+                stats.put(n)
+            yielded = time.time()
+            for i, r in enumerate(results):
+                stats.get(n - i, 0.0 if i else end - start)
                 yield r
 
 
@@ -1116,15 +2807,36 @@ class Cache(Nut):
         """
         self.path = None
         self.pick = pick
+        self._tempdirs = []
         self._cachepath = cachepath
         self._clearcache = clearcache
         if clearcache and cachepath and os.path.exists(cachepath):
             shutil.rmtree(cachepath)  # delete it.
 
     def clear(self):
-        """Clear cache"""
+        """Clear cache and delete temporary folders"""
         shutil.rmtree(self.path, ignore_errors=True)
         self.path = None
+        for path in self._tempdirs:
+            shutil.rmtree(path, ignore_errors=True)
+        self._tempdirs = []
+
+    def tempdir(self, prefix='tmp', dir=None):
+        """
+        Return new temporary folder that is deleted when cache is cleared.
+
+        Allows other nuts, e.g. ShuffleExternal, to tie the life time of
+        their temporary files to the cache.
+
+        :param str prefix: Prefix of folder name.
+        :param str|None dir: Parent folder. If None the system default
+           is used.
+        :return: Path to temporary folder.
+        :rtype: str
+        """
+        path = tempfile.mkdtemp(prefix=prefix, dir=dir)
+        self._tempdirs.append(path)
+        return path
 
     def _fpath(self, idx):
         """
@@ -1144,7 +2856,8 @@ class Cache(Nut):
         :rtype: list of strings
         """
         path = self._cachepath if self._cachepath else self.path
-        fpaths = sorted(osp.join(path, n) for n in os.listdir(path))
+        fpaths = sorted(osp.join(path, n) for n in os.listdir(path)
+                        if n.startswith('cache_'))
         return fpaths >> Pick(self.pick) >> Collect()
 
     def _create_cache(self):
@@ -1210,12 +2923,19 @@ class Cache(Nut):
 
 
 @nut_processor
-def Prefetch(iterable, num_prefetch=1):
+def Prefetch(iterable, num_prefetch=1, max_prefetch=64, max_bytes=None,
+             sizer=None):
     """
-    iterable >> Prefetch(num_prefetch=1)
+    iterable >> Prefetch(num_prefetch=1, max_prefetch=64, max_bytes=None,
+                         sizer=None)
 
     Prefetch elements from iterable.
     Typically used to keep the CPU busy while the GPU is crunching.
+    For num_prefetch=AUTOTUNE the number of prefetched elements is adjusted
+    at runtime, see PrefetchIterator for details. The chosen value is
+    available in iterator.num_prefetch.
+    If max_bytes is provided, prefetching is paused while the prefetched
+    elements occupy more than max_bytes of memory.
 
     >>> from nutsflow import Take, Consume
     >>> it = iter([1, 2, 3, 4])
@@ -1223,12 +2943,26 @@ def Prefetch(iterable, num_prefetch=1):
     >>> next(it)   # doctest: +SKIP
     3
 
+    >>> from nutsflow.common import AUTOTUNE
+    >>> it = [1, 2, 3] >> Prefetch(AUTOTUNE)
+    >>> it >> Collect()
+    [1, 2, 3]
+    >>> it.num_prefetch  # doctest: +SKIP
+    4
+
     :param iterable iterable: Any iterable
-    :param int num_prefetch: Number of elements to prefetch.
+    :param int num_prefetch: Number of elements to prefetch or AUTOTUNE.
+    :param int max_prefetch: Maximum number of elements to prefetch
+      if num_prefetch is AUTOTUNE.
+    :param int|None max_bytes: Maximum memory of prefetched elements in
+      bytes. None means no limit.
+    :param function|None sizer: Function that returns the size of an
+      element in bytes. If None nutsflow.common.sizeof is used.
     :return: Iterator over input elements
     :rtype: iterator
     """
-    return itf.PrefetchIterator(iterable, num_prefetch)
+    return itf.PrefetchIterator(iterable, num_prefetch, max_prefetch,
+                                max_bytes, sizer)
 
 
 class PrintProgress(Nut):
@@ -0,0 +1,626 @@
+"""
+.. module:: profiler
+   :synopsis: Profiling of the stages (nuts) of a flow.
+"""
+from __future__ import print_function, division
+
+import os
+import six
+import json
+import time
+
+import weakref
+
+import threading as t
+import itertools as itt
+import collections as cl
+
+from timeit import default_timer
+from nutsflow.base import Nut, NutSink, NutSource
+
+_tracer = None  # currently active Trace
+_buffers = weakref.WeakValueDictionary()  # live BufferStats by creation id
+_bufferids = itt.count()
+_buffernames = cl.defaultdict(int)
+
+StageStats = cl.namedtuple('StageStats', 'name, time, n_in, n_out, rate')
+"""Statistics for a single stage of a profiled flow"""
+
+
+def _nut_name(nut):
+    """
+    Return name of nut, e.g. 'Map' for Map(f)
+
+    :param Nut nut: Any nut
+    :return: Name of the nut (class).
+    :rtype: str
+    """
+    return type(nut).__name__
+
+
+class _Stage(object):
+    """Accumulates timing and element counts for a single stage."""
+
+    def __init__(self, name):
+        """
+        Constructor.
+
+        :param str name: Name of stage.
+        """
+        self.name = name
+        self.upstream = None  # stage producing the input of this stage
+        self.issink = False
+        self.time = 0.0  # time of sampled calls, including upstream time
+        self.calls = 0
+        self.sampled = 0
+        self.n_in = 0
+        self.n_out = 0
+
+    def inclusive_time(self):
+        """
+        Return estimated time spent in stage including upstream time.
+
+        :return: Time in seconds extrapolated from sampled calls.
+        :rtype: float
+        """
+        if not self.sampled:
+            return 0.0
+        return self.time * self.calls / self.sampled
+
+    def exclusive_time(self):
+        """
+        Return estimated time spent in stage excluding upstream time.
+
+        :return: Time in seconds.
+        :rtype: float
+        """
+        uptime = self.upstream.inclusive_time() if self.upstream else 0.0
+        return max(0.0, self.inclusive_time() - uptime)
+
+
+class _ProfiledIterator(six.Iterator):
+    """Iterator that counts and (sampled) times calls to next()"""
+
+    def __init__(self, iterator, stage, sample):
+        """
+        Constructor.
+
+        :param iterator iterator: Output iterator of a stage.
+        :param _Stage stage: Stage statistics are recorded for.
+        :param int sample: Every sample'th call of next() is timed.
+        """
+        self.iterator = iterator
+        self.stage = stage
+        self.sample = sample
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        stage = self.stage
+        stage.calls += 1
+        if stage.calls % self.sample:
+            e = next(self.iterator)
+        else:
+            start = default_timer()
+            try:
+                e = next(self.iterator)
+            finally:
+                stage.time += default_timer() - start
+                stage.sampled += 1
+        stage.n_out += 1
+        return e
+
+
+def _count(iterable, stage):
+    """Return generator over iterable that counts input elements of stage"""
+    for e in iterable:
+        stage.n_in += 1
+        yield e
+
+
+class _ProfiledSource(object):
+    """
+    Wraps a source and records statistics while the source is iterated.
+
+    Not derived from Nut, since '>>' with a profiled nut on the right side
+    would not call __rrshift__ of the nut if both had the same type.
+    """
+
+    def __init__(self, source, stage, sample):
+        self.source = source
+        self.stage = stage
+        self.sample = sample
+
+    def __iter__(self):
+        return _ProfiledIterator(iter(self.source), self.stage, self.sample)
+
+
+def _upstream(iterable):
+    """Return stage of profiled iterable or None if not profiled"""
+    if isinstance(iterable, (_ProfiledIterator, _ProfiledSource)):
+        return iterable.stage
+    return None
+
+
+class _ProfiledNut(Nut):
+    """Wraps a nut and records statistics while the nut is running"""
+
+    def __init__(self, nut, stage, sample):
+        self.nut = nut
+        self.stage = stage
+        self.sample = sample
+
+    def __rrshift__(self, iterable):
+        stage = self.stage
+        stage.upstream = _upstream(iterable) or stage.upstream
+        result = _count(iterable, stage) >> self.nut
+        if hasattr(result, '__next__') or hasattr(result, 'next'):
+            return _ProfiledIterator(result, stage, self.sample)
+        stage.issink = True  # result of sink already computed
+        return result
+
+
+class _ProfiledSink(_ProfiledNut):
+    """Wraps a sink and times its (single) call"""
+
+    def __rrshift__(self, iterable):
+        stage = self.stage
+        stage.issink = True
+        stage.upstream = _upstream(iterable) or stage.upstream
+        start = default_timer()
+        try:
+            return _count(iterable, stage) >> self.nut
+        finally:
+            stage.time += default_timer() - start
+            stage.calls += 1
+            stage.sampled += 1
+
+
+class Profile(object):
+    """
+    Profiler for the stages of a flow.
+
+    Nuts wrapped by the profiler record the time spent within the stage
+    (exclusive of the time spent in profiled upstream stages), the number
+    of elements read and produced and the resulting throughput.
+
+    >>> from nutsflow import Range, Map, Filter, Collect
+    >>> prof = Profile()
+    >>> (Range(10) >> prof(Map(lambda x: x * 2)) >>
+    ...  prof(Filter(lambda x: x > 5)) >> prof(Collect()))
+    [6, 8, 10, 12, 14, 16, 18]
+
+    >>> [(s.name, s.n_in, s.n_out) for s in prof.stats()]
+    [('map', 10, 10), ('filter', 10, 7), ('Collect', 7, 0)]
+
+    Stages are identified by name and statistics of stages with the same name
+    are accumulated, e.g. over several epochs. Provide names to distinguish
+    stages of the same type:
+
+    .. code::
+
+      with Profile() as prof:
+          for epoch in range(10):
+             (samples >> prof(Map(load), 'load') >> prof(Map(augment), 'aug')
+              >> prof(Consume()))
+      print(prof)
+
+      stage   time[s]      in     out    items/s
+      load     12.305   10000   10000      812.7
+      aug       2.102   10000   10000     4757.4
+      consume   0.004   10000       0  2500000.0
+      total    14.411
+
+    Timing can be sampled to reduce overhead, e.g. Profile(sample=10) times
+    only every 10th element and extrapolates. Counts are always exact.
+    A disabled profiler, e.g. Profile(enabled=False) returns the nuts
+    unchanged and has no overhead.
+    """
+
+    def __init__(self, sample=1, enabled=True):
+        """
+        Constructor.
+
+        :param int sample: Time every sample'th element only.
+        :param bool enabled: True: profile wrapped nuts,
+           False: return nuts unchanged.
+        """
+        if sample < 1:
+            raise ValueError('sample must be >= 1: ' + str(sample))
+        self.sample = sample
+        self.enabled = enabled
+        self.walltime = None
+        self._stages = cl.OrderedDict()
+        self._start = None
+
+    def __call__(self, nut, name=None):
+        """
+        Return profiled nut.
+
+        :param Nut nut: Nut (processor, function, source, sink) to profile.
+        :param str|None name: Name of stage. If None the name of the nut
+           is used.
+        :return: Nut that records statistics when running. Sources are
+           wrapped in an iterable that records statistics when iterated.
+        :rtype: Nut|iterable
+        """
+        if not self.enabled:
+            return nut
+        name = _nut_name(nut) if name is None else name
+        if name not in self._stages:
+            self._stages[name] = _Stage(name)
+        stage = self._stages[name]
+        if isinstance(nut, NutSink):
+            return _ProfiledSink(nut, stage, self.sample)
+        if isinstance(nut, NutSource):
+            return _ProfiledSource(nut, stage, self.sample)
+        return _ProfiledNut(nut, stage, self.sample)
+
+    def __enter__(self):
+        """Context manager API. Starts measuring of wall time."""
+        self._start = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        """Context manager API. Stops measuring of wall time."""
+        self.walltime = default_timer() - self._start
+
+    def clear(self):
+        """Clear all recorded statistics"""
+        self._stages.clear()
+        self.walltime = None
+
+    def stats(self):
+        """
+        Return statistics for all profiled stages.
+
+        :return: List of stage statistics in order of wrapping with fields
+          name, time (exclusive time in seconds), n_in (number of input
+          elements), n_out (number of output elements) and
+          rate (input elements per second or output elements per second
+          for sources).
+        :rtype: list of StageStats
+        """
+        stats = []
+        for stage in self._stages.values():
+            time = stage.exclusive_time()
+            n = stage.n_in if stage.n_in or stage.issink else stage.n_out
+            rate = n / time if time else float('inf')
+            stats.append(
+                StageStats(stage.name, time, stage.n_in, stage.n_out, rate))
+        return stats
+
+    def __str__(self):
+        """
+        Return statistics as formatted table.
+
+        :return: Table with stage statistics.
+        :rtype: str
+        """
+        stats = self.stats()
+        width = max([len(s.name) for s in stats] + [5])
+        fmt = '{:<%d} {:>9} {:>9} {:>9} {:>12}' % width
+        lines = [fmt.format('stage', 'time[s]', 'in', 'out', 'items/s')]
+        for s in stats:
+            lines.append(fmt.format(s.name, '%.3f' % s.time, s.n_in, s.n_out,
+                                    '%.1f' % s.rate))
+        if self.walltime is not None:
+            lines.append(fmt.format('total', '%.3f' % self.walltime, '', '',
+                                    ''))
+        return '\n'.join(lines)
+
+
+def active_tracer():
+    """
+    Return currently active tracer.
+
+    Used by buffering and parallel nuts such as Prefetch or MapPar to
+    report spans for queue waits and pool dispatches. Nuts retrieve the
+    tracer at construction time, which avoids any overhead if tracing is
+    not active.
+
+    :return: Active tracer or None if no tracer is active.
+    :rtype: Trace|None
+    """
+    return _tracer
+
+
+class _TracedIterator(six.Iterator):
+    """Iterator that records a span for each call of next()"""
+
+    def __init__(self, iterator, tracer, name):
+        """
+        Constructor.
+
+        :param iterator iterator: Output iterator of a stage.
+        :param Trace tracer: Tracer spans are recorded with.
+        :param str name: Name of stage.
+        """
+        self.iterator = iterator
+        self.tracer = tracer
+        self.name = name
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.time()
+        e = next(self.iterator)
+        self.tracer.span(self.name, start, time.time())
+        return e
+
+
+class _TracedSource(object):
+    """
+    Wraps a source and records spans while the source is iterated.
+    Not derived from Nut for the same reason as _ProfiledSource.
+    """
+
+    def __init__(self, source, tracer, name):
+        self.source = source
+        self.tracer = tracer
+        self.name = name
+
+    def __iter__(self):
+        return _TracedIterator(iter(self.source), self.tracer, self.name)
+
+
+class _TracedNut(Nut):
+    """Wraps a nut and records spans while the nut is running"""
+
+    def __init__(self, nut, tracer, name):
+        self.nut = nut
+        self.tracer = tracer
+        self.name = name
+
+    def __rrshift__(self, iterable):
+        if isinstance(self.nut, NutSink):
+            start = time.time()
+            try:
+                return iterable >> self.nut
+            finally:
+                self.tracer.span(self.name, start, time.time())
+        result = iterable >> self.nut
+        if hasattr(result, '__next__') or hasattr(result, 'next'):
+            return _TracedIterator(result, self.tracer, self.name)
+        return result
+
+
+class Trace(object):
+    """
+    Tracer that records the execution of a flow over wall-clock time
+    and writes it in Chrome Trace Event format. Trace files can be
+    viewed with chrome://tracing or https://ui.perfetto.dev
+
+    Nuts wrapped by the tracer record a span for the processing of each
+    element. In addition, Prefetch and MapPar nuts created while the tracer
+    is active record spans for fetching elements, waiting on their queues
+    and dispatching to worker processes, which allows to distinguish
+    producer starvation (long waits for elements) from consumer starvation
+    (long waits for free queue slots).
+
+    .. code::
+
+      with Trace('trace.json') as trace:
+          (samples >> trace(Map(load), 'load') >> Prefetch(4) >>
+           trace(Map(train), 'train') >> Consume())
+
+    >>> from nutsflow import Range, Map, Collect
+    >>> with Trace() as trace:
+    ...     Range(3) >> trace(Map(lambda x: x * 2), 'double') >> Collect()
+    [0, 2, 4]
+    >>> [e['name'] for e in trace.events]
+    ['double', 'double', 'double']
+    """
+
+    def __init__(self, filepath=None):
+        """
+        Constructor.
+
+        :param str|None filepath: Path to JSON file the trace is written to
+          when the context manager exits. If None the trace is not written
+          but events are available in trace.events.
+        """
+        self.filepath = filepath
+        self.events = []
+        self.pid = os.getpid()
+        self._threadnames = {}
+        self._previous = None
+
+    def __call__(self, nut, name=None):
+        """
+        Return traced nut.
+
+        :param Nut nut: Nut (processor, function, source, sink) to trace.
+        :param str|None name: Name of spans. If None the name of the nut
+           is used.
+        :return: Nut that records spans when running. Sources are
+           wrapped in an iterable that records spans when iterated.
+        :rtype: Nut|iterable
+        """
+        name = _nut_name(nut) if name is None else name
+        if isinstance(nut, NutSource):
+            return _TracedSource(nut, self, name)
+        return _TracedNut(nut, self, name)
+
+    def __enter__(self):
+        """Context manager API. Activates tracer."""
+        global _tracer
+        self._previous, _tracer = _tracer, self
+        return self
+
+    def __exit__(self, *args):
+        """Context manager API. Deactivates tracer and writes trace file."""
+        global _tracer
+        _tracer = self._previous
+        if self.filepath:
+            self.save(self.filepath)
+
+    def span(self, name, start, end, cat='stage', pid=None, tid=None,
+             **args):
+        """
+        Record a span (complete event).
+
+        :param str name: Name of span
+        :param float start: Start time in seconds, see time.time()
+        :param float end: End time in seconds, see time.time()
+        :param str cat: Category of span, e.g. 'stage', 'queue', 'pool'
+        :param int|None pid: Process id. If None the id of the
+           current process is used.
+        :param int|None tid: Thread id. If None the id of the current thread
+           is used.
+        :param kwargs args: Additional arguments shown for the span.
+        """
+        if tid is None:
+            thread = t.current_thread()
+            tid = thread.ident
+            self._threadnames[tid] = thread.name
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': start * 1e6,
+                 'dur': (end - start) * 1e6, 'pid': pid or self.pid,
+                 'tid': tid}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def save(self, filepath):
+        """
+        Write trace in Chrome Trace Event JSON format.
+
+        :param str filepath: Path to JSON file.
+        """
+        meta = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                 'tid': tid, 'args': {'name': name}}
+                for tid, name in self._threadnames.items()]
+        with open(filepath, 'w') as f:
+            json.dump({'traceEvents': meta + self.events,
+                       'displayTimeUnit': 'ms'}, f)
+
+
+class BufferStats(object):
+    """
+    Counters for buffering nuts such as Prefetch or MapPar.
+
+    Records the number of elements put into and taken out of the buffer,
+    the average and peak depth of the buffer, the time producers were
+    blocked because the buffer was full and the time consumers waited
+    because the buffer was empty. Buffering nuts create their stats
+    automatically and they can be retrieved via buffer_stats() at any time
+    during a run.
+
+    >>> from nutsflow import Range, Prefetch, Collect
+    >>> it = Range(5) >> Prefetch(2)
+    >>> it >> Collect()
+    [0, 1, 2, 3, 4]
+    >>> snapshot = it.stats.snapshot()
+    >>> snapshot['n_put'], snapshot['n_get'], snapshot['capacity']
+    (5, 5, 2)
+    """
+
+    def __init__(self, kind, capacity=None):
+        """
+        Constructor.
+
+        :param str kind: Kind of buffer, e.g. 'Prefetch'. Used to create
+          unique name of buffer, e.g. 'Prefetch-1'
+        :param int|None capacity: Capacity of buffer. None if unknown or
+          unlimited.
+        """
+        _buffernames[kind] += 1
+        self.name = '{}-{}'.format(kind, _buffernames[kind])
+        self.capacity = capacity
+        self.n_put = 0
+        self.n_get = 0
+        self.depth_sum = 0
+        self.peak = 0
+        self.producer_blocked = 0.0
+        self.consumer_wait = 0.0
+        _buffers[next(_bufferids)] = self
+
+    def put(self, depth, wait=0.0):
+        """
+        Record that an element was put into the buffer.
+
+        :param int depth: Depth of buffer after put.
+        :param float wait: Time in seconds producer was blocked.
+        """
+        self.n_put += 1
+        self.producer_blocked += wait
+        if depth > self.peak:
+            self.peak = depth
+
+    def get(self, depth, wait=0.0):
+        """
+        Record that an element was taken out of the buffer.
+
+        :param int depth: Depth of buffer before get.
+        :param float wait: Time in seconds consumer waited.
+        """
+        self.n_get += 1
+        self.depth_sum += depth
+        self.consumer_wait += wait
+
+    def snapshot(self):
+        """
+        Return current values of counters.
+
+        :return: Dictionary with keys name, capacity, n_put, n_get,
+          avg_depth, peak_depth, producer_blocked (seconds) and
+          consumer_wait (seconds).
+        :rtype: dict
+        """
+        n = self.n_get
+        return {'name': self.name, 'capacity': self.capacity,
+                'n_put': self.n_put, 'n_get': n,
+                'avg_depth': self.depth_sum / n if n else 0.0,
+                'peak_depth': self.peak,
+                'producer_blocked': self.producer_blocked,
+                'consumer_wait': self.consumer_wait}
+
+
+def buffer_stats():
+    """
+    Return snapshots of the stats of all buffering nuts still alive.
+
+    :return: List of snapshots in order of creation. See
+       BufferStats.snapshot() for details.
+    :rtype: list of dict
+    """
+    items = sorted(_buffers.items(), key=lambda item: item[0])
+    return [stats.snapshot() for _, stats in items]
+
+
+def bottleneck(snapshots=None):
+    """
+    Return summary of the bottleneck of a flow with buffering nuts.
+
+    A buffer that is mostly empty has consumers waiting for elements and
+    the bottleneck is upstream of the buffer. A buffer that is mostly full
+    blocks its producers and the bottleneck is downstream of the buffer.
+    The buffer with the largest imbalance between the two wait times
+    determines the bottleneck.
+
+    >>> snapshots = [{'name': 'Prefetch-1', 'producer_blocked': 0.1,
+    ...               'consumer_wait': 2.5, 'avg_depth': 0.1}]
+    >>> print(bottleneck(snapshots))  # doctest: +NORMALIZE_WHITESPACE
+    bottleneck is upstream of Prefetch-1 (consumers waited 2.50s,
+    producers blocked 0.10s, average depth 0.1)
+
+    :param list|None snapshots: Snapshots of buffer stats. If None
+        buffer_stats() is used.
+    :return: Summary text
+    :rtype: str
+    """
+    snapshots = buffer_stats() if snapshots is None else snapshots
+    if not snapshots:
+        return 'no buffering nuts'
+    imbalance = lambda s: abs(s['consumer_wait'] - s['producer_blocked'])
+    s = max(snapshots, key=imbalance)
+    if not imbalance(s):
+        return 'no bottleneck detected'
+    side = 'upstream' if s['consumer_wait'] > s['producer_blocked'] else \
+        'downstream'
+    fmt = ('bottleneck is {} of {} (consumers waited {:.2f}s, producers '
+           'blocked {:.2f}s, average depth {:.1f})')
+    return fmt.format(side, s['name'], s['consumer_wait'],
+                      s['producer_blocked'], s['avg_depth'])
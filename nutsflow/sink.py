@@ -8,14 +8,25 @@ import sys
 import csv
 import math
 import six
+import heapq
+import shutil
+import tempfile
 
+import os.path as osp
+import itertools as itt
+import multiprocessing as mp
 import collections as cl
 
+from six.moves import cPickle as pickle
 from six.moves import reduce, zip, range
 from nutsflow.base import NutSink
 from nutsflow.factory import nut_sink
-from nutsflow.common import as_tuple, is_iterable, colfunc
-from nutsflow.iterfunction import nth, consume, length, take
+from nutsflow.common import (as_tuple, is_iterable, colfunc, default_rand,
+                             uniforms)
+from nutsflow.iterfunction import (nth, consume, length, take, chunked,
+                                  merge_sorted)
+from nutsflow.sketch import (KLLSketch, HyperLogLog, SpaceSaving,
+                             _nearest_rank)
 
 
 @nut_sink
@@ -56,6 +67,154 @@ def Sort(iterable, key=None, reverse=False):
     return sorted(iterable, key=colfunc(key), reverse=reverse)
 
 
+def _write_run(args):
+    """
+    Sort elements of a run and write them to a run file.
+
+    Top-level function to be pickable. Used by SortExternal.
+
+    :param tuple args: Tuple (run, key, reverse, filepath) with run being
+      a list of elements, key a column index(es), function or None.
+    :return: Filepath of run file
+    :rtype: str
+    """
+    run, key, reverse, filepath = args
+    run.sort(key=colfunc(key), reverse=reverse)
+    with open(filepath, 'wb') as f:
+        for block in chunked(run, 1024):
+            pickle.dump(list(block), f, pickle.HIGHEST_PROTOCOL)
+    return filepath
+
+
+def _read_run(filepath):
+    """
+    Return generator over elements in run file.
+
+    :param str filepath: Path to run file
+    :return: Generator over elements
+    :rtype: generator
+    """
+    with open(filepath, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            for e in block:
+                yield e
+
+
+class _MergedRuns(six.Iterator):
+    """
+    Iterator that merges sorted runs. Used by SortExternal.
+
+    Run files are deleted when the iterator is exhausted, closed or
+    garbage collected, even if it has never been started.
+    """
+
+    def __init__(self, tmpdir, filepaths, key, reverse):
+        """
+        Constructor.
+
+        :param str tmpdir: Folder with run files. Deleted when done.
+        :param list filepaths: Paths of run files.
+        :param int|tuple|function|None key: Key function or column
+           index(es).
+        :param bool reverse: True: runs are sorted in descending order.
+        """
+        self.tmpdir = tmpdir
+        runs = [_read_run(fp) for fp in filepaths]
+        self.merged = merge_sorted(runs, colfunc(key), reverse)
+
+    def __iter__(self):
+        """Return iterator itself"""
+        return self
+
+    def __next__(self):
+        """Return next element of merged runs"""
+        try:
+            return next(self.merged)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        """Stop merging and delete run files"""
+        self.merged = iter([])
+        if self.tmpdir:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            self.tmpdir = None
+
+    def __del__(self):
+        """Delete run files when garbage collected"""
+        self.close()
+
+
+@nut_sink
+def SortExternal(iterable, key=None, reverse=False, runsize=100000,
+                 tmpdir=None, workers=0):
+    """
+    iterable >> SortExternal(key=None, reverse=False, runsize=100000,
+                             tmpdir=None, workers=0)
+
+    Sorts iterable that is too large for memory with respect to key
+    function or column index(es). Sorted runs of runsize elements are
+    written to temporary files, which are lazily merged.
+    Sort is stable and returns an iterator. Temporary files are deleted
+    when the iterator is exhausted, closed or garbage collected.
+    Memory consumption is bounded by runsize elements (times the number
+    of workers) plus one block of elements per run while merging.
+
+    >>> [3, 1, 2] >> SortExternal(runsize=2) >> Collect()
+    [1, 2, 3]
+
+    >>> [3, 1, 2] >> SortExternal(reverse=True, runsize=2) >> Collect()
+    [3, 2, 1]
+
+    >>> ['a3', 'c1', 'b2'] >> SortExternal(1, runsize=1) >> Collect()
+    ['c1', 'b2', 'a3']
+
+    :param iterable iterable: Iterable
+    :param int|tuple|function|None key: function to sort based on or
+           column index(es) tuples/vectors/strings are sorted by.
+    :param boolean reverse: True: reverse order.
+    :param int runsize: Number of elements sorted in memory.
+    :param str|None tmpdir: Folder for temporary run files. If None the
+           system default is used.
+    :param int workers: Number of worker processes to sort runs in parallel.
+           0 sorts runs in the current process. Note that elements and
+           key must be pickable for workers > 0, e.g. a column index but
+           not a lambda function.
+    :return: Iterator over sorted elements
+    :rtype: iterator
+    """
+    runs = chunked(iterable, runsize)
+    first = list(next(runs, []))
+    second = next(runs, None)
+    if second is None:  # fits into memory
+        return iter(sorted(first, key=colfunc(key), reverse=reverse))
+    runs = itt.chain([first, second], runs)
+    tmpdir = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        fpath = lambda i: osp.join(tmpdir, 'run_{0:06d}.pkl'.format(i))
+        args = ((list(run), key, reverse, fpath(i))
+                for i, run in enumerate(runs))
+        if workers:
+            pool = mp.Pool(workers)
+            try:
+                filepaths = []
+                for batch in chunked(args, workers):
+                    filepaths.extend(pool.map(_write_run, batch))
+            finally:
+                pool.close()
+        else:
+            filepaths = [_write_run(a) for a in args]
+    except Exception:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    return _MergedRuns(tmpdir, filepaths, key, reverse)
+
+
 @nut_sink
 def Sum(iterable, key=None):
     """
@@ -155,6 +314,75 @@ def MeanStd(iterable, key=None, default=None, ddof=1):
     return avg, dev
 
 
+@nut_sink
+def Quantiles(iterable, qs, key=None, accuracy=0.01, exact=False,
+              default=None, retsketch=False):
+    """
+    iterable >> Quantiles(qs, key=None, accuracy=0.01, exact=False,
+                          default=None, retsketch=False)
+
+    Return quantiles of inputs (transformed or extracted by key function).
+    By default quantiles are approximated by a mergeable KLL sketch
+    (see nutsflow.sketch.KLLSketch) that requires only a few kilobytes of
+    memory, independent of the length of the iterable. For less than
+    about 2/accuracy inputs results are exact. Quantiles are computed
+    using the nearest-rank method.
+
+    >>> [3, 1, 4, 1, 5, 9, 2, 6] >> Quantiles(0.5)
+    3
+
+    >>> [3, 1, 4, 1, 5, 9, 2, 6] >> Quantiles([0.0, 0.25, 0.5, 1.0])
+    [1, 1, 3, 9]
+
+    >>> [] >> Quantiles(0.5, default=0)
+    0
+
+    >>> data = [(1, 10), (2, 30), (3, 20)]
+    >>> data >> Quantiles(0.5, key=1)
+    20
+
+    Sketches of different flows (e.g. processed in parallel) can be
+    merged and queried later
+
+    >>> s1 = [1, 2, 3] >> Quantiles(0.5, retsketch=True)
+    >>> s2 = [4, 5] >> Quantiles(0.5, retsketch=True)
+    >>> s1.merge(s2).quantiles([0.5])
+    [3]
+
+    :param iterable iterable: Iterable over numbers or other comparable
+           values.
+    :param float|list|tuple qs: Quantile in [0, 1], e.g. 0.5 for the median,
+           or list of quantiles.
+    :param int|tuple|function|None key: Key function to extract or
+           transform elements. None = identity function.
+    :param float accuracy: Approximate rank error of the computed quantiles.
+           Memory consumption grows with 1/accuracy.
+    :param bool exact: True: compute exact quantiles by sorting all inputs,
+           which requires memory for all inputs. Ignored if
+           retsketch is True.
+    :param object default: Value returned if iterable is empty.
+    :param bool retsketch: True: return the KLLSketch instead of the
+           quantiles. Sketches can be merged and queried.
+    :return: Value at quantile or list of values if qs is a list or tuple.
+             KLLSketch if retsketch is True.
+    :rtype: object | list | KLLSketch
+    """
+    values = map(colfunc(key), iterable)
+    if exact and not retsketch:
+        items = [(v, 1) for v in sorted(values)]
+    else:
+        sketch = KLLSketch(int(math.ceil(2.0 / accuracy))).update(values)
+        if retsketch:
+            return sketch
+        items = sketch.items()
+    multiple = isinstance(qs, (list, tuple))
+    qs = qs if multiple else [qs]
+    if not items:
+        return [default] * len(qs) if multiple else default
+    quantiles = _nearest_rank(items, qs)
+    return quantiles if multiple else quantiles[0]
+
+
 @nut_sink
 def Max(iterable, key=None, default=None):
     """
@@ -324,6 +552,238 @@ def ArgMin(iterable, key=None, default=None, retvalue=False):
         return default
 
 
+def _batch_candidates(iterable, k, key, largest):
+    """
+    Return generator over (score, row) candidates of array batches.
+
+    Uses argpartition to reduce each batch to its k best rows.
+
+    :param iterable iterable: Iterable over array batches, e.g. numpy arrays
+    :param int k: Number of elements to select.
+    :param int|function|None key: Column index or vectorized function that
+           maps a batch to a 1D array of scores. None: batch are the scores.
+    :param bool largest: True: select largest, False: smallest scores.
+    :return: Generator over candidates
+    :rtype: generator
+    """
+    for batch in iterable:
+        if key is None:
+            scores = batch
+        elif isinstance(key, int):
+            scores = batch[:, key]
+        else:
+            scores = key(batch)
+        n = len(scores)
+        if n > k:
+            if largest:
+                idxs = scores.argpartition(n - k)[n - k:]
+            else:
+                idxs = scores.argpartition(k - 1)[:k]
+            idxs.sort()
+        else:
+            idxs = range(n)
+        for i in idxs:
+            yield scores[i], batch[i]
+
+
+def _topk(iterable, k, key, largest, batches):
+    """Return k largest or smallest elements. See TopK, BottomK"""
+    if k <= 0:
+        return []
+    select = heapq.nlargest if largest else heapq.nsmallest
+    if not batches:
+        return select(k, iterable, key=colfunc(key))
+    candidates = _batch_candidates(iterable, k, key, largest)
+    return [row for _, row in select(k, candidates, key=lambda c: c[0])]
+
+
+@nut_sink
+def TopK(iterable, k, key=None, batches=False):
+    """
+    iterable >> TopK(k, key=None, batches=False)
+
+    Return the k largest elements (transformed or extracted by key function)
+    in descending order. Equivalent to Sort(key, reverse=True) >> Head(k)
+    but runs in O(n log k) time and O(k) memory. Ties are resolved in
+    favor of elements that come first.
+
+    >>> [1, 5, 2, 4, 3] >> TopK(2)
+    [5, 4]
+
+    >>> ['12', '1', '123'] >> TopK(2, key=len)
+    ['123', '12']
+
+    >>> data = [(3, 10), (2, 30), (1, 20)]
+    >>> data >> TopK(2, key=1)
+    [(2, 30), (1, 20)]
+
+    >>> import numpy as np
+    >>> batches = [np.array([3, 1, 7]), np.array([5, 9, 0])]
+    >>> [int(e) for e in batches >> TopK(3, batches=True)]
+    [9, 7, 5]
+
+    :param iterable iterable: Iterable over elements or array batches
+    :param int k: Number of elements to return.
+    :param int|tuple|function|None key: Key function to extract or
+           transform elements. None = identity function.
+           If batches=True key must be None, a column index or a
+           vectorized function that maps a batch to a 1D array of scores.
+    :param bool batches: True: elements are array batches (e.g. numpy
+           arrays) and the k largest rows over all batches are returned.
+           Batches are reduced to k candidates via argpartition.
+    :return: List with k largest elements
+    :rtype: list
+    """
+    return _topk(iterable, k, key, True, batches)
+
+
+@nut_sink
+def BottomK(iterable, k, key=None, batches=False):
+    """
+    iterable >> BottomK(k, key=None, batches=False)
+
+    Return the k smallest elements (transformed or extracted by key function)
+    in ascending order. Equivalent to Sort(key) >> Head(k) but runs in
+    O(n log k) time and O(k) memory. Ties are resolved in favor of
+    elements that come first.
+
+    >>> [1, 5, 2, 4, 3] >> BottomK(2)
+    [1, 2]
+
+    >>> data = [(3, 10), (2, 30), (1, 20)]
+    >>> data >> BottomK(2, key=1)
+    [(3, 10), (1, 20)]
+
+    >>> import numpy as np
+    >>> batches = [np.array([[3, 1], [7, 0]]), np.array([[5, 2]])]
+    >>> [r.tolist() for r in batches >> BottomK(2, key=1, batches=True)]
+    [[7, 0], [3, 1]]
+
+    :param iterable iterable: Iterable over elements or array batches
+    :param int k: Number of elements to return.
+    :param int|tuple|function|None key: Key function to extract or
+           transform elements. None = identity function.
+           If batches=True key must be None, a column index or a
+           vectorized function that maps a batch to a 1D array of scores.
+    :param bool batches: True: elements are array batches (e.g. numpy
+           arrays) and the k smallest rows over all batches are returned.
+           Batches are reduced to k candidates via argpartition.
+    :return: List with k smallest elements
+    :rtype: list
+    """
+    return _topk(iterable, k, key, False, batches)
+
+
+def _log(u):
+    """Return log(u) with u clipped to the open interval ]0, 1["""
+    return math.log(min(max(u, 1e-300), 1.0 - 1e-16))
+
+
+def _reservoir(iterable, k, rand):
+    """
+    Return k elements sampled uniformly via reservoir sampling.
+
+    Implements Algorithm L (Li, 1994), which draws the number of elements
+    to skip between replacements and therefore needs only
+    O(k * (1 + log(n/k))) random numbers. Slots that are never replaced
+    keep the input order and the reservoir is therefore shuffled.
+
+    :param iterable iterable: Any iterable
+    :param int k: Number of samples
+    :param Random|numpy.random.Generator rand: Random number generator.
+    :return: List with samples in random order
+    :rtype: list
+    """
+    iterator = iter(iterable)
+    reservoir = list(itt.islice(iterator, k))
+    if len(reservoir) < k or not k:
+        rand.shuffle(reservoir)
+        return reservoir
+    us = uniforms(rand, 64)
+    w = math.exp(_log(next(us)) / k)
+    while True:
+        skip = min(sys.maxsize, int(_log(next(us)) / math.log1p(-w)))
+        picked = list(itt.islice(iterator, skip, skip + 1))
+        if not picked:
+            rand.shuffle(reservoir)
+            return reservoir
+        reservoir[min(int(next(us) * k), k - 1)] = picked[0]
+        w *= math.exp(_log(next(us)) / k)
+
+
+def _reservoir_weighted(iterable, k, weight, rand):
+    """
+    Return k elements sampled without replacement proportional to weights.
+
+    Implements Algorithm A-ExpJ (Efraimidis and Spirakis, 2006) with
+    exponential jumps. Keys u^(1/w) are stored as logarithms.
+
+    :param iterable iterable: Any iterable
+    :param int k: Number of samples
+    :param function weight: Function that returns weight of element.
+    :param Random|numpy.random.Generator rand: Random number generator.
+    :return: List with samples in order of decreasing keys
+    :rtype: list
+    """
+    us = uniforms(rand, 64)
+    heap, x = [], 0.0
+    for i, e in enumerate(iterable):
+        w = weight(e)
+        if w <= 0:
+            continue
+        if len(heap) < k:
+            heapq.heappush(heap, (_log(next(us)) / w, i, e))
+            x = _log(next(us)) / heap[0][0]
+            continue
+        x -= w
+        if x <= 0:
+            tw = math.exp(heap[0][0] * w)
+            r = tw + next(us) * (1.0 - tw)
+            heapq.heapreplace(heap, (_log(r) / w, i, e))
+            x = _log(next(us)) / heap[0][0]
+    return [e for _, _, e in sorted(heap, reverse=True)]
+
+
+@nut_sink
+def Sample(iterable, k, weight=None, rand=None):
+    """
+    iterable >> Sample(k, weight=None, rand=None)
+
+    Return k randomly sampled elements (without replacement) using
+    reservoir sampling. Requires only one pass over the iterable and
+    O(k) memory. If the iterable has less than k elements all elements
+    are returned. The order of the samples is random. Samples are only
+    known after the last element. For streaming use Pick() instead.
+
+    >>> from nutsflow.common import StableRandom
+    >>> range(100) >> Sample(3, rand=StableRandom(0))
+    [77, 65, 84]
+
+    >>> data = [('a', 1), ('b', 0), ('c', 10), ('d', 5)]
+    >>> data >> Sample(2, weight=1, rand=StableRandom(0))
+    [('c', 10), ('d', 5)]
+
+    :param iterable iterable: Any iterable
+    :param int k: Number of samples to return.
+    :param int|function|None weight: Column index or function that
+      returns the (non-negative) weight of an element. If None, elements
+      are sampled uniformly (Algorithm L), otherwise with probabilities
+      proportional to their weights (Algorithm A-ExpJ). Elements with
+      zero weight are never sampled.
+    :param Random|numpy.random.Generator|None rand: Random number generator.
+        If None, a numpy Generator or random.Random() is used
+        (see common.default_rand).
+    :return: List with k samples
+    :rtype: list
+    """
+    if k < 0:
+        raise ValueError('k must not be negative: ' + str(k))
+    rand = default_rand() if rand is None else rand
+    if weight is None:
+        return _reservoir(iterable, k, rand)
+    return _reservoir_weighted(iterable, k, colfunc(weight), rand)
+
+
 Reduce = nut_sink(reduce, 1)
 """
 iterable >> Reduce(func [,initiaizer])
@@ -498,11 +958,111 @@ def CountValues(iterable, column=None, relative=False):
     cnts = dict(cl.Counter(values))
     if not relative or not cnts.values():
         return cnts
+    return _relative(cnts)
+
+
+def _relative(cnts):
+    """Return counts relative to maximum count. See CountValues"""
     max_cnt = max(cnts.values())
     n = float(max_cnt) if max_cnt else 1.0
     return {k: v / n for k, v in six.iteritems(cnts)}
 
 
+@nut_sink
+def CountDistinct(iterable, column=None, error=0.01, retsketch=False):
+    """
+    iterable >> CountDistinct(column=None, error=0.01, retsketch=False)
+
+    Return approximate number of distinct values in the input iterable.
+    Uses a HyperLogLog sketch (see nutsflow.sketch.HyperLogLog) that
+    requires about 1.1/error^2 bytes of memory (16KB for error=0.01),
+    independent of the number of distinct values.
+
+    >>> 'abaacc' >> CountDistinct()
+    3
+
+    >>> data = [('a', 'X'), ('b', 'Y'), ('a', 'Y')]
+    >>> data >> CountDistinct(column=1)
+    2
+
+    Sketches of different flows (e.g. processed in parallel) can be
+    merged and queried later
+
+    >>> s1 = 'ab' >> CountDistinct(retsketch=True)
+    >>> s2 = 'bc' >> CountDistinct(retsketch=True)
+    >>> s1.merge(s2).count()
+    3
+
+    :param iterable iterable: Any iterable, e.g. list, range, ...
+    :param int|None column: Column of values in iterable to extract values
+       from. If colum=None the values in the iterable themselves are counted.
+    :param float error: Relative standard error of the count.
+    :param bool retsketch: True: return the HyperLogLog sketch instead of
+       the count. Sketches can be merged and queried.
+    :return: Approximate number of distinct values or sketch.
+    :rtype: int | HyperLogLog
+    """
+    values = iterable if column is None else (i[column] for i in iterable)
+    sketch = HyperLogLog(error).update(values)
+    return sketch if retsketch else sketch.count()
+
+
+@nut_sink
+def TopValues(iterable, k, column=None, relative=False, capacity=None,
+              retsketch=False):
+    """
+    iterable >> TopValues(k, column=None, relative=False, capacity=None,
+                          retsketch=False)
+
+    Return dictionary with the (relative) counts of the k most frequent
+    values in the input iterable. In contrast to CountValues memory
+    is bounded by the given capacity. Counts are computed by a
+    Space-Saving sketch (see nutsflow.sketch.SpaceSaving), and
+    are exact if the number of distinct values does not exceed the capacity.
+    Otherwise counts are overestimated by at most n/capacity, where n is
+    the length of the iterable.
+
+    >>> 'abaacc' >> TopValues(2)  # doctest: +SKIP
+    {'a': 3, 'c': 2}
+
+    >>> 'aabaab' >> TopValues(1, relative=True)
+    {'a': 1.0}
+
+    >>> data = [('a', 'X'), ('b', 'Y'), ('a', 'Y')]
+    >>> data >> TopValues(1, column=1)
+    {'Y': 2}
+
+    Sketches of different flows (e.g. processed in parallel) can be
+    merged and queried later
+
+    >>> s1 = 'aab' >> TopValues(1, retsketch=True)
+    >>> s2 = 'bbc' >> TopValues(1, retsketch=True)
+    >>> s1.merge(s2).top(1)
+    [('b', 3)]
+
+    :param iterable iterable: Any iterable, e.g. list, range, ...
+    :param int k: Number of most frequent values to return.
+    :param int|None column: Column of values in iterable to extract values
+       from. If colum=None the values in the iterable themselves are counted.
+    :param bool relative: True: return relative counts otherwise absolute
+       counts
+    :param int|None capacity: Maximum number of counters. Larger capacities
+       give more accurate counts. If None, capacity = max(100, 10*k).
+    :param bool retsketch: True: return the SpaceSaving sketch instead of
+       the counts. Sketches can be merged and queried.
+    :return: Dictionary with (relative) counts for the k most frequent
+       values or sketch.
+    :rtype: dict | SpaceSaving
+    """
+    capacity = max(100, 10 * k) if capacity is None else capacity
+    values = iterable if column is None else (i[column] for i in iterable)
+    sketch = SpaceSaving(max(k, capacity)).update(values)
+    if retsketch:
+        return sketch
+    cnts = dict(sketch.top(k))
+    return _relative(cnts) if relative and cnts else cnts
+
+
 @nut_sink
 def Collect(iterable, container=list):
     """
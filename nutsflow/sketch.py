@@ -0,0 +1,511 @@
+"""
+.. module:: sketch
+   :synopsis: Mergeable data sketches for approximate statistics of streams
+   with bounded memory.
+"""
+from __future__ import print_function, division
+
+import math
+import heapq
+import bisect
+import hashlib
+
+import random as rnd
+import itertools as itt
+
+from six.moves import range
+
+
+def stable_hash(value):
+    """
+    Return 64-bit hash of value that is stable across processes.
+
+    In contrast to hash(), which is randomized for strings, the hash is
+    computed from the repr() of the value and is therefore identical in
+    different processes and runs. Required for mergeable sketches.
+
+    >>> stable_hash('a') == stable_hash('a')
+    True
+
+    >>> stable_hash(1) < 2 ** 64
+    True
+
+    :param object value: Value with a repr() that identifies the value,
+      e.g. a number, string or tuple of those.
+    :return: Hash value
+    :rtype: int
+    """
+    digest = hashlib.md5(repr(value).encode('utf-8')).hexdigest()
+    return int(digest[:16], 16)
+
+
+def _nearest_rank(items, qs):
+    """
+    Return quantiles of weighted items using the nearest-rank method.
+
+    >>> _nearest_rank([(1, 1), (2, 1), (3, 1), (4, 1)], [0.0, 0.5, 1.0])
+    [1, 2, 4]
+
+    :param list items: Sorted list of tuples (value, weight)
+    :param list qs: List of quantiles in [0, 1]
+    :return: List of quantile values
+    :rtype: list
+    """
+    cumweights, total = [], 0
+    for _, w in items:
+        total += w
+        cumweights.append(total)
+    n = len(items) - 1
+    return [items[min(n, bisect.bisect_left(cumweights, q * total))][0]
+            for q in qs]
+
+
+class KLLSketch(object):
+    """
+    Sketch for approximate quantiles with bounded memory.
+
+    Implements the KLL sketch (Karnin, Lang, Liberty, 2016). Values are
+    stored in a hierarchy of compactors, where values on level h have
+    weight 2^h. A full compactor sorts its values and promotes every other
+    value to the next level. Memory consumption is O(k) values, largely
+    independent of the number of values added, and the rank error is
+    approximately 2/k. Results are exact as long as no compaction has
+    occurred, which is the case for less than k values. Sketches are
+    mergeable, e.g. sketches of parallel runs can be combined.
+
+    >>> sketch = KLLSketch()
+    >>> for x in [3, 1, 4, 1, 5, 9, 2, 6]:
+    ...     sketch.add(x)
+    >>> sketch.quantiles([0.0, 0.5, 1.0])
+    [1, 3, 9]
+    """
+
+    def __init__(self, k=200, rand=None):
+        """
+        Constructor.
+
+        :param int k: Size parameter of the sketch. Larger values give
+          more accurate results but require more memory.
+        :param Random|None rand: Random number generator used for
+          compaction. If None, random.Random() is used.
+        """
+        self.k = k
+        self.n = 0
+        self.rand = rnd.Random() if rand is None else rand
+        self.compactors = []
+        self.size = 0
+        self.maxsize = 0
+        self._grow()
+
+    def _capacity(self, h):
+        """Return capacity of compactor on level h"""
+        depth = len(self.compactors) - h - 1
+        return int(math.ceil((2.0 / 3.0) ** depth * self.k)) + 1
+
+    def _grow(self):
+        """Add compactor level"""
+        self.compactors.append([])
+        levels = range(len(self.compactors))
+        self.maxsize = sum(self._capacity(h) for h in levels)
+
+    def _compress(self):
+        """Compact lowest level compactor that is at capacity"""
+        for h, compactor in enumerate(self.compactors):
+            if len(compactor) >= self._capacity(h):
+                if h + 1 == len(self.compactors):
+                    self._grow()
+                compactor.sort()
+                odd = len(compactor) % 2
+                offset = odd + (self.rand.random() < 0.5)
+                self.compactors[h + 1].extend(compactor[offset::2])
+                del compactor[odd:]
+                break
+        self.size = sum(len(c) for c in self.compactors)
+
+    @property
+    def exact(self):
+        """True if no compaction has occurred and results are exact"""
+        return self.size == self.n
+
+    def add(self, value):
+        """
+        Add value to sketch.
+
+        :param object value: Any value that can be compared,
+          typically a number.
+        """
+        self.compactors[0].append(value)
+        self.n += 1
+        self.size += 1
+        if self.size >= self.maxsize:
+            self._compress()
+
+    def update(self, values):
+        """
+        Add values to sketch.
+
+        :param iterable values: Iterable over values.
+        :return: The sketch itself
+        :rtype: KLLSketch
+        """
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """
+        Merge other sketch into this sketch.
+
+        >>> a = KLLSketch().update([1, 2, 3])
+        >>> b = KLLSketch().update([4, 5])
+        >>> a.merge(b).quantiles([0.5])
+        [3]
+
+        :param KLLSketch other: Sketch to merge.
+        :return: The sketch itself
+        :rtype: KLLSketch
+        """
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for compactor, values in zip(self.compactors, other.compactors):
+            compactor.extend(values)
+        self.n += other.n
+        self.size = sum(len(c) for c in self.compactors)
+        while self.size >= self.maxsize:
+            self._compress()
+        return self
+
+    def items(self):
+        """
+        Return sorted values and their weights.
+
+        :return: List of tuples (value, weight) sorted by value.
+        :rtype: list
+        """
+        return sorted((v, 2 ** h) for h, compactor in
+                      enumerate(self.compactors) for v in compactor)
+
+    def quantiles(self, qs):
+        """
+        Return approximate quantiles.
+
+        :param list qs: List of quantiles in [0, 1], e.g. [0.5] for
+          the median.
+        :return: List with values at the given quantiles or None
+          if the sketch is empty.
+        :rtype: list | None
+        """
+        items = self.items()
+        return _nearest_rank(items, qs) if items else None
+
+
+class HyperLogLog(object):
+    """
+    Sketch to approximately count distinct values with bounded memory.
+
+    Implements HyperLogLog (Flajolet et al., 2007) with 2^p one-byte
+    registers. The relative standard error of the count is
+    approximately 1.04/sqrt(2^p), e.g. 1% for p=14 and 16KB of memory.
+    Sketches with the same precision are mergeable.
+
+    >>> hll = HyperLogLog(0.01)
+    >>> hll.update(['a', 'b', 'a', 'c']).count()
+    3
+    """
+
+    def __init__(self, error=0.01):
+        """
+        Constructor.
+
+        :param float error: Relative standard error of the count.
+          Determines the precision p (number of registers) in [4, 18].
+        """
+        p = int(math.ceil(math.log((1.04 / error) ** 2, 2)))
+        self.p = min(18, max(4, p))
+        self.m = 1 << self.p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        """
+        Add value to sketch.
+
+        :param object value: Value to add. See stable_hash().
+        """
+        h = stable_hash(value)
+        idx = h >> (64 - self.p)
+        bits = 64 - self.p
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, values):
+        """
+        Add values to sketch.
+
+        :param iterable values: Iterable over values.
+        :return: The sketch itself
+        :rtype: HyperLogLog
+        """
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """
+        Merge other sketch into this sketch.
+
+        >>> a = HyperLogLog().update([1, 2, 3])
+        >>> b = HyperLogLog().update([3, 4])
+        >>> a.merge(b).count()
+        4
+
+        :param HyperLogLog other: Sketch with same precision to merge.
+        :return: The sketch itself
+        :rtype: HyperLogLog
+        :raise: ValueError if sketches have different precision.
+        """
+        if self.p != other.p:
+            raise ValueError('Cannot merge sketches of different precision')
+        regs = self.registers
+        self.registers = bytearray(max(r1, r2) for r1, r2 in
+                                   zip(regs, other.registers))
+        return self
+
+    def count(self):
+        """
+        Return approximate number of distinct values added.
+
+        :return: Estimated count
+        :rtype: int
+        """
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m,
+                                                       0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+
+class SpaceSaving(object):
+    """
+    Sketch to approximately count the most frequent values (heavy hitters)
+    with bounded memory.
+
+    Implements the Space-Saving algorithm (Metwally et al., 2005) that
+    maintains at most capacity counters. If a new value arrives and all
+    counters are in use, the counter of the least frequent value is
+    assigned to the new value. Counts are overestimated by at most
+    n/capacity, where n is the number of values added, and
+    all values with a frequency larger than n/capacity are guaranteed to
+    be counted. Sketches are mergeable.
+
+    >>> ss = SpaceSaving(2)
+    >>> ss.update('abaacc').top(1)
+    [('a', 3)]
+    """
+
+    def __init__(self, capacity=1000):
+        """
+        Constructor.
+
+        :param int capacity: Maximum number of counters.
+        """
+        self.capacity = capacity
+        self.n = 0
+        self.counts = {}
+        self.errors = {}
+        self._heap = []  # min-heap over (count, id, value), lazily updated
+        self._ids = 0
+
+    def _push(self, value):
+        """Push current count of value on heap"""
+        self._ids += 1
+        heapq.heappush(self._heap, (self.counts[value], self._ids, value))
+        if len(self._heap) > 4 * self.capacity:
+            self._heapify()
+
+    def _heapify(self):
+        """Rebuild heap from counts, removing outdated entries"""
+        self._heap = [(c, i, v) for i, (v, c) in
+                      enumerate(self.counts.items())]
+        self._ids = len(self._heap)
+        heapq.heapify(self._heap)
+
+    def _mincount(self):
+        """Return smallest count if all counters are in use, otherwise 0"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def _pop_min(self):
+        """Remove and return value with smallest count and its count"""
+        while True:
+            count, _, value = heapq.heappop(self._heap)
+            if self.counts.get(value) == count:
+                del self.counts[value]
+                del self.errors[value]
+                return value, count
+
+    def add(self, value, count=1):
+        """
+        Add value to sketch.
+
+        :param object value: Hashable value.
+        :param int count: Number of occurrences of value.
+        """
+        self.n += count
+        if value in self.counts:
+            self.counts[value] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[value] = count
+            self.errors[value] = 0
+        else:
+            _, mincount = self._pop_min()
+            self.counts[value] = mincount + count
+            self.errors[value] = mincount
+        self._push(value)
+
+    def update(self, values):
+        """
+        Add values to sketch.
+
+        :param iterable values: Iterable over values.
+        :return: The sketch itself
+        :rtype: SpaceSaving
+        """
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """
+        Merge other sketch into this sketch.
+
+        >>> a = SpaceSaving(2).update('aab')
+        >>> b = SpaceSaving(2).update('bbbc')
+        >>> a.merge(b).top(1)
+        [('b', 4)]
+
+        :param SpaceSaving other: Sketch to merge.
+        :return: The sketch itself
+        :rtype: SpaceSaving
+        """
+        # Untracked values may have occurred up to min count times
+        # (Agarwal et al., 2012, Mergeable summaries).
+        m1, m2 = self._mincount(), other._mincount()
+        c1, e1, c2, e2 = self.counts, self.errors, other.counts, other.errors
+        counts, errors = {}, {}
+        for value in itt.chain(c1, (v for v in c2 if v not in c1)):
+            counts[value] = c1.get(value, m1) + c2.get(value, m2)
+            errors[value] = e1.get(value, m1) + e2.get(value, m2)
+        self.counts, self.errors = counts, errors
+        self.n += other.n
+        if len(counts) > self.capacity:
+            top = heapq.nlargest(self.capacity, counts.items(),
+                                 key=lambda vc: vc[1])
+            self.counts = dict(top)
+            self.errors = {v: errors[v] for v in self.counts}
+        self._heapify()
+        return self
+
+    def top(self, k=None):
+        """
+        Return most frequent values and their (over)estimated counts.
+
+        :param int|None k: Number of values to return. None: all
+          counted values.
+        :return: List of tuples (value, count) in descending order of count.
+        :rtype: list
+        """
+        k = len(self.counts) if k is None else k
+        return heapq.nlargest(k, self.counts.items(), key=lambda vc: vc[1])
+
+
+class BloomFilter(object):
+    """
+    Compact set of values that may report false positives.
+
+    A Bloom filter (Bloom, 1970) stores values as k bits in a bit array of
+    m bits. Membership tests never report false negatives, but report
+    false positives with probability error_rate as long as no more than
+    capacity values have been added. The filter requires about
+    -1.44*log2(error_rate) bits per value, e.g. 1.8MB for one million
+    values and error_rate=0.001. Filters with the same parameters are
+    mergeable.
+
+    >>> bf = BloomFilter(100, 0.01)
+    >>> bf.add('a')
+    True
+    >>> bf.add('a')
+    False
+    >>> 'a' in bf, 'b' in bf
+    (True, False)
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        """
+        Constructor.
+
+        :param int capacity: Expected maximum number of values.
+        :param float error_rate: Probability of false positives for
+          capacity values.
+        """
+        ln2 = math.log(2)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.m = int(math.ceil(-capacity * math.log(error_rate) / ln2 ** 2))
+        self.k = max(1, int(round(float(self.m) / capacity * ln2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, value):
+        """Return bit positions of value, using double hashing"""
+        h = stable_hash(value)
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def __contains__(self, value):
+        """
+        Return True if value is (probably) contained in filter.
+
+        :param object value: Value to test. See stable_hash().
+        :return: False if value has not been added, True if value has been
+          added or with probability error_rate otherwise.
+        :rtype: bool
+        """
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7))
+                   for p in self._positions(value))
+
+    def add(self, value):
+        """
+        Add value to filter.
+
+        :param object value: Value to add. See stable_hash().
+        :return: True if value was not contained in filter before.
+        :rtype: bool
+        """
+        bits, isnew = self.bits, False
+        for p in self._positions(value):
+            byte, mask = p >> 3, 1 << (p & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                isnew = True
+        return isnew
+
+    def merge(self, other):
+        """
+        Merge other filter into this filter.
+
+        :param BloomFilter other: Filter with same parameters.
+        :return: The filter itself
+        :rtype: BloomFilter
+        :raise: ValueError if filters have different parameters.
+        """
+        if (self.m, self.k) != (other.m, other.k):
+            raise ValueError('Cannot merge filters of different size')
+        self.bits = bytearray(b1 | b2 for b1, b2 in
+                              zip(self.bits, other.bits))
+        return self
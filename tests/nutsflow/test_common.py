@@ -7,7 +7,9 @@ from __future__ import print_function
 
 import sys
 import time
+import random
 
+import pytest
 import numpy as np
 
 from pytest import approx
@@ -17,7 +19,8 @@ from nutsflow import MeanStd
 from nutsflow.common import (sec_to_hms, timestr, Redirect, as_tuple, as_set,
                              as_list, is_iterable, istensor, stype, shapestr,
                              isnan, colfunc, console, itemize, StableRandom,
-                             print_type, Timer)
+                             print_type, Timer, sizeof, default_rand,
+                             uniforms, randindices)
 
 
 def test_isnan():
@@ -180,6 +183,87 @@ def test_StableRandom():
     assert 1.0 == approx(std, abs=0.1)
 
 
+def test_StableRandom_random_block():
+    rnd1, rnd2 = StableRandom(0), StableRandom(0)
+    assert rnd1.random_block(0) == []
+    assert rnd1.random_block(1000) == [rnd2.random() for _ in range(1000)]
+    assert rnd1.random() == rnd2.random()
+
+    rnd1, rnd2 = StableRandom(1), StableRandom(1)
+    assert rnd1.random_block(1500) == [rnd2.random() for _ in range(1500)]
+
+
+def test_StableRandom_jumpahead():
+    for start in [0, 1, 624, 700]:
+        for n in [0, 1, 623, 624, 625, 5000, 30000]:
+            rnd1, rnd2 = StableRandom(0), StableRandom(0)
+            rnd1.random_block(start)
+            rnd2.random_block(start)
+            rnd1.jumpahead(n)
+            rnd2.random_block(n)
+            assert rnd1.random_block(3) == rnd2.random_block(3)
+
+    with pytest.raises(ValueError) as ex:
+        StableRandom(0).jumpahead(-1)
+    assert str(ex.value).startswith('Cannot jump backwards')
+
+
+def test_StableRandom_substream():
+    rnd = StableRandom(0)
+    streams = [rnd.substream(i) for i in range(3)]
+    numbers = [s.random_block(100) for s in streams]
+    assert len(set(sum(numbers, []))) == 300
+    assert rnd.substream(1).random_block(100) == numbers[1]
+    assert rnd.substream(0).random_block(100) == rnd.random_block(100)
+
+    expected = StableRandom(0).random_block(3000)
+    assert StableRandom(0).substream(2, 1000).random_block(1000) == expected[2000:]
+
+
+def test_default_rand():
+    rand = default_rand()
+    assert isinstance(rand, np.random.Generator)
+    assert 0 <= rand.random() < 1
+
+
+def test_uniforms():
+    rnd1, rnd2 = StableRandom(0), StableRandom(0)
+    us = uniforms(rnd1, blocksize=7)
+    assert [next(us) for _ in range(20)] == [rnd2.random() for _ in range(20)]
+    assert rnd1.random() == rnd2.random()  # not advanced by a block
+
+    rnd1, rnd2 = random.Random(0), random.Random(0)
+    us = uniforms(rnd1, blocksize=3)
+    assert [next(us) for _ in range(5)] == [rnd2.random() for _ in range(5)]
+    assert rnd1.random() == rnd2.random()
+
+    us1 = uniforms(np.random.default_rng(0), blocksize=5)
+    us2 = uniforms(np.random.default_rng(0), blocksize=5)
+    numbers = [next(us1) for _ in range(12)]
+    assert numbers == [next(us2) for _ in range(12)]
+    assert all(0 <= u < 1 for u in numbers)
+    assert all(isinstance(u, float) for u in numbers)
+
+
+def test_randindices():
+    rnd1, rnd2 = StableRandom(1), StableRandom(1)
+    idxs = randindices(rnd1, 10, blocksize=3)
+    expected = [rnd2.randint(0, 9) for _ in range(20)]
+    assert [next(idxs) for _ in range(20)] == expected
+    assert rnd1.random() == rnd2.random()
+
+    rnd1, rnd2 = random.Random(0), random.Random(0)
+    idxs = randindices(rnd1, 10)
+    expected = [rnd2.randint(0, 9) for _ in range(20)]
+    assert [next(idxs) for _ in range(20)] == expected
+
+    for rand in [random.Random(0), np.random.default_rng(0)]:
+        idxs = randindices(rand, 3)
+        numbers = [next(idxs) for _ in range(1000)]
+        assert set(numbers) == {0, 1, 2}
+        assert all(isinstance(i, int) for i in numbers)
+
+
 def test_timer():
     t = Timer()
     time.sleep(1.3)
@@ -196,3 +280,13 @@ def test_timer():
     t.stop()
     time.sleep(0.5)
     assert str(t) == '00:01'
+
+
+def test_sizeof():
+    assert sizeof(np.zeros((10, 10), dtype='uint8')) == 100
+    assert sizeof(np.zeros(10)) == 80
+    assert sizeof('abc', len) == 3
+    assert sizeof(1) == sys.getsizeof(1)
+    assert sizeof([1, 2]) == sys.getsizeof([1, 2]) + 2 * sys.getsizeof(1)
+    assert sizeof({'a': np.zeros(10)}) > 80
+    assert sizeof((np.zeros(10), np.zeros(20))) > 240
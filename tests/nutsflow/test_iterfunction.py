@@ -4,6 +4,11 @@
 """
 
 import time
+import pytest
+import threading
+
+import itertools as itt
+
 import nutsflow.iterfunction as itf
 
 from six.moves import range
@@ -23,6 +28,73 @@ def test_interleave():
     assert list(itf.interleave('12', [])) == ['1', '2']
 
 
+def test_parallel_interleave():
+    pi = itf.parallel_interleave
+    assert list(pi([])) == []
+    assert list(pi([[], []])) == []
+    sources = [range(3), 'ab', range(5, 7)]
+    assert list(pi(sources, None, 2)) == [0, 'a', 1, 'b', 2, 5, 6]
+    assert list(pi(sources, None, 1)) == [0, 1, 2, 'a', 'b', 5, 6]
+    assert list(pi(sources, None, 3)) == [0, 'a', 5, 1, 'b', 6, 2]
+    assert list(pi(sources, None, 2, 2)) == [0, 1, 'a', 'b', 2, 5, 6]
+    assert list(pi(sources, None, 1, 1, 3)) == [0, 1, 2, 'a', 'b', 5, 6]
+    assert list(pi(sources, None, 1, prefetch=1)) == [0, 1, 2, 'a', 'b', 5, 6]
+    assert list(pi([3, 2], range)) == [0, 0, 1, 1, 2]
+
+    results = list(pi(sources, None, 2, deterministic=False))
+    assert sorted(map(str, results)) == ['0', '1', '2', '5', '6', 'a', 'b']
+    assert [e for e in results if e in ('a', 'b')] == ['a', 'b']
+
+
+def test_parallel_interleave_concurrent():
+    def slow_source(n):
+        for i in range(3):
+            time.sleep(0.1)
+            yield n
+
+    start = time.time()
+    results = list(itf.parallel_interleave(range(4), slow_source, 4))
+    assert results == [0, 1, 2, 3] * 3
+    assert time.time() - start < 0.9
+
+    start = time.time()
+    it = itf.parallel_interleave([slow_source(0), range(10, 12)],
+                                 deterministic=False)
+    assert next(it) == 10
+    assert time.time() - start < 0.09
+    assert sorted(it) == [0, 0, 0, 11]
+
+
+def test_parallel_interleave_exception():
+    def failing(n):
+        yield n
+        raise ValueError('source failed')
+
+    for deterministic in [True, False]:
+        with pytest.raises(ValueError) as ex:
+            list(itf.parallel_interleave([1, 2], failing,
+                                         deterministic=deterministic))
+        assert str(ex.value) == 'source failed'
+
+
+def test_parallel_interleave_close():
+    nthreads = threading.active_count()
+    sources = [itt.count() for _ in range(3)]
+    for deterministic in [True, False]:
+        it = itf.parallel_interleave(sources, None, 2, num_parallel=3,
+                                     prefetch=1, deterministic=deterministic)
+        next(it)
+        it.close()
+        assert wait_for_threads(nthreads) == nthreads
+
+    def failing(n):
+        raise ValueError('source failed')
+
+    with pytest.raises(ValueError):
+        list(itf.parallel_interleave([sources[0], 1], failing))
+    assert wait_for_threads(nthreads) == nthreads
+
+
 def test_take():
     it = itf.take(range(10), 3)
     assert list(it) == [0, 1, 2]
@@ -47,6 +119,64 @@ def test_unique():
     it = itf.unique(data, key=lambda t: t[1])
     assert list(it) == [(1, 'a'), (3, 'b')]
 
+    with pytest.raises(ValueError) as ex:
+        list(itf.unique([1], mode='invalid'))
+    assert str(ex.value) == 'Invalid mode: invalid'
+
+
+def test_unique_bloom():
+    data = [2, 3, 1, 1, 2, 4]
+    assert list(itf.unique(data, mode='bloom')) == [2, 3, 1, 4]
+    data = list(range(1000)) * 2
+    it = itf.unique(data, mode='bloom', capacity=1000, error_rate=0.01)
+    uniques = list(it)
+    assert uniques == sorted(set(uniques))
+    assert len(uniques) > 950
+    data = [(1, 'a'), (2, 'a'), (3, 'b')]
+    it = itf.unique(data, key=lambda t: t[1], mode='bloom')
+    assert list(it) == [(1, 'a'), (3, 'b')]
+
+
+def test_unique_disk(tmpdir):
+    data = [2, 3, 1, 1, 2, 4]
+    it = itf.unique(data, mode='disk', tmpdir=str(tmpdir))
+    assert list(it) == [2, 3, 1, 4]
+    assert tmpdir.listdir() == []
+    data = [(i % 7, 'x') for i in range(100)]
+    assert list(itf.unique(data, mode='disk')) == data[:7]
+    it = itf.unique(data, key=lambda t: t[1], mode='disk')
+    assert list(it) == [(0, 'x')]
+
+    it = itf.unique(range(10), mode='disk', tmpdir=str(tmpdir))
+    assert next(it) == 0
+    assert len(tmpdir.listdir()) == 1
+    it.close()
+    assert tmpdir.listdir() == []
+
+
+def test_unique_window():
+    data = [1, 2, 1, 2, 3, 1]
+    assert list(itf.unique(data, mode='window', window=1)) == data
+    assert list(itf.unique(data, mode='window', window=2)) == [1, 2, 3, 1]
+    assert list(itf.unique(data, mode='window', window=3)) == [1, 2, 3]
+    data = [(1, 'a'), (2, 'a'), (3, 'b'), (4, 'a')]
+    it = itf.unique(data, key=lambda t: t[1], mode='window', window=1)
+    assert list(it) == [(1, 'a'), (3, 'b'), (4, 'a')]
+
+
+def test_merge_sorted():
+    assert list(itf.merge_sorted([])) == []
+    assert list(itf.merge_sorted([[], []])) == []
+    assert list(itf.merge_sorted([[1, 3], [2]])) == [1, 2, 3]
+    assert list(itf.merge_sorted([[3, 1], [2]], reverse=True)) == [3, 2, 1]
+    data = [[(1, 'b'), (2, 'a')], [(1, 'a')]]
+    it = itf.merge_sorted(data, key=lambda t: t[0])
+    assert list(it) == [(1, 'b'), (1, 'a'), (2, 'a')]
+    it = itf.merge_sorted([[(2, 'a'), (1, 'b')], [(1, 'a')]],
+                          key=lambda t: t[0], reverse=True)
+    assert list(it) == [(2, 'a'), (1, 'b'), (1, 'a')]
+    assert list(itf.merge_sorted([[{1}], [{0}]], key=len)) == [{1}, {0}]
+
 
 def test_chunked():
     it = itf.chunked(range(5), 2)
@@ -56,6 +186,49 @@ def test_chunked():
     assert list(itf.chunked([], 2)) == []
 
 
+def test_chunked_timeout():
+    assert list(itf.chunked_timeout([], 2, 0.1)) == []
+    it = itf.chunked_timeout(range(5), 2, 1.0)
+    assert list(it) == [[0, 1], [2, 3], [4]]
+
+    def trickle():
+        for i in range(3):
+            yield i
+        time.sleep(0.5)
+        yield 3
+
+    start = time.time()
+    it = itf.chunked_timeout(trickle(), 10, 0.1)
+    assert next(it) == [0, 1, 2]
+    assert time.time() - start < 0.4
+    assert next(it) == [3]
+    assert next(it, None) is None
+
+    def failing():
+        yield 1
+        raise ValueError('upstream failed')
+
+    with pytest.raises(ValueError) as ex:
+        list(itf.chunked_timeout(failing(), 3, 0.1))
+    assert str(ex.value) == 'upstream failed'
+
+
+def wait_for_threads(n, timeout=2.0):
+    """Wait until at most n threads are alive and return their number"""
+    deadline = time.time() + timeout
+    while threading.active_count() > n and time.time() < deadline:
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def test_chunked_timeout_close():
+    nthreads = threading.active_count()
+    it = itf.chunked_timeout(itt.count(), 2, 1.0, maxqueue=1)
+    assert next(it) == [0, 1]
+    it.close()
+    assert wait_for_threads(nthreads) == nthreads
+
+
 def test_consume():
     it = iter(range(10))
     itf.consume(it)
@@ -6,11 +6,17 @@ from __future__ import print_function, division
 
 import pytest
 import os
+import time
+import heapq
 
+import random as rnd
+import numpy as np
+
+from pytest import approx
 from six.moves import range
 from nutsflow import *
 from nutsflow import _
-from nutsflow.common import Redirect, StableRandom
+from nutsflow.common import Redirect, StableRandom, AUTOTUNE
 
 
 def test_Take():
@@ -37,6 +43,88 @@ def test_Window():
     assert [1, 2, 3, 4] >> Window(3) >> Collect() == expected
 
 
+def test_Window_stride():
+    data = list(range(10))
+    for n in [1, 2, 3]:
+        for stride in [1, 2, 3, 5]:
+            expected = (data >> Window(n) >> Collect())[::stride]
+            assert data >> Window(n, stride) >> Collect() == expected
+
+    assert [1, 2] >> Window(3, stride=2) >> Collect() == [(1, 2)]
+
+    with pytest.raises(ValueError) as ex:
+        data >> Window(2, stride=0) >> Consume()
+    assert str(ex.value).startswith('stride must be positive')
+
+
+def test_Window_array():
+    data = list(range(3000))
+    for n, stride in [(1, 1), (3, 1), (3, 2), (10, 7), (2000, 500)]:
+        expected = (data >> Window(n) >> Collect())[::stride]
+        windows = data >> Window(n, stride, array=True) >> Collect()
+        assert [tuple(w) for w in windows] == expected
+
+    assert [1, 2] >> Window(3, array=True) >> Collect() == []
+    data = [np.full((2, 3), i) for i in range(5)]
+    windows = data >> Window(2, array=True) >> Collect()
+    assert len(windows) == 4
+    assert windows[1].shape == (2, 2, 3)
+    assert windows[1][:, 0, 0].tolist() == [1, 2]
+
+
+def test_RollingSum():
+    assert [] >> RollingSum(2) >> Collect() == []
+    assert [1] >> RollingSum(2) >> Collect() == []
+    assert [1, 2, 3, 4] >> RollingSum(1) >> Collect() == [1, 2, 3, 4]
+    assert [1, 2, 3, 4] >> RollingSum(2) >> Collect() == [3, 5, 7]
+    data = [(1, 'a'), (2, 'b'), (3, 'c')]
+    assert data >> RollingSum(2, key=0) >> Collect() == [3, 5]
+
+    rand = rnd.Random(0)
+    data = [rand.uniform(-10, 10) for _ in range(1000)]
+    expected = data >> Window(10) >> Map(sum) >> Collect()
+    assert data >> RollingSum(10) >> Collect() == approx(expected)
+
+    with pytest.raises(ValueError) as ex:
+        data >> RollingSum(0) >> Consume()
+    assert str(ex.value).startswith('Window size must be positive')
+
+
+def test_RollingMean():
+    assert [1, 2, 3, 4] >> RollingMean(2) >> Collect() == [1.5, 2.5, 3.5]
+    rand = rnd.Random(1)
+    data = [rand.uniform(-10, 10) for _ in range(1000)]
+    expected = data >> Window(30) >> Map(np.mean) >> Collect()
+    assert data >> RollingMean(30) >> Collect() == approx(expected)
+
+
+def test_RollingStd():
+    rand = rnd.Random(2)
+    data = [rand.uniform(1e6, 1e6 + 1) for _ in range(1000)]
+    for ddof in [0, 1]:
+        std = lambda w: np.std(w, ddof=ddof)
+        expected = data >> Window(20) >> Map(std) >> Collect()
+        stds = data >> RollingStd(20, ddof=ddof) >> Collect()
+        assert stds == approx(expected, rel=1e-6)
+
+    assert [1, 1, 1] >> RollingStd(2) >> Collect() == [0.0, 0.0]
+    with pytest.raises(ValueError) as ex:
+        [1, 2] >> RollingStd(1) >> Consume()
+    assert str(ex.value).startswith('Window size must be larger than ddof')
+
+
+def test_RollingMin_RollingMax():
+    rand = rnd.Random(3)
+    data = [rand.randint(0, 100) for _ in range(1000)]
+    for n in [1, 2, 5, 50]:
+        windows = data >> Window(n) >> Collect()
+        assert data >> RollingMin(n) >> Collect() == [min(w) for w in windows]
+        assert data >> RollingMax(n) >> Collect() == [max(w) for w in windows]
+    data = [(3, 'a'), (1, 'b'), (2, 'c')]
+    assert data >> RollingMax(2, key=0) >> Collect() == [3, 2]
+    assert [] >> RollingMin(2) >> Collect() == []
+
+
 def test_Concat():
     assert [] >> Concat([]) >> Collect() == []
     assert [1, 2] >> Concat([]) >> Collect() == [1, 2]
@@ -51,6 +139,50 @@ def test_Interleave():
     assert '12' >> Interleave('abcd', '+-') >> Collect() == expected
 
 
+def test_ParallelInterleave():
+    assert [] >> ParallelInterleave() >> Collect() == []
+    sources = [[1, 2, 3], [4, 5], [6, 7]]
+    expected = [1, 4, 6, 2, 5, 7, 3]
+    assert sources >> ParallelInterleave() >> Collect() == expected
+    expected = [1, 4, 2, 5, 3, 6, 7]
+    interleave = ParallelInterleave(cycle_length=2)
+    assert sources >> interleave >> Collect() == expected
+    interleave = ParallelInterleave(cycle_length=2, num_parallel=3)
+    assert sources >> interleave >> Collect() == expected
+
+    interleave = ParallelInterleave(Range, 2, deterministic=False)
+    assert sorted([2, 3, 1] >> interleave >> Collect()) == [0, 0, 0, 1, 1, 2]
+
+    interleave = ParallelInterleave(lambda n: [n] * n, 1, block_length=2)
+    assert [1, 3] >> interleave >> Collect() == [1, 3, 3, 3]
+
+
+def test_MergeSorted():
+    assert [] >> MergeSorted() >> Collect() == []
+    assert [] >> MergeSorted([], []) >> Collect() == []
+    assert [1, 2] >> MergeSorted() >> Collect() == [1, 2]
+    assert [1, 4] >> MergeSorted([2, 3], []) >> Collect() == [1, 2, 3, 4]
+    assert [4, 1] >> MergeSorted([3], reverse=True) >> Collect() == [4, 3, 1]
+    assert iter([1, 3]) >> MergeSorted(iter([2])) >> Collect() == [1, 2, 3]
+
+    left, right = [(1, 'a'), (2, 'b')], [(1, 'c'), (2, 'd')]
+    expected = [(1, 'a'), (1, 'c'), (2, 'b'), (2, 'd')]
+    assert left >> MergeSorted(right, key=0) >> Collect() == expected
+    expected = [(2, 'b'), (2, 'd'), (1, 'a'), (1, 'c')]
+    merge = MergeSorted(right[::-1], key=0, reverse=True)
+    assert left[::-1] >> merge >> Collect() == expected
+    expected = [(1, 'a'), (2, 'b')]
+    merge = MergeSorted(right, key=0, dedupe=True)
+    assert left >> merge >> Collect() == expected
+    merge = MergeSorted(right, key=lambda t: t[0], dedupe=True)
+    assert left >> merge >> Collect() == expected
+    assert [1, 1, 2] >> MergeSorted([1, 2], dedupe=True) >> Collect() == [1, 2]
+
+    with pytest.raises(TypeError) as ex:
+        [1, 2] >> MergeSorted([3], keys=0, revers=True)
+    assert str(ex.value) == 'Unexpected keyword arguments: keys, revers'
+
+
 def test_Zip():
     assert [] >> Zip([]) >> Collect() == []
 
@@ -115,6 +247,12 @@ def test_Dedupe():
     assert data >> Dedupe(key=lambda t: t[1]) >> Collect() == expected
     assert data >> Dedupe(_[1]) >> Collect() == expected
 
+    data = [2, 3, 1, 1, 2, 4]
+    for mode in ['bloom', 'disk']:
+        assert data >> Dedupe(mode=mode) >> Collect() == [2, 3, 1, 4]
+    dedupe = Dedupe(mode='window', window=2)
+    assert data >> dedupe >> Collect() == [2, 3, 1, 2, 4]
+
 
 def test_Cycle():
     assert [] >> Cycle() >> Take(5) >> Collect() == []
@@ -128,6 +266,26 @@ def test_Chunk():
     assert Range(7) >> Chunk(2, tuple) >> Collect() == expected
 
 
+def test_Chunk_timeout():
+    expected = [(0, 1), (2, 3), (4, 5), (6,)]
+    chunks = Range(7) >> Chunk(2, timeout=1) >> Map(tuple) >> Collect()
+    assert chunks == expected
+    assert Range(7) >> Chunk(2, tuple, 1) >> Collect() == expected
+
+    def requests():
+        for i in range(4):
+            time.sleep(0.01)
+            yield i
+        time.sleep(0.5)
+        yield 4
+
+    start = time.time()
+    chunks = requests() >> Chunk(100, list, 0.1)
+    assert next(chunks) == [0, 1, 2, 3]
+    assert time.time() - start < 0.4
+    assert chunks >> Collect() == [[4]]
+
+
 def test_ChunkWhen():
     func = lambda x: x == '|'
     assert [] >> ChunkWhen(func) >> Map(list) >> Collect() == []
@@ -139,6 +297,207 @@ def test_ChunkWhen():
     assert '123456' >> ChunkWhen(func, ''.join) >> Collect() == expected
 
 
+def test_ChunkWhen_reuse():
+    chunker = ChunkWhen(lambda x: x == 1, tuple)
+    assert [1, 2, 1, 3] >> chunker >> Collect() == [(1, 2), (1, 3)]
+    assert [1, 2, 1, 3] >> chunker >> Collect() == [(1, 2), (1, 3)]
+    assert [2, 1, 3] >> chunker >> Collect() == [(2,), (1, 3)]
+
+
+def test_TumblingWindow():
+    assert [] >> TumblingWindow(5) >> Collect() == []
+    data = [(0, 'a'), (4, 'b'), (5, 'c'), (17, 'd')]
+    expected = [(0, [(0, 'a'), (4, 'b')]), (5, [(5, 'c')]),
+                (15, [(17, 'd')])]
+    assert data >> TumblingWindow(5) >> Collect() == expected
+
+    data = [(0.5, 1), (1.5, 2), (2.5, 3), (3.5, 4)]
+    aggs = ['count', ('sum', 1), ('mean', 1), ('std', 1)]
+    windows = data >> TumblingWindow(2.0, aggregations=aggs) >> Collect()
+    assert windows[0] == (0.0, (2, 3, 1.5, approx(0.7071, abs=1e-4)))
+    assert windows[1] == (2.0, (2, 7, 3.5, approx(0.7071, abs=1e-4)))
+
+    data = [{'t': 1}, {'t': 2}, {'t': 12}]
+    windows = data >> TumblingWindow(10, lambda e: e['t'], 'count')
+    assert windows >> Collect() == [(0, 2), (10, 1)]
+
+    with pytest.raises(ValueError) as ex:
+        [(1, 2)] >> TumblingWindow(5, aggregations='unknown') >> Consume()
+    assert str(ex.value).startswith('Unknown aggregation')
+    with pytest.raises(ValueError) as ex:
+        [(1, 2)] >> TumblingWindow(0) >> Consume()
+    assert str(ex.value).startswith('Window size and slide must be positive')
+    with pytest.raises(ValueError) as ex:
+        [(1, 2)] >> TumblingWindow(1, lateness=-1) >> Consume()
+    assert str(ex.value).startswith('Lateness must not be negative')
+
+
+def test_TumblingWindow_lateness():
+    data = [(1, 'a'), (7, 'b'), (3, 'c'), (12, 'd'), (4, 'e'), (9, 'f')]
+    windows = data >> TumblingWindow(5, aggregations='count') >> Collect()
+    assert windows == [(0, 1), (5, 1), (10, 1)]
+    windows = data >> TumblingWindow(5, 0, 'count', 3) >> Collect()
+    assert windows == [(0, 2), (5, 2), (10, 1)]
+    windows = data >> TumblingWindow(5, 0, 'count', 8) >> Collect()
+    assert windows == [(0, 3), (5, 2), (10, 1)]
+
+
+def test_TumblingWindow_streaming():
+    def events():
+        for t in range(1000):
+            yield (t, t)
+
+    windows = events() >> TumblingWindow(10, aggregations='count')
+    assert next(iter(windows)) == (0, 10)
+
+    data = ((t, 1) for t in range(100000))
+    windows = data >> TumblingWindow(1000, aggregations=('sum', 1))
+    assert windows >> Map(lambda w: w[1]) >> Collect(set) == {1000}
+
+
+def test_SlidingWindow():
+    assert [] >> SlidingWindow(5, 1) >> Collect() == []
+    data = [(0, 'a'), (1, 'b'), (2, 'c')]
+    expected = [(-1, [(0, 'a')]), (0, [(0, 'a'), (1, 'b')]),
+                (1, [(1, 'b'), (2, 'c')]), (2, [(2, 'c')])]
+    assert data >> SlidingWindow(2, 1) >> Collect() == expected
+
+    data = [(t, t) for t in range(20)]
+    windows = data >> SlidingWindow(10, 5, aggregations=('sum', 1))
+    expected = [(-5, 10), (0, 45), (5, 95), (10, 145), (15, 85)]
+    assert windows >> Collect() == expected
+
+    data = [(0, 'a'), (3, 'b'), (1, 'c'), (9, 'd')]
+    windows = data >> SlidingWindow(4, 2, 0, 'count', lateness=2)
+    assert windows >> Collect() == [(-2, 2), (0, 3), (2, 1), (6, 1), (8, 1)]
+    windows = data >> SlidingWindow(4, 2, 0, 'count')
+    assert windows >> Collect() == [(-2, 1), (0, 3), (2, 1), (6, 1), (8, 1)]
+
+    with pytest.raises(ValueError) as ex:
+        [(1, 2)] >> SlidingWindow(5, 0) >> Consume()
+    assert str(ex.value).startswith('Window size and slide must be positive')
+
+
+def test_Batch():
+    assert [] >> Batch(2) >> Collect() == []
+    samples = [np.full((2, 3), i) for i in range(5)]
+    batches = samples >> Batch(2) >> Collect()
+    assert [b.shape for b in batches] == [(2, 2, 3), (2, 2, 3), (1, 2, 3)]
+    expected = samples >> Chunk(2, list) >> Map(np.stack) >> Collect()
+    for batch, exp in zip(batches, expected):
+        assert np.array_equal(batch, exp)
+
+    batches = samples >> Batch(2, partial=False) >> Collect()
+    assert len(batches) == 2
+
+    batches = [1, 2, 3] >> Batch(3, dtype='float32') >> Collect()
+    assert batches[0].dtype == np.float32
+    assert batches[0].tolist() == [1.0, 2.0, 3.0]
+
+    samples = [np.zeros(3), np.zeros(3), np.zeros(1)]
+    with pytest.raises(ValueError) as ex:
+        samples >> Batch(4) >> Consume()
+    assert str(ex.value) == 'Expected sample of shape (3,) but got (1,)'
+    with pytest.raises(ValueError) as ex:
+        [(1, 2), 3] >> Batch(2) >> Consume()
+    assert str(ex.value) == 'Expected sample of shape (2,) but got ()'
+
+    with pytest.raises(ValueError) as ex:
+        [1, 2, 2.5] >> Batch(2, buffers=2) >> Consume()
+    assert str(ex.value).startswith('Cannot cast sample of type float64')
+    batches = [1, 2, 2.5] >> Batch(2, dtype='float32') >> Collect()
+    assert batches[1].tolist() == [2.5]
+    batches = [1.5, 2] >> Batch(2) >> Collect()
+    assert batches[0].tolist() == [1.5, 2.0]
+
+
+def test_Batch_columns():
+    samples = [(np.ones(2) * i, i, 'label') for i in range(3)]
+    batches = samples >> Batch(2, 1) >> Collect()
+    assert [b.tolist() for b in batches] == [[0, 1], [2]]
+
+    batches = samples >> Batch(2, (1, 0)) >> Collect()
+    ys, xs = batches[0]
+    assert ys.tolist() == [0, 1]
+    assert xs.tolist() == [[0.0, 0.0], [1.0, 1.0]]
+    ys, xs = batches[1]
+    assert ys.tolist() == [2]
+
+    batches = samples >> Batch(3, (0, 1), ('float32', 'int8')) >> Collect()
+    xs, ys = batches[0]
+    assert xs.dtype == np.float32 and ys.dtype == np.int8
+
+
+def test_Batch_buffers():
+    samples = range(8)
+    batches = samples >> Batch(2, buffers=2) >> Collect()
+    assert batches[0] is batches[2]
+    assert batches[1] is batches[3]
+    assert batches[0] is not batches[1]
+    assert batches[0].tolist() == [4, 5]  # overwritten by third batch
+
+    for i, batch in enumerate(samples >> Batch(2, buffers=2)):
+        assert batch.tolist() == [2 * i, 2 * i + 1]
+
+    batches = samples >> Batch(2) >> Collect()
+    assert [b.tolist() for b in batches] == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    assert batches[0] is not batches[2]
+
+
+def test_BucketBatch():
+    assert [] >> BucketBatch(len, [2], 2) >> Collect() == []
+    data = [[1], [1, 2, 3], [2], [4, 5, 6], [7, 8], [9]]
+    batches = data >> BucketBatch(len, [2, 3], 2, pad=None) >> Collect()
+    expected = [[[1], [2]], [[1, 2, 3], [4, 5, 6]], [[9]], [[7, 8]]]
+    assert batches == expected
+
+    batches = data >> BucketBatch(len, [], 3) >> Collect()
+    assert [b.shape for b in batches] == [(3, 3), (3, 3)]
+    assert batches[0].tolist() == [[1, 0, 0], [1, 2, 3], [2, 0, 0]]
+
+    batch = data >> BucketBatch(len, [], 3, dtype='int8') >> Next()
+    assert batch.dtype == np.int8
+    batches = data >> BucketBatch(len, [], 3, pad=-1) >> Collect()
+    assert batches[1].tolist() == [[4, 5, 6], [7, 8, -1], [9, -1, -1]]
+
+    with pytest.raises(ValueError) as ex:
+        data >> BucketBatch(len, [2]) >> Consume()
+    assert str(ex.value).startswith('batchsize or max_tokens must be given')
+
+
+def test_BucketBatch_max_tokens():
+    data = [[1] * n for n in [1, 2, 2, 5, 1, 3, 1, 1]]
+    batches = data >> BucketBatch(len, [], max_tokens=6) >> Collect()
+    assert [b.shape for b in batches] == [(3, 2), (1, 5), (2, 3), (2, 1)]
+    assert all(b.size <= 6 for b in batches)
+
+    batches = data >> BucketBatch(len, [], 2, 6, pad=None) >> Collect()
+    assert [len(b) for b in batches] == [2, 1, 1, 2, 2]
+
+    data = [np.ones((n, 3)) for n in [4, 1, 9, 2]]
+    batches = data >> BucketBatch(len, [3], max_tokens=8) >> Collect()
+    assert [b.shape for b in batches] == [(1, 4, 3), (2, 2, 3), (1, 9, 3)]
+    assert batches[1][0].tolist() == [[1, 1, 1], [0, 0, 0]]
+
+
+def test_BucketBatch_buffers():
+    data = [[1], [1, 2, 3], [2], [4, 5, 6], [7, 8], [9], [3], [4, 5]]
+    expected = [b.tolist() for b in data >> BucketBatch(len, [2], 2)]
+    batches = []
+    for batch in data >> BucketBatch(len, [2], 2, buffers=2):
+        assert batch.flags['C_CONTIGUOUS']
+        batches.append(batch.tolist())
+    assert batches == expected
+    batches = data >> BucketBatch(len, [2], 2, buffers=1) >> Collect()
+    assert np.shares_memory(batches[0], batches[2])  # bucket 0 recycled
+    assert not np.shares_memory(batches[0], batches[1])
+
+    data = [[1, 2, 3], [4], [5, 6], [7, 8, 9, 10]]
+    batchit = data >> BucketBatch(len, [], 1, buffers=1, dtype='int8')
+    for batch, seq in zip(batchit, data):
+        assert batch.tolist() == [seq] and batch.dtype == np.int8
+
+
 def test_ChunkBy():
     func = lambda x: x
     assert [] >> ChunkBy(func) >> Map(list) >> Collect() == []
@@ -261,6 +620,18 @@ def test_Tee():
     assert it1 >> Collect() == [1, 2, 3]
     assert it2 >> Collect() == [1, 2, 3]
 
+    it1, it2, it3 = range(5) >> Tee(3, max_bytes=10, sizer=lambda e: 1)
+    assert it1 >> Collect() == list(range(5))
+    assert it2 >> Collect() == list(range(5))
+    assert it3 >> Collect() == list(range(5))
+
+    it1, it2 = range(5) >> Tee(2, max_bytes=2, sizer=lambda e: 1)
+    assert it1 >> Take(2) >> Collect() == [0, 1]
+    assert it2 >> Take(2) >> Collect() == [0, 1]
+    assert it1 >> Take(2) >> Collect() == [2, 3]
+    with pytest.raises(BufferError):
+        it1 >> Collect()
+
 
 def test_If():
     assert [1, 2, 3] >> If(True, Square()) >> Collect() == [1, 4, 9]
@@ -301,9 +672,13 @@ def test_Pick():
         [1, 2, 3] >> Pick(-1) >> Consume()
     assert str(ex.value).startswith('p_n must not be negative')
 
-    assert Range(5) >> Pick(0.5, StableRandom(1)) >> Collect() == [0, 4]
-    assert Range(5) >> Pick(0.7, StableRandom(0)) >> Collect() == [0, 1, 4]
+    assert Range(5) >> Pick(0.5, StableRandom(1)) >> Collect() == [0]
+    assert Range(5) >> Pick(0.7, StableRandom(0)) >> Collect() == [0, 1, 3]
 
+    rand = np.random.default_rng(0)
+    assert Range(10) >> Pick(0.5, rand) >> Collect() == [1, 2, 3, 4, 7]
+    n = Range(100000) >> Pick(0.01, StableRandom(0)) >> Count()
+    assert 800 < n < 1200
     assert Range(10) >> Pick(1.0) >> Count() == 10
     assert Range(10) >> Pick(0.0) >> Count() == 0
     assert (Range(100) >> Pick(0.3) >> Collect(set)).issubset(set(range(100)))
@@ -317,6 +692,30 @@ def test_Pick():
     assert str(ex.value).startswith('Probability must be in [0, 1]')
 
 
+def test_RunningTopK():
+    assert [] >> RunningTopK(2) >> Collect() == []
+    assert [2, 1, 3] >> RunningTopK(0) >> Collect() == [(), (), ()]
+    expected = [(2,), (2, 1), (3, 2), (3, 2)]
+    assert [2, 1, 3, 0] >> RunningTopK(2) >> Collect() == expected
+    expected = [(2,), (1, 2), (1, 2), (0, 1)]
+    assert [2, 1, 3, 0] >> RunningTopK(2, bottom=True) >> Collect() == expected
+    data = [(1, 'a'), (1, 'b'), (2, 'c')]
+    expected = [((1, 'a'),), ((1, 'a'),), ((2, 'c'),)]
+    assert data >> RunningTopK(1, 0) >> Collect() == expected
+
+    rand = rnd.Random(0)
+    data = [(rand.randint(0, 5), i) for i in range(100)]
+    for bottom, select in [(False, heapq.nlargest), (True, heapq.nsmallest)]:
+        expected, topk = [], []
+        for e in data:
+            topk = select(3, topk + [e], key=lambda x: x[0])
+            expected.append(tuple(topk))
+        assert data >> RunningTopK(3, 0, bottom) >> Collect() == expected
+
+    topks = [3, 2, 1] >> RunningTopK(1) >> Collect()
+    assert topks[1] is topks[0]  # not rebuilt if heap is unchanged
+
+
 def test_GroupBy():
     expected = [(1, [1, 1, 1]), (2, [2]), (3, [3])]
     assert [1, 2, 1, 1, 3] >> GroupBy() >> Collect() == expected
@@ -334,6 +733,157 @@ def test_GroupBy():
     assert [(1, 1), (1, 2), (2, 2)] >> GroupBy(1) >> Collect() == expected
 
 
+def test_GroupBy_buckets(tmpdir):
+    data = [(i % 7, i) for i in range(100)]
+    expected = data >> GroupBy(0) >> Sort()
+    for buckets in [1, 3, 16]:
+        groupby = GroupBy(0, buckets=buckets, chunksize=9, tmpdir=str(tmpdir))
+        assert data >> groupby >> Sort() == expected
+        assert tmpdir.listdir() == []
+    groupby = GroupBy(0, nokey=True, buckets=3)
+    assert data >> groupby >> Sort() == [g for _, g in expected]
+    assert [] >> GroupBy(buckets=2) >> Collect() == []
+
+    it = data >> GroupBy(0, buckets=2, tmpdir=str(tmpdir))
+    assert len(next(it)[1]) in {14, 15}
+    assert len(tmpdir.listdir()) == 1
+    it.close()
+    assert tmpdir.listdir() == []
+
+
+def test_GroupBy_buckets_mixed_keys():
+    data = [1, 1.0, 2, 2.0]
+    expected = [(1, [1, 1.0]), (2, [2, 2.0])]
+    assert data >> GroupBy() >> Sort() == expected
+    assert data >> GroupBy(buckets=4) >> Sort() == expected
+    data = [(1, 'a'), (1.0, 'a'), (True, 'a')]
+    assert data >> GroupBy(nokey=True, buckets=4) >> Collect() == [data]
+
+
+def test_GroupBy_buckets_workers():
+    data = [(i % 7, i) for i in range(1000)]
+    expected = data >> GroupBy(0) >> Sort()
+    groupby = GroupBy(0, buckets=4, workers=2, chunksize=50)
+    assert data >> groupby >> Sort() == expected
+
+
+def test_JoinOn():
+    labels = [(1, 'a'), (2, 'b'), (2, 'c')]
+    samples = [('x', 2), ('y', 3), ('z', 1)]
+    assert [] >> JoinOn(labels) >> Collect() == []
+    expected = [(('x', 2), (2, 'b')), (('x', 2), (2, 'c')),
+                (('z', 1), (1, 'a'))]
+    assert samples >> JoinOn(labels, 1, 0) >> Collect() == expected
+    assert iter(samples) >> JoinOn(iter(labels), 1, 0) >> Collect() == expected
+    join = JoinOn(labels, lambda t: t[1], _[0])
+    assert samples >> join >> Collect() == expected
+    expected = [(('x', 2), (2, 'b')), (('x', 2), (2, 'c')),
+                (('y', 3), 0), (('z', 1), (1, 'a'))]
+    join = JoinOn(labels, 1, 0, how='left', default=0)
+    assert samples >> join >> Collect() == expected
+
+    expected = [((2, 'b'), ('x', 2)), ((2, 'c'), ('x', 2)),
+                ((1, 'a'), ('z', 1))]
+    assert labels >> JoinOn(samples, 0, 1) >> Sort() == sorted(expected)
+
+    left = [(1, 2, 'l1'), (1, 3, 'l2')]
+    right = [(3, 1, 'r1'), (2, 1, 'r2')]
+    expected = [((1, 2, 'l1'), (2, 1, 'r2')), ((1, 3, 'l2'), (3, 1, 'r1'))]
+    assert left >> JoinOn(right, (0, 1), (1, 0)) >> Collect() == expected
+
+    with pytest.raises(ValueError) as ex:
+        samples >> JoinOn(labels, how='outer')
+    assert str(ex.value) == 'Invalid join: outer'
+
+
+def test_JoinOn_buckets(tmpdir):
+    left = [(i, i % 10) for i in range(100)]
+    right = [(i, str(i)) for i in range(5)] * 2
+    for how in ['inner', 'left']:
+        expected = left >> JoinOn(right, 1, 0, how=how) >> Sort()
+        join = JoinOn(right, 1, 0, how=how, buckets=3, tmpdir=str(tmpdir),
+                      chunksize=7)
+        assert left >> join >> Sort() == expected
+        assert tmpdir.listdir() == []
+
+    left, right = [(1, 'a'), (2, 'b')], [(1.0, 'x'), (2.0, 'y')]
+    expected = [((1, 'a'), (1.0, 'x')), ((2, 'b'), (2.0, 'y'))]
+    assert left >> JoinOn(right, buckets=4) >> Sort() == expected
+
+
+def test_MergeJoin():
+    labels = [(1, 'a'), (2, 'b'), (2, 'c'), (4, 'd')]
+    samples = [('x', 0), ('y', 2), ('z', 2), ('w', 3), ('v', 4)]
+    assert [] >> MergeJoin(labels) >> Collect() == []
+    assert samples >> MergeJoin([], 1, 0) >> Collect() == []
+    expected = [(('y', 2), (2, 'b')), (('y', 2), (2, 'c')),
+                (('z', 2), (2, 'b')), (('z', 2), (2, 'c')),
+                (('v', 4), (4, 'd'))]
+    assert samples >> MergeJoin(labels, 1, 0) >> Collect() == expected
+    join = MergeJoin(iter(labels), 1, 0)
+    assert iter(samples) >> join >> Collect() == expected
+    expected = samples >> JoinOn(labels, 1, 0, how='left') >> Collect()
+    join = MergeJoin(labels, 1, 0, how='left')
+    assert samples >> join >> Collect() == expected
+    join = MergeJoin(labels, 1, 0, how='left', default=())
+    assert samples >> join >> Head(1) == [(('x', 0), ())]
+
+    with pytest.raises(ValueError) as ex:
+        samples >> MergeJoin(labels, how='outer') >> Collect()
+    assert str(ex.value) == 'Invalid join: outer'
+
+
+def test_GroupByAgg():
+    assert [] >> GroupByAgg() >> Collect() == []
+    expected = [(1, 3), (2, 1), (3, 1)]
+    assert [1, 2, 1, 1, 3] >> GroupByAgg() >> Collect() == expected
+    assert [1, 2, 1, 1, 3] >> GroupByAgg(nokey=True) >> Collect() == [3, 1, 1]
+    expected = [(2, 2), (3, 1)]
+    assert ['--', '+++', '**'] >> GroupByAgg(len) >> Collect() == expected
+
+    data = [('a', 1), ('b', 4), ('a', 3), ('a', 5)]
+    aggs = ['count', ('sum', 1), ('min', 1), ('max', 1), ('mean', 1),
+            ('var', 1), ('std', 1)]
+    expected = [('a', (3, 9, 1, 5, 3.0, 4.0, 2.0)),
+                ('b', (1, 4, 4, 4, 4.0, None, None))]
+    assert data >> GroupByAgg(0, aggs) >> Collect() == expected
+    aggs = [('var', 1), (lambda a, x: x, 1)]
+    result = data >> GroupByAgg(0, aggs, ddof=0) >> Collect()
+    assert result == [('a', (pytest.approx(8.0 / 3), 5)), ('b', (0.0, 4))]
+    expected = [('a', 9), ('b', 4)]
+    agg = (lambda a, x: a + x, 1)
+    assert data >> GroupByAgg(0, agg) >> Collect() == expected
+    expected = [('a', 18), ('b', 8)]
+    agg = ('sum', lambda t: t[1] * 2)
+    assert data >> GroupByAgg(0, agg) >> Collect() == expected
+
+    with pytest.raises(ValueError) as ex:
+        data >> GroupByAgg(0, 'median') >> Collect()
+    assert str(ex.value) == 'Unknown aggregation: median'
+
+
+def test_GroupByAgg_numkeys():
+    rand = rnd.Random(0)
+    data = [(rand.randint(0, 9), rand.gauss(0, 1)) for _ in range(1000)]
+    aggs = ['count', ('sum', 1), ('min', 1), ('max', 1), ('mean', 1),
+            ('var', 1), ('std', 1)]
+    expected = data >> GroupByAgg(0, aggs) >> Sort()
+    result = data >> GroupByAgg(0, aggs, numkeys=10, chunksize=64) >> Collect()
+    assert [k for k, _ in result] == list(range(10))
+    for (_, r), (_, e) in zip(result, expected):
+        assert r == pytest.approx(e)
+
+    data = [(0, 1), (3, 2)]
+    expected = [(0, (1, None)), (3, (1, None))]
+    aggs = ['count', ('var', 1)]
+    assert data >> GroupByAgg(0, aggs, numkeys=5) >> Collect() == expected
+    assert data >> GroupByAgg(0, numkeys=5, nokey=True) >> Collect() == [1, 1]
+
+    with pytest.raises(ValueError) as ex:
+        data >> GroupByAgg(0, (max, 1), numkeys=5) >> Collect()
+    assert str(ex.value).startswith('Custom reducers not supported')
+
+
 def test_GroupBySorted():
     @nut_sink
     def KV2List(iterable):
@@ -378,10 +928,110 @@ def test_Shuffle():
 
     assert data >> Shuffle(1) >> Collect() == data
 
+    for rand in [rnd.Random(0), np.random.default_rng(0)]:
+        shuffled = data >> Shuffle(10, rand=rand) >> Collect()
+        assert shuffled != data and sorted(shuffled) == data
+
     shuffled1 = data >> Shuffle(10, rand=StableRandom(0)) >> Collect()
     shuffled2 = data >> Shuffle(10, rand=StableRandom(0)) >> Collect()
     assert shuffled1 == shuffled2
 
+    # seeded random.Random draws the same indices as rand.randint()
+    rand = rnd.Random(0)
+    buffer, expected = list(range(5)), []
+    rand.shuffle(buffer)
+    for e in range(5, 20):
+        i = rand.randint(0, 4)
+        expected.append(buffer[i])
+        buffer[i] = e
+    expected += buffer
+    assert Range(20) >> Shuffle(5, rnd.Random(0)) >> Collect() == expected
+
+
+def test_Shuffle_max_bytes():
+    data = list(range(50))
+    shuffled = data >> Shuffle(100, max_bytes=10, sizer=lambda e: 1)
+    shuffled = shuffled >> Collect()
+    assert shuffled != data
+    assert sorted(shuffled) == data
+
+    data = ['a', 'b', 'cccccccccc', 'd']
+    assert data >> Shuffle(1, max_bytes=100) >> Collect() == data
+    shuffled = data >> Shuffle(4, max_bytes=0) >> Collect()
+    assert shuffled == data
+
+    it = data >> Shuffle(100, StableRandom(0), max_bytes=3, sizer=len)
+    assert 'cccccccccc' in it >> Take(3) >> Collect()
+
+
+
+def test_Balance():
+    assert [] >> Balance(0) >> Collect() == []
+    data = [(i, 'a' if i % 10 else 'b') for i in range(2000)]
+    balanced = data >> Balance(1, rand=StableRandom(0)) >> Collect()
+    assert len(balanced) == len(data)
+    assert set(balanced).issubset(set(data))
+    counts = balanced >> CountValues(1)
+    assert 900 < counts['b'] < 1100
+    assert balanced == data >> Balance(1, rand=StableRandom(0)) >> Collect()
+
+    ratios = {'a': 1, 'b': 3}
+    counts = data >> Balance(1, ratios, rand=StableRandom(0)) >> CountValues(1)
+    assert 1350 < counts['b'] < 1650
+
+    counts = data >> Balance(1, {'b': 1}) >> CountValues(1)
+    assert counts == {'b': 200}
+
+    labels = data >> Balance(lambda e: e[0] % 3, buffersize=5) >> Get(0)
+    assert labels >> Map(lambda i: i % 3) >> Collect(set) == {0, 1, 2}
+
+    with pytest.raises(ValueError) as ex:
+        data >> Balance(1, buffersize=0) >> Consume()
+    assert str(ex.value).startswith('buffersize must be positive')
+
+
+def test_ShuffleExternal(tmpdir):
+    assert [] >> ShuffleExternal() >> Collect() == []
+    data = list(range(100))
+    shuffle = ShuffleExternal(4, StableRandom(0), tmpdir=str(tmpdir),
+                              blocksize=3)
+    shuffled = data >> shuffle >> Collect()
+    assert shuffled != data
+    assert sorted(shuffled) == data
+    assert tmpdir.listdir() == []
+    shuffled2 = data >> ShuffleExternal(4, StableRandom(0)) >> Collect()
+    assert shuffled2 == shuffled
+    assert data >> ShuffleExternal(1) >> Sort() == data
+
+    # first element is uniformly distributed, unlike for Shuffle
+    firsts = [Range(10) >> ShuffleExternal(2) >> Head(1) for _ in range(500)]
+    counts = firsts >> Flatten() >> CountValues()
+    assert len(counts) == 10
+    assert max(counts.values()) < 100
+
+
+def test_ShuffleExternal_cache():
+    with Cache() as cache:
+        for _ in range(2):
+            shuffled = Range(20) >> cache >> ShuffleExternal(
+                3, cache=cache) >> Collect()
+            assert sorted(shuffled) == list(range(20))
+            assert len(os.listdir(cache.path)) == 20
+        assert cache >> Collect() == list(range(20))
+    assert cache.path is None
+
+
+def test_ShuffleExternal_cache_clear(tmpdir):
+    cache = Cache()
+    data = Range(100) >> cache >> Collect()
+    it = data >> ShuffleExternal(2, cache=cache, tmpdir=str(tmpdir))
+    next(it)
+    assert len(tmpdir.listdir()) == 1
+    cache.clear()
+    assert tmpdir.listdir() == []
+    assert cache.path is None
+    it.close()
+
 
 def test_MapCol():
     neg = lambda x: -x
@@ -398,12 +1048,41 @@ def test_MapMulti():
     assert greater2 >> Collect() == [False, False, True]
 
 
+def test_MapMulti_max_bytes():
+    sizer = lambda e: 1
+    nums, twos = [1, 2, 3] >> MapMulti(_, _ * 2, max_bytes=100, sizer=sizer)
+    assert nums >> Collect() == [1, 2, 3]
+    assert twos >> Collect() == [2, 4, 6]
+
+    nums, twos = range(10) >> MapMulti(_, _ * 2, max_bytes=5, sizer=sizer)
+    with pytest.raises(BufferError) as ex:
+        nums >> Collect()
+    assert str(ex.value) == 'Buffered elements exceed max_bytes: 6 > 5'
+
+
 def test_MapPar():
     assert [-1, -2, -3] >> MapPar(abs) >> Collect() == [1, 2, 3]
     data = list(range(1000))
     assert data >> MapPar(_) >> MapPar(_) >> Collect() == data
 
 
+def test_MapPar_autotune():
+    mappar = MapPar(abs, AUTOTUNE, max_chunksize=16)
+    data = list(range(-500, 0))
+    assert data >> mappar >> Collect() == [abs(x) for x in data]
+    assert 1 <= mappar.chunksize <= 16
+    assert mappar.stats.capacity == mappar.chunksize
+
+    mappar = MapPar(abs, 2, max_chunksize=8)
+    mappar._tune(2, 1.0)
+    assert mappar.chunksize == 4
+    mappar._tune(4, 1.0)
+    assert mappar.chunksize == 8
+    mappar._tune(8, 4.0)
+    assert mappar.chunksize == 4
+    assert not mappar.autotune
+
+
 def test_Prefetch():
     data = [1, 2, 3, 4]
     it = iter(data)
@@ -418,6 +1097,51 @@ def test_Prefetch():
     assert it >> Prefetch() >> Prefetch(2) >> Collect() == data
 
 
+def test_Prefetch_autotune():
+    def bursty():
+        for i in range(60):
+            if i % 10 == 0:
+                time.sleep(0.05)
+            yield i
+
+    @nut_function
+    def Slow(x):
+        time.sleep(0.004)
+        return x
+
+    it = bursty() >> Prefetch(AUTOTUNE, max_prefetch=8)
+    assert it >> Slow() >> Collect() == list(range(60))
+    assert 1 < it.num_prefetch <= 8
+    assert it.stats.capacity == it.num_prefetch
+    assert it.queue.maxsize == it.num_prefetch
+
+    it = range(10) >> Prefetch(2)
+    assert it >> Collect() == list(range(10))
+    assert it.num_prefetch == 2
+
+    it = range(10) >> Prefetch(-1)  # unbounded as in previous versions
+    assert it >> Collect() == list(range(10))
+    assert not it.autotune and it.queue.maxsize == -1
+
+
+def test_Prefetch_max_bytes():
+    data = ['a', 'bb', 'ccc', 'dddddddddd', 'e']
+    it = data >> Prefetch(10, max_bytes=3, sizer=len)
+    time.sleep(0.05)
+    assert it.nbytes <= 3
+    assert it >> Collect() == data
+    assert it.nbytes == 0
+
+    @nut_function
+    def Slow(x):
+        time.sleep(0.01)
+        return x
+
+    it = range(10) >> Prefetch(10, max_bytes=2, sizer=lambda e: 1)
+    assert it >> Slow() >> Collect() == list(range(10))
+    assert it.stats.peak <= 2
+
+
 def test_Cache():
     data = [(3, 'a'), (1, 'b'), (2, 'c')]
     with Cache() as cache:
@@ -0,0 +1,211 @@
+"""
+.. module:: test_profiler
+   :synopsis: Unit tests for profiler module
+"""
+
+import os
+import time
+import json
+import pytest
+
+from nutsflow import (Range, Map, Filter, Collect, Consume, Tee, Take,
+                      Prefetch, MapPar, nut_function)
+from nutsflow.profiler import (Profile, StageStats, Trace, active_tracer,
+                               BufferStats, buffer_stats, bottleneck)
+
+
+@nut_function
+def Slow(x, duration):
+    time.sleep(duration)
+    return x
+
+
+def test_Profile():
+    prof = Profile()
+    result = (Range(5) >> prof(Map(lambda x: x + 1), 'inc') >>
+              prof(Filter(lambda x: x % 2), 'odd') >> prof(Collect()))
+    assert result == [1, 3, 5]
+    stats = prof.stats()
+    assert [s.name for s in stats] == ['inc', 'odd', 'Collect']
+    assert [(s.n_in, s.n_out) for s in stats] == [(5, 5), (5, 3), (3, 0)]
+    assert all(isinstance(s, StageStats) for s in stats)
+
+    Range(5) >> prof(Map(lambda x: x + 1), 'inc') >> Consume()
+    assert prof.stats()[0].n_in == 10
+
+    prof.clear()
+    assert prof.stats() == []
+
+
+def test_Profile_exclusive_time():
+    prof = Profile()
+    Range(3) >> prof(Slow(0.05), 'slow') >> prof(Slow(0.0), 'fast') >> Consume()
+    slow, fast = prof.stats()
+    assert slow.time >= 0.14
+    assert fast.time < 0.05
+    assert fast.rate > slow.rate
+
+
+def test_Profile_sample():
+    prof = Profile(sample=2)
+    Range(10) >> prof(Slow(0.01)) >> Consume()
+    stats = prof.stats()[0]
+    assert stats.n_out == 10
+    assert stats.time >= 0.08
+
+    with pytest.raises(ValueError) as ex:
+        Profile(sample=0)
+    assert str(ex.value).startswith('sample must be >= 1')
+
+
+def test_Profile_source():
+    prof = Profile()
+    assert prof(Range(3), 'source') >> Collect() == [0, 1, 2]
+    assert prof.stats()[0].n_out == 3
+
+
+def test_Profile_source_chained():
+    prof = Profile()
+    result = (prof(Range(20), 'source') >> prof(Map(lambda x: x + 1), 'inc')
+              >> prof(Collect()))
+    assert result == list(range(1, 21))
+    source, inc, collect = prof.stats()
+    assert (source.n_out, inc.n_in, inc.n_out) == (20, 20, 20)
+    assert collect.n_in == 20
+    assert prof._stages['inc'].upstream is prof._stages['source']
+
+
+def test_Profile_multiple_outputs():
+    prof = Profile()
+    it1, it2 = [1, 2] >> prof(Tee(2))
+    assert it1 >> Collect() == [1, 2]
+    assert prof.stats()[0].n_in == 2
+
+
+def test_Profile_disabled():
+    prof = Profile(enabled=False)
+    nut = Take(2)
+    assert prof(nut) is nut
+    assert prof.stats() == []
+
+
+def test_Profile_str():
+    with Profile() as prof:
+        Range(3) >> prof(Map(lambda x: x), 'ident') >> prof(Consume())
+    lines = str(prof).split('\n')
+    assert lines[0].split() == ['stage', 'time[s]', 'in', 'out', 'items/s']
+    assert lines[1].split()[0] == 'ident'
+    assert lines[2].split()[0] == 'consume'
+    assert lines[3].split()[0] == 'total'
+    assert prof.walltime >= 0
+
+
+def test_Trace(tmpdir):
+    filepath = str(tmpdir.join('trace.json'))
+    with Trace(filepath) as trace:
+        assert active_tracer() is trace
+        result = (Range(3) >> trace(Map(lambda x: x * 2), 'double') >>
+                  trace(Collect()))
+    assert active_tracer() is None
+    assert result == [0, 2, 4]
+    names = [e['name'] for e in trace.events]
+    assert names == ['double', 'double', 'double', 'Collect']
+    assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in trace.events)
+
+    with open(filepath) as f:
+        data = json.load(f)
+    events = data['traceEvents']
+    assert events[0]['ph'] == 'M'
+    assert events[0]['args']['name'] == 'MainThread'
+    assert [e['name'] for e in events[1:]] == names
+
+
+def test_Trace_source_chained():
+    with Trace() as trace:
+        result = (trace(Range(2), 'source') >> trace(Map(abs), 'abs') >>
+                  trace(Collect()))
+    assert result == [0, 1]
+    names = [e['name'] for e in trace.events]
+    assert names == ['source', 'abs', 'source', 'abs', 'Collect']
+
+
+def test_Trace_Prefetch():
+    with Trace() as trace:
+        assert Range(3) >> Prefetch(2) >> Collect() == [0, 1, 2]
+    names = set(e['name'] for e in trace.events)
+    assert names == {'Prefetch.fetch', 'Prefetch.put', 'Prefetch.get'}
+    gets = [e for e in trace.events if e['name'] == 'Prefetch.get']
+    assert len(gets) == 4
+    assert 'qsize' in gets[0]['args']
+
+
+def test_Trace_MapPar():
+    with Trace() as trace:
+        assert [-1, -2, -3] >> MapPar(abs, 3) >> Collect() == [1, 2, 3]
+    calls = [e for e in trace.events if e['name'] == 'MapPar.func']
+    maps = [e for e in trace.events if e['name'] == 'MapPar.map']
+    assert len(calls) == 3
+    assert calls[0]['pid'] != os.getpid()
+    assert maps[0]['args']['n'] == 3
+
+
+def test_Trace_inactive():
+    assert active_tracer() is None
+    assert [1, 2] >> Prefetch() >> Collect() == [1, 2]
+
+
+def test_BufferStats():
+    stats = BufferStats('Test', 3)
+    assert stats.name.startswith('Test-')
+    stats.put(1, 0.5)
+    stats.put(2)
+    stats.get(2, 0.25)
+    stats.get(1)
+    snapshot = stats.snapshot()
+    assert snapshot['name'] == stats.name
+    assert snapshot['capacity'] == 3
+    assert snapshot['n_put'] == 2
+    assert snapshot['n_get'] == 2
+    assert snapshot['avg_depth'] == 1.5
+    assert snapshot['peak_depth'] == 2
+    assert snapshot['producer_blocked'] == 0.5
+    assert snapshot['consumer_wait'] == 0.25
+    assert stats.name in [s['name'] for s in buffer_stats()]
+
+
+def test_BufferStats_Prefetch():
+    it = Range(10) >> Slow(0.01) >> Prefetch(2)
+    assert it >> Collect() == list(range(10))
+    snapshot = it.stats.snapshot()
+    assert snapshot['n_put'] == 10
+    assert snapshot['n_get'] == 10
+    assert snapshot['peak_depth'] <= 2
+    assert snapshot['consumer_wait'] > 0.05
+    assert bottleneck([snapshot]).startswith('bottleneck is upstream of')
+
+    it = Range(5) >> Prefetch(2)
+    assert it >> Slow(0.02) >> Collect() == list(range(5))
+    snapshot = it.stats.snapshot()
+    assert snapshot['producer_blocked'] > 0.02
+    assert bottleneck([snapshot]).startswith('bottleneck is downstream of')
+
+
+def test_BufferStats_MapPar():
+    mappar = MapPar(abs, 2)
+    assert [-1, -2, -3] >> mappar >> Collect() == [1, 2, 3]
+    snapshot = mappar.stats.snapshot()
+    assert snapshot['n_put'] == 3
+    assert snapshot['n_get'] == 3
+    assert snapshot['peak_depth'] == 2
+    assert snapshot['consumer_wait'] > 0
+
+
+def test_bottleneck():
+    assert bottleneck([]) == 'no buffering nuts'
+    snapshot = {'name': 'Prefetch-1', 'producer_blocked': 0.0,
+                'consumer_wait': 0.0, 'avg_depth': 0.0}
+    assert bottleneck([snapshot]) == 'no bottleneck detected'
+    snapshot['producer_blocked'] = 1.0
+    expected = ('bottleneck is downstream of Prefetch-1 (consumers waited '
+                '0.00s, producers blocked 1.00s, average depth 0.0)')
+    assert bottleneck([snapshot]) == expected
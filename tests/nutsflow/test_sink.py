@@ -4,7 +4,9 @@
 """
 
 import os
+import gc
 import pytest
+import numpy as np
 
 from six.moves import range
 from nutsflow import *
@@ -22,6 +24,45 @@ def test_Sort():
     assert ['a3', 'c1', 'b2'] >> Sort(key=1) == ['c1', 'b2', 'a3']
 
 
+def test_SortExternal(tmpdir):
+    assert [] >> SortExternal() >> Collect() == []
+    assert [3, 1, 2] >> SortExternal() >> Collect() == [1, 2, 3]
+
+    data = [(i * 7) % 23 for i in range(23)]
+    for runsize in [1, 2, 5, 100]:
+        sort = SortExternal(runsize=runsize, tmpdir=str(tmpdir))
+        assert data >> sort >> Collect() == sorted(data)
+        sort = SortExternal(reverse=True, runsize=runsize)
+        assert data >> sort >> Collect() == sorted(data, reverse=True)
+    assert tmpdir.listdir() == []
+
+    data = [(i % 3, i) for i in range(10)]
+    expected = sorted(data, key=lambda t: t[0])
+    assert data >> SortExternal(0, runsize=3) >> Collect() == expected
+    expected = sorted(data, key=lambda t: t[0], reverse=True)
+    assert data >> SortExternal(0, True, runsize=3) >> Collect() == expected
+    expected = sorted(data, key=lambda t: -t[1])
+    sort = SortExternal(key=lambda t: -t[1], runsize=4)
+    assert data >> sort >> Collect() == expected
+
+    data = list(range(100, 0, -1))
+    sort = SortExternal(runsize=10, workers=2, tmpdir=str(tmpdir))
+    assert data >> sort >> Collect() == sorted(data)
+    assert tmpdir.listdir() == []
+
+    it = data >> SortExternal(runsize=10, tmpdir=str(tmpdir))
+    assert next(it) == 1
+    assert len(tmpdir.listdir()) == 1
+    it.close()
+    assert tmpdir.listdir() == []
+
+    it = data >> SortExternal(runsize=10, tmpdir=str(tmpdir))
+    assert len(tmpdir.listdir()) == 1
+    del it
+    gc.collect()
+    assert tmpdir.listdir() == []
+
+
 def test_Sum():
     assert [] >> Sum() == 0
 
@@ -58,6 +99,25 @@ def test_MeanStd():
     assert data >> MeanStd(key=1) == pytest.approx([20.0, 10.0], rel=1e-2)
 
 
+def test_Quantiles():
+    assert [] >> Quantiles(0.5) is None
+    assert [] >> Quantiles([0.1, 0.9], default=0) == [0, 0]
+    assert [1] >> Quantiles(0.5) == 1
+    assert [4, 1, 3, 2] >> Quantiles(0.5) == 2
+    assert [4, 1, 3, 2] >> Quantiles((0.0, 1.0)) == [1, 4]
+    assert [4, 1, 3, 2] >> Quantiles(0.5, exact=True) == 2
+    data = [(1, 'c'), (2, 'a'), (3, 'b')]
+    assert data >> Quantiles(1.0, key=1) == 'c'
+
+    data = list(range(10000, 0, -1))
+    assert data >> Quantiles(0.5, exact=True) == 5000
+    median = data >> Quantiles(0.5, accuracy=0.01)
+    assert abs(median - 5000) < 200
+    sketch = data >> Quantiles(0.5, accuracy=0.05, retsketch=True)
+    assert sketch.k == 40
+    assert sketch.size < 200
+
+
 def test_Max():
     assert [] >> Max(default=0) == 0
     assert [0, 3, 2] >> Max() == 3
@@ -106,6 +166,83 @@ def test_ArgMin():
     assert data >> ArgMin(key=1) == 0
 
 
+def test_TopK():
+    assert [] >> TopK(2) == []
+    assert [1, 2] >> TopK(0) == []
+    assert [1, 2] >> TopK(5) == [2, 1]
+    assert [3, 1, 4, 1, 5, 9, 2, 6] >> TopK(3) == [9, 6, 5]
+    data = [(1, 'a'), (2, 'b'), (2, 'c'), (0, 'd')]
+    assert data >> TopK(2, 0) == [(2, 'b'), (2, 'c')]
+    assert data >> TopK(1, key=lambda t: -t[0]) == [(0, 'd')]
+
+
+def test_TopK_batches():
+    batches = [np.array([3, 1, 4, 1]), np.array([5, 9]), np.array([2, 6])]
+    topk = batches >> TopK(3, batches=True)
+    assert [int(e) for e in topk] == [9, 6, 5]
+    batches = [np.array([[1, 5], [2, 3]]), np.array([[3, 9], [4, 0]])]
+    topk = batches >> TopK(2, key=1, batches=True)
+    assert [r.tolist() for r in topk] == [[3, 9], [1, 5]]
+    topk = batches >> TopK(1, key=lambda b: b.sum(axis=1), batches=True)
+    assert [r.tolist() for r in topk] == [[3, 9]]
+
+
+def test_BottomK():
+    assert [] >> BottomK(2) == []
+    assert [3, 1, 4, 1, 5, 9, 2, 6] >> BottomK(3) == [1, 1, 2]
+    data = [(1, 'a'), (0, 'b'), (0, 'c'), (2, 'd')]
+    assert data >> BottomK(2, 0) == [(0, 'b'), (0, 'c')]
+
+
+def test_BottomK_batches():
+    batches = [np.array([3, 1, 4, 1]), np.array([5, 0]), np.array([2, 6])]
+    bottomk = batches >> BottomK(3, batches=True)
+    assert [int(e) for e in bottomk] == [0, 1, 1]
+
+
+def test_Sample():
+    from nutsflow.common import StableRandom
+    assert [] >> Sample(2) == []
+    assert [1, 2] >> Sample(0) == []
+    assert sorted([1, 2] >> Sample(3)) == [1, 2]
+    assert sorted(Range(5) >> Sample(5)) == [0, 1, 2, 3, 4]
+
+    samples = Range(1000) >> Sample(10, rand=StableRandom(0))
+    assert len(set(samples)) == 10
+    assert set(samples).issubset(set(range(1000)))
+    assert samples == Range(1000) >> Sample(10, rand=StableRandom(0))
+
+    counts = [0] * 10
+    for seed in range(2000):
+        for e in Range(10) >> Sample(2, rand=StableRandom(seed)):
+            counts[e] += 1
+    assert min(counts) > 300 and max(counts) < 500
+
+    # order of samples is random, even if no element is replaced
+    for n in [5, 3]:
+        firsts = {(Range(n) >> Sample(5, rand=StableRandom(seed)))[0]
+                  for seed in range(100)}
+        assert firsts == set(range(n))
+
+    with pytest.raises(ValueError) as ex:
+        [1, 2] >> Sample(-1)
+    assert str(ex.value).startswith('k must not be negative')
+
+
+def test_Sample_weighted():
+    from nutsflow.common import StableRandom
+    data = [('a', 1), ('b', 0), ('c', 3)]
+    assert sorted(data >> Sample(5, weight=1)) == [('a', 1), ('c', 3)]
+    assert len(data >> Sample(2, weight=1)) == 2
+
+    counts = {'a': 0, 'c': 0}
+    for seed in range(2000):
+        samples = data >> Sample(1, weight=lambda e: e[1],
+                                 rand=StableRandom(seed))
+        counts[samples[0][0]] += 1
+    assert 400 < counts['a'] < 600
+
+
 def test_Reduce():
     assert [] >> Reduce(lambda a, b: a + b, None) == None
     assert [0, 1, 2] >> Reduce(lambda a, b: a + b) == 3
@@ -158,6 +295,28 @@ def test_CountValues():
     assert data >> CountValues(column=1) == {'Y': 2, 'X': 1}
 
 
+def test_CountDistinct():
+    assert [] >> CountDistinct() == 0
+    assert 'abaacc' >> CountDistinct() == 3
+    data = [('a', 1), ('b', 2), ('a', 2)]
+    assert data >> CountDistinct(0) == 2
+    assert abs((range(50000) >> CountDistinct()) - 50000) < 1500
+    sketch = range(50000) >> CountDistinct(error=0.1, retsketch=True)
+    assert sketch.p == 7
+
+
+def test_TopValues():
+    assert [] >> TopValues(2) == {}
+    assert 'abaacc' >> TopValues(2) == {'a': 3, 'c': 2}
+    assert 'abaacc' >> TopValues(2, relative=True) == {'a': 1.0, 'c': 2 / 3.0}
+    data = [('a', 1), ('b', 2), ('a', 2)]
+    assert data >> TopValues(1, 0) == {'a': 2}
+    data = ['x' if i % 3 else i for i in range(1000)]
+    assert data >> TopValues(1, capacity=20) == {'x': 666}
+    sketch = data >> TopValues(1, capacity=20, retsketch=True)
+    assert sketch.capacity == 20
+
+
 def test_Collect():
     assert [] >> Collect() == []
     assert range(5) >> Collect() == [0, 1, 2, 3, 4]
@@ -0,0 +1,140 @@
+"""
+.. module:: test_sketch
+   :synopsis: Unit tests for sketch module
+"""
+
+import pytest
+import pickle
+
+import random as rnd
+
+from nutsflow.sketch import (KLLSketch, HyperLogLog, SpaceSaving,
+                             BloomFilter, stable_hash)
+
+
+def test_stable_hash():
+    assert stable_hash('abc') == stable_hash('abc')
+    assert stable_hash('abc') != stable_hash('abd')
+    assert stable_hash((1, 'a')) == stable_hash((1, 'a'))
+    assert 0 <= stable_hash(1.5) < 2 ** 64
+
+
+def test_KLLSketch():
+    sketch = KLLSketch()
+    assert sketch.quantiles([0.5]) is None
+    sketch.update([3, 1, 2])
+    assert sketch.exact
+    assert sketch.quantiles([0.0, 0.5, 1.0]) == [1, 2, 3]
+
+
+def test_KLLSketch_accuracy():
+    values = list(range(100000))
+    rnd.Random(0).shuffle(values)
+    sketch = KLLSketch(200, rand=rnd.Random(1)).update(values)
+    assert not sketch.exact
+    assert sketch.n == len(values)
+    assert sketch.size < 1000
+    assert sum(w for _, w in sketch.items()) == len(values)
+    for q, v in zip([0.1, 0.5, 0.9], sketch.quantiles([0.1, 0.5, 0.9])):
+        assert abs(v / len(values) - q) < 0.02
+
+
+def test_KLLSketch_merge():
+    rand = rnd.Random(0)
+    values = [rand.random() for _ in range(20000)]
+    sketches = [KLLSketch(100, rand=rnd.Random(i)).update(values[i::4])
+                for i in range(4)]
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+    assert merged.n == len(values)
+    assert merged.size < merged.maxsize
+    median = sorted(values)[len(values) // 2]
+    assert abs(merged.quantiles([0.5])[0] - median) < 0.04
+    empty = KLLSketch().merge(KLLSketch().update([1, 2]))
+    assert empty.quantiles([1.0]) == [2]
+
+
+def test_HyperLogLog():
+    assert HyperLogLog().count() == 0
+    assert HyperLogLog(0.01).p == 14
+    assert HyperLogLog(1.0).p == 4
+    assert HyperLogLog(0.0001).p == 18
+    hll = HyperLogLog(0.01).update(range(100000))
+    assert abs(hll.count() - 100000) < 3000
+    assert len(hll.registers) == 2 ** 14
+
+
+def test_HyperLogLog_merge():
+    a = HyperLogLog().update(range(0, 6000))
+    b = HyperLogLog().update(range(4000, 10000))
+    b = pickle.loads(pickle.dumps(b))
+    assert abs(a.merge(b).count() - 10000) < 300
+    with pytest.raises(ValueError) as ex:
+        a.merge(HyperLogLog(0.1))
+    assert str(ex.value).startswith('Cannot merge sketches')
+
+
+def test_SpaceSaving():
+    ss = SpaceSaving(3)
+    assert ss.top() == []
+    ss.update('aaaabbbcd')
+    assert ss.top(2) == [('a', 4), ('b', 3)]
+    assert len(ss.counts) == 3
+    assert ss.n == 9
+
+    rand = rnd.Random(0)
+    values = [int(rand.paretovariate(1.0)) for _ in range(20000)]
+    ss = SpaceSaving(50).update(values)
+    assert len(ss.counts) <= 50
+    assert len(ss._heap) <= 4 * 50
+    exact = sorted(set(values), key=values.count, reverse=True)[:3]
+    assert [v for v, _ in ss.top(3)] == exact
+    for v, c in ss.top(3):
+        assert c - ss.errors[v] <= values.count(v) <= c
+
+
+def test_SpaceSaving_merge():
+    a = SpaceSaving(2).update('aaab')
+    b = SpaceSaving(2).update('bbcc')
+    a.merge(b)
+    assert a.n == 8
+    assert len(a.counts) == 2
+    assert a.top() == [('a', 5), ('b', 3)]
+
+    # disjoint heavy hitters: counts remain overestimates within error
+    values1 = list('zzw' + 'x' * 20 + 'y' * 15 + 'abcdefgh')
+    values2 = list('xxy' + 'z' * 20 + 'w' * 15 + 'ijklmnop')
+    values = values1 + values2
+    a = SpaceSaving(4).update(values1)
+    b = SpaceSaving(4).update(values2)
+    a.merge(b)
+    assert len(a.counts) == 4
+    assert sorted(v for v, _ in a.top()) == ['w', 'x', 'y', 'z']
+    for v, c in a.top():
+        assert c - a.errors[v] <= values.count(v) <= c
+
+
+def test_BloomFilter():
+    bf = BloomFilter(1000, 0.01)
+    assert bf.m == 9586
+    assert bf.k == 7
+    assert len(bf.bits) == 1199
+    assert all(bf.add(i) for i in range(10))
+    assert not any(bf.add(i) for i in range(10))
+    assert all(i in bf for i in range(10))
+    for i in range(10, 1000):
+        bf.add(i)
+    fps = sum(i in bf for i in range(1000, 11000))
+    assert fps < 200
+
+
+def test_BloomFilter_merge():
+    a, b = BloomFilter(100, 0.01), BloomFilter(100, 0.01)
+    a.add('a')
+    b.add('b')
+    a.merge(b)
+    assert 'a' in a and 'b' in a
+    with pytest.raises(ValueError) as ex:
+        a.merge(BloomFilter(10, 0.01))
+    assert str(ex.value).startswith('Cannot merge filters')